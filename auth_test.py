@@ -67,10 +67,10 @@ def test_backend_connectivity():
     print("="*60)
     
     try:
-        # Try to access the base URL
-        response = requests.get(BASE_URL.replace('/api', ''), timeout=10)
-        if response.status_code in [200, 404]:  # 404 is OK, means server is responding
-            log_test("Backend Connectivity", True, f"Backend is accessible (Status: {response.status_code})")
+        # Liveness probe, answered by the backend itself
+        response = requests.get(BASE_URL.replace('/api', '') + '/healthz', timeout=10)
+        if response.status_code == 200 and response.json().get("status") == "ok":
+            log_test("Backend Connectivity", True, f"Backend is alive (Status: {response.status_code})")
             return True
         else:
             log_test("Backend Connectivity", False, f"Unexpected status code: {response.status_code}")
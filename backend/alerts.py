@@ -0,0 +1,228 @@
+"""
+Fan-out of alert events to Server-Sent Events streams.
+
+Events sent to Socket.IO clients are also published here, along with the
+position they happened at. Streams are indexed by the geo cell of their
+position, so an event only visits streams in cells within the largest
+alert radius of it and then checks each one's own radius.
+
+Memory per stream is kept small enough for tens of thousands of streams
+per worker:
+- an event is encoded once, and every matching stream queues the same bytes
+- each stream's buffer is short and bounded; a stream that falls behind
+  gets a resync event instead of a growing buffer
+- heartbeats come from one shared ticker, not a timer per stream
+- recent events live in one shared ring, which serves Last-Event-ID resume
+
+Like Socket.IO here, a worker only sees the events its own requests publish.
+"""
+
+import asyncio
+import secrets
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+from geo import CELL_SIZE_DEG, Cell, calculate_distance, cell_of, cells_covering
+from metrics import sse_connections, sse_events, sse_resyncs
+
+RESYNC = b"event: resync\ndata: {}\n\n"
+KEEPALIVE = b": keepalive\n\n"
+
+
+class Subscriber:
+    # A plain list and a future made only while waiting: a deque and an
+    # asyncio.Event per stream would more than double its footprint
+    __slots__ = ("user_id", "latitude", "longitude", "radius_km", "cell", "pending", "waiter")
+
+    def __init__(self, user_id: str, latitude: float, longitude: float, radius_km: float, cell: Cell):
+        self.user_id = user_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.cell = cell
+        self.pending: List[bytes] = []
+        self.waiter: Optional[asyncio.Future] = None
+
+
+class AlertBroker:
+    def __init__(
+        self,
+        max_radius_km: float,
+        buffer_size: int = 32,
+        history_size: int = 1024,
+        heartbeat: float = 15.0,
+        retry_ms: int = 3000,
+        cell_size_deg: float = CELL_SIZE_DEG,
+    ):
+        self.max_radius_km = max_radius_km
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.retry = f"retry: {retry_ms}\n\n".encode()
+        self.cell_size_deg = cell_size_deg
+        # Event ids from another process (or before a restart) can't be resumed
+        self.epoch = secrets.token_hex(4)
+        self._sequence = 0
+        self._history: Deque[Tuple[int, Optional[float], Optional[float], bytes]] = deque(maxlen=history_size)
+        self._by_cell: Dict[Cell, Set[Subscriber]] = {}
+        self._by_user: Dict[str, Set[Subscriber]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._by_user.values())
+
+    def subscribe(
+        self, user_id: str, latitude: float, longitude: float, radius_km: float, last_event_id: Optional[str] = None
+    ) -> Tuple[Subscriber, List[bytes]]:
+        """Register a stream, with the events it missed since last_event_id (or a resync if they're gone)"""
+        subscriber = Subscriber(user_id, latitude, longitude, radius_km, cell_of(latitude, longitude, self.cell_size_deg))
+        self._by_cell.setdefault(subscriber.cell, set()).add(subscriber)
+        self._by_user.setdefault(user_id, set()).add(subscriber)
+        sse_connections.inc()
+        return subscriber, self._missed(subscriber, last_event_id)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._discard(self._by_cell, subscriber.cell, subscriber)
+        self._discard(self._by_user, subscriber.user_id, subscriber)
+        sse_connections.dec()
+
+    def connected(self, user_id: str) -> bool:
+        """Whether the user has an open stream on this worker"""
+        return user_id in self._by_user
+
+    def move(self, user_id: str, latitude: float, longitude: float):
+        """Follow a user's reported position on all their streams"""
+        for subscriber in self._by_user.get(user_id, ()):
+            self._discard(self._by_cell, subscriber.cell, subscriber)
+            subscriber.latitude, subscriber.longitude = latitude, longitude
+            subscriber.cell = cell_of(latitude, longitude, self.cell_size_deg)
+            self._by_cell.setdefault(subscriber.cell, set()).add(subscriber)
+
+    def publish(
+        self,
+        event: str,
+        data: dict,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        recipients: Optional[Set[str]] = None,
+    ) -> int:
+        """Queue an event for every stream whose radius covers its position (all streams without one),
+        and for every stream of the given users"""
+        self._sequence += 1
+        frame = b"id: %s-%d\nevent: %s\ndata: %s\n\n" % (
+            self.epoch.encode(), self._sequence, event.encode(), orjson.dumps(data)
+        )
+        self._history.append((self._sequence, latitude, longitude, frame))
+        # A stream's own position can be newer or older than the one the
+        # recipients were found from, so it gets the event if either covers it
+        matched = [
+            subscriber for subscriber in self._candidates(latitude, longitude)
+            if self._covers(subscriber, latitude, longitude)
+        ]
+        if recipients:
+            seen = set(matched)
+            matched.extend(
+                subscriber
+                for user_id in recipients
+                for subscriber in self._by_user.get(user_id, ())
+                if subscriber not in seen
+            )
+        for subscriber in matched:
+            self._queue(subscriber, frame)
+        delivered = len(matched)
+        sse_events.inc(event, amount=delivered)
+        return delivered
+
+    async def stream(
+        self, user_id: str, latitude: float, longitude: float, radius_km: float, last_event_id: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """Frames of a new stream. It subscribes on the first frame, not before: a client gone before
+        the response started leaves no subscriber behind to keep it online"""
+        subscriber, backlog = self.subscribe(user_id, latitude, longitude, radius_km, last_event_id)
+        try:
+            yield self.retry
+            for frame in backlog:
+                yield frame
+            while True:
+                while not subscriber.pending:
+                    subscriber.waiter = asyncio.get_running_loop().create_future()
+                    try:
+                        await subscriber.waiter
+                    finally:
+                        subscriber.waiter = None
+                yield subscriber.pending.pop(0)
+        finally:
+            self.unsubscribe(subscriber)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Keeps idle streams from being closed by proxies and lets dead ones be noticed
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscribers in self._by_user.values():
+                for subscriber in subscribers:
+                    if not subscriber.pending:
+                        self._queue(subscriber, KEEPALIVE)
+
+    def _missed(self, subscriber: Subscriber, last_event_id: Optional[str]) -> List[bytes]:
+        if not last_event_id:
+            return []
+        epoch, _, sequence = last_event_id.partition("-")
+        oldest = self._history[0][0] if self._history else self._sequence + 1
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) < oldest - 1:
+            sse_resyncs.inc("resume")
+            return [RESYNC]
+        return [
+            frame for number, latitude, longitude, frame in self._history
+            if number > int(sequence) and self._covers(subscriber, latitude, longitude)
+        ]
+
+    def _candidates(self, latitude, longitude):
+        if latitude is None or longitude is None:
+            return [subscriber for subscribers in self._by_user.values() for subscriber in subscribers]
+        return [
+            subscriber
+            for cell in cells_covering(latitude, longitude, self.max_radius_km, self.cell_size_deg)
+            for subscriber in self._by_cell.get(cell, ())
+        ]
+
+    def _covers(self, subscriber, latitude, longitude) -> bool:
+        if latitude is None or longitude is None:
+            return True
+        return calculate_distance(subscriber.latitude, subscriber.longitude, latitude, longitude) <= subscriber.radius_km
+
+    def _queue(self, subscriber: Subscriber, frame: bytes):
+        if len(subscriber.pending) >= self.buffer_size:
+            # Too far behind to catch up event by event: drop the backlog, resync once
+            subscriber.pending.clear()
+            subscriber.pending.append(RESYNC)
+            sse_resyncs.inc("overflow")
+        else:
+            subscriber.pending.append(frame)
+        if subscriber.waiter is not None and not subscriber.waiter.done():
+            subscriber.waiter.set_result(None)
+
+    @staticmethod
+    def _discard(index, key, subscriber):
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del index[key]
@@ -0,0 +1,85 @@
+"""
+Hot/cold split of emergencies.
+
+The live emergencies collection should hold current incidents only, so it
+and its indexes stay small enough to be cached. A background job moves
+resolved emergencies to the archive in batches. It waits until no delta
+read can still need them: those report an emergency's resolution by
+finding it, inactive, among the changes since their token, and a token is
+only honoured for DELTA_MAX_AGE. A move copies a batch to the archive and
+then deletes it from the live collection; a copy interrupted before its
+delete is repeated harmlessly on the next run.
+
+History pages are ordered newest first by (created_at, id), and the
+cursor of the next page is the position of the last item of this one.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+
+from delta import EPOCH
+
+logger = logging.getLogger(__name__)
+
+HistoryCursor = Tuple[datetime, str]
+
+
+def encode_history_cursor(emergency) -> str:
+    micros = (emergency["created_at"] - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{emergency['id']}"
+
+
+def decode_history_cursor(value: str) -> Optional[HistoryCursor]:
+    """The position, or None if the cursor is malformed"""
+    micros, _, emergency_id = value.partition("_")
+    try:
+        return EPOCH + timedelta(microseconds=int(micros)), emergency_id
+    except (ValueError, OverflowError):
+        return None
+
+
+class EmergencyArchiver:
+    def __init__(self, archive_after: timedelta, interval: float = 60.0, batch_size: int = 500):
+        self.archive_after = archive_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, archive_resolved, now: datetime) -> int:
+        """Move every emergency resolved before the cutoff, a batch at a time; the number moved"""
+        moved = 0
+        while True:
+            batch = await archive_resolved(now - self.archive_after, self.batch_size)
+            moved += batch
+            if batch < self.batch_size:
+                return moved
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, archive_resolved, clock: Callable[[], datetime]):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run(archive_resolved, clock))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, archive_resolved, clock):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                moved = await self.run_once(archive_resolved, clock())
+                if moved:
+                    logger.info("Archived %d resolved emergencies", moved)
+            except Exception:
+                # A failed move is retried next tick, the job must keep running
+                logger.exception("Emergency archiving failed")
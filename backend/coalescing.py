@@ -0,0 +1,43 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+The first caller for a key starts the fetch as a task; callers arriving
+while it runs await the same task instead of issuing their own. The task
+is shielded, so a caller that disconnects doesn't cancel the fetch for
+the others, and the key is forgotten as soon as the fetch finishes: this
+only merges overlapping requests, it never serves stale results.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from metrics import singleflight_calls
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            singleflight_calls.inc(self.name, "leader")
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            singleflight_calls.inc(self.name, "follower")
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,236 @@
+"""
+Negotiated response compression (zstd, brotli, gzip).
+
+Pure ASGI middleware: it picks the best encoding the client accepts, skips
+bodies under a size threshold, and compresses streamed responses (NDJSON)
+chunk by chunk with a flush after each one so clients still get items as
+soon as they are produced. brotli and zstandard are optional; without them
+only gzip is offered.
+"""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = _ZstdEncoder
+
+# Server preference when the client accepts several encodings equally
+PREFERENCE = ("zstd", "br", "gzip")
+
+# Tuned with benchmarks/bench_compression.py on chat payloads: past these
+# levels CPU time grows much faster than the bytes saved
+DEFAULT_LEVELS = {"gzip": 4, "br": 4, "zstd": 1}
+
+# Streamed bodies are compressed on the fly, favour speed over ratio
+STREAMING_LEVELS = {"gzip": 1, "br": 1, "zstd": 1}
+
+# Media types that are already compressed or must not be buffered
+SKIP_MEDIA_TYPES = ("image/", "video/", "audio/", "text/event-stream", "application/zip")
+
+
+def encode(encoding: str, data: bytes, level: Optional[int] = None) -> bytes:
+    """Compress a whole body in one go"""
+    encoder = ENCODERS[encoding](DEFAULT_LEVELS[encoding] if level is None else level)
+    return encoder.compress(data) + encoder.finish()
+
+
+def negotiate(accept_encoding: str, available=None) -> Optional[str]:
+    """Best available encoding for an Accept-Encoding header, or None for identity"""
+    available = ENCODERS if available is None else available
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    candidates: List[Tuple[float, int, str]] = []
+    for rank, name in enumerate(PREFERENCE):
+        if name not in available:
+            continue
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > 0:
+            candidates.append((weight, -rank, name))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        levels: Optional[Dict[str, int]] = None,
+        route_levels: Optional[Dict[str, Dict[str, int]]] = None,
+        exclude_paths: Tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.route_levels = route_levels or {}
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, self._level(scope["path"], encoding), send)
+        await self.app(scope, receive, responder.send)
+
+    def _level(self, path: str, encoding: str) -> int:
+        route = self.route_levels.get(path)
+        if route and encoding in route:
+            return route[encoding]
+        return self.levels[encoding]
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, level: int, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.level = level
+        self._send = send
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or media_type.startswith(SKIP_MEDIA_TYPES)
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body:
+                # Whole body in one message: compress only if it pays off
+                if len(body) < self.middleware.minimum_size:
+                    await self._flush_start()
+                    await self._send(message)
+                    return
+                compressed = encode(self.encoding, body, self.level)
+                headers = MutableHeaders(raw=self.start_message["headers"])
+                self._set_encoding_headers(headers)
+                headers["Content-Length"] = str(len(compressed))
+                await self._flush_start()
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming response: compress each chunk and flush it out
+            level = min(self.level, STREAMING_LEVELS[self.encoding])
+            self.encoder = ENCODERS[self.encoding](level)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            self._set_encoding_headers(headers)
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self._flush_start()
+
+        if more_body:
+            chunk = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            chunk = self.encoder.compress(body) + self.encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _set_encoding_headers(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # A weak ETag stays valid across encodings, a strong one would not
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def _flush_start(self):
+        if self.start_message is not None:
+            await self._send(self.start_message)
+            self.start_message = None
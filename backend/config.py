@@ -0,0 +1,63 @@
+"""
+Runtime configuration, read from the environment by create_app().
+
+Nothing here opens connections or requires a database to be configured:
+MONGO_URL and DB_NAME are only checked when the Mongo store is opened.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+
+@dataclass(frozen=True)
+class Config:
+    # "mongo" or "memory" (tests, benchmarks and local runs)
+    storage_backend: str = "mongo"
+    mongo_url: Optional[str] = None
+    db_name: Optional[str] = None
+    # Connections the Mongo pool keeps open, and how many are opened before
+    # the app reports ready so the first requests don't pay for handshakes
+    mongo_min_pool_size: int = 10
+    mongo_max_pool_size: int = 100
+    mongo_warmup_connections: int = 10
+    # Replica set members that tolerant reads may use, as "read=mode,...",
+    # and how far behind the primary a secondary may be to serve them (0 for
+    # no bound); see storage/read_preferences.py
+    mongo_read_preferences: str = ""
+    mongo_max_staleness_seconds: int = 90
+    # Admin endpoints (profiling, slow requests) are disabled unless a token is set
+    admin_token: Optional[str] = None
+    # Requests slower than this are kept, with their span breakdown, in a ring buffer
+    slow_request_threshold_ms: float = 500.0
+    slow_request_buffer_size: int = 200
+    # /readyz fails past these, so the orchestrator stops routing to a
+    # worker whose loop is stalling or whose Mongo pool is exhausted
+    ready_max_loop_lag_ms: float = 250.0
+    ready_max_pool_wait_queue: int = 20
+    # Expo push API for users without a live connection; the access token is
+    # only needed when push security is enabled for the Expo project
+    expo_push_url: str = "https://exp.host/--/api/v2/push"
+    expo_access_token: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Config":
+        return cls(
+            storage_backend=environ.get("STORAGE_BACKEND", cls.storage_backend),
+            mongo_url=environ.get("MONGO_URL"),
+            db_name=environ.get("DB_NAME"),
+            mongo_min_pool_size=int(environ.get("MONGO_MIN_POOL_SIZE", cls.mongo_min_pool_size)),
+            mongo_max_pool_size=int(environ.get("MONGO_MAX_POOL_SIZE", cls.mongo_max_pool_size)),
+            mongo_warmup_connections=int(environ.get("MONGO_WARMUP_CONNECTIONS", cls.mongo_warmup_connections)),
+            mongo_read_preferences=environ.get("MONGO_READ_PREFERENCES", cls.mongo_read_preferences),
+            mongo_max_staleness_seconds=int(
+                environ.get("MONGO_MAX_STALENESS_SECONDS", cls.mongo_max_staleness_seconds)
+            ),
+            admin_token=environ.get("ADMIN_TOKEN") or None,
+            slow_request_threshold_ms=float(environ.get("SLOW_REQUEST_THRESHOLD_MS", cls.slow_request_threshold_ms)),
+            slow_request_buffer_size=int(environ.get("SLOW_REQUEST_BUFFER_SIZE", cls.slow_request_buffer_size)),
+            ready_max_loop_lag_ms=float(environ.get("READY_MAX_LOOP_LAG_MS", cls.ready_max_loop_lag_ms)),
+            ready_max_pool_wait_queue=int(environ.get("READY_MAX_POOL_WAIT_QUEUE", cls.ready_max_pool_wait_queue)),
+            expo_push_url=environ.get("EXPO_PUSH_URL", cls.expo_push_url),
+            expo_access_token=environ.get("EXPO_ACCESS_TOKEN") or None,
+        )
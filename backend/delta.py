@@ -0,0 +1,40 @@
+"""
+Sync tokens for delta reads of the nearby lists ("changes since").
+
+A token records when a client last read a nearby list and exactly where
+from: its position and alert radius. Changes are tracked per document,
+not per viewer, so a delta only lists documents written since the token.
+Anything that was already there but has come into or gone out of range
+because the client moved would be missed, and every distance would be
+stale. So a token only counts at the same position and radius, and a
+client that moved at all is sent the full list again.
+"""
+
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class SyncToken(NamedTuple):
+    at: datetime
+    latitude: float
+    longitude: float
+    radius_km: float
+
+
+def encode_sync_token(token: SyncToken) -> str:
+    millis = (token.at - EPOCH) // timedelta(milliseconds=1)
+    # repr round-trips floats exactly
+    return f"{millis}_{token.latitude!r}_{token.longitude!r}_{token.radius_km!r}"
+
+
+def decode_sync_token(value: str) -> Optional[SyncToken]:
+    """The token, or None if it is malformed"""
+    try:
+        millis, latitude, longitude, radius_km = value.split("_")
+        return SyncToken(
+            EPOCH + timedelta(milliseconds=int(millis)), float(latitude), float(longitude), float(radius_km)
+        )
+    except (ValueError, OverflowError):
+        return None
@@ -0,0 +1,131 @@
+"""
+Subscription entitlements carried by the client as signed tokens.
+
+Binding a device returns a short-lived JWT naming the user, device,
+subscription type and expiry, so the subscription guard can be answered
+by checking a signature instead of reading the bindings and subscriptions
+collections. Tokens are signed with a key derived from the access token
+secret, so neither kind of token is accepted as the other.
+
+A token can't be taken back, so unbinding records a revocation: every
+entitlement the user was issued before that moment stops verifying. The
+store keeps revocations for one token lifetime and each worker syncs them
+into memory periodically, so a revocation made on another worker takes
+effect within one sync interval.
+"""
+
+import asyncio
+import calendar
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+AUDIENCE = "saferide:entitlement"
+
+
+class InvalidEntitlement(Exception):
+    pass
+
+
+def signing_key(secret: str) -> str:
+    return hmac.new(secret.encode(), b"entitlement", hashlib.sha256).hexdigest()
+
+
+def timestamp(value: datetime) -> float:
+    """Seconds since the epoch, reading naive datetimes (as Mongo returns them) as UTC"""
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def issue_entitlement(
+    key: str, user_id: str, binding: Dict[str, Any], expires_at: datetime, now: float, ttl_seconds: float
+) -> Dict[str, Any]:
+    """Token for a device binding, valid for ttl_seconds or until the subscription expires"""
+    claims = {
+        "aud": AUDIENCE,
+        "sub": user_id,
+        "dev": binding["device_id"],
+        "dnm": binding["device_name"],
+        "typ": binding["subscription_type"],
+        "sxp": timestamp(expires_at),
+        # Float so a token issued right after a revocation isn't mistaken for an older one
+        "iat": now,
+        "exp": int(min(now + ttl_seconds, timestamp(expires_at))),
+        "jti": secrets.token_hex(8),
+    }
+    return {"entitlement": jwt.encode(claims, key, algorithm=ALGORITHM), "entitlement_expires_at": claims["exp"]}
+
+
+def decode_entitlement(key: str, token: str) -> Dict[str, Any]:
+    """Claims of a well-signed, unexpired entitlement"""
+    try:
+        return jwt.decode(token, key, algorithms=[ALGORITHM], audience=AUDIENCE)
+    except JWTError as error:
+        raise InvalidEntitlement(str(error)) from error
+
+
+class RevocationList:
+    """Per user, the time before which issued entitlements no longer count"""
+
+    def __init__(self, ttl_seconds: float, interval: float = 15.0):
+        self.ttl_seconds = ttl_seconds
+        self.interval = interval
+        self.synced_until = 0.0
+        self._revoked_before: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._revoked_before)
+
+    def revoke(self, user_id: str, at: float):
+        self._revoked_before[user_id] = max(at, self._revoked_before.get(user_id, at))
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        revoked_before = self._revoked_before.get(claims["sub"])
+        return revoked_before is not None and claims["iat"] < revoked_before
+
+    def apply(self, revocations: List[Dict[str, Any]], now: float):
+        """Merge revocations read from the store and forget those older than any live token"""
+        for revocation in revocations:
+            self.revoke(revocation["user_id"], revocation["revoked_at"])
+        horizon = now - self.ttl_seconds
+        self._revoked_before = {user: at for user, at in self._revoked_before.items() if at >= horizon}
+
+    async def sync(self, fetch: Callable[[float], Awaitable[List[Dict[str, Any]]]], now: float):
+        # Overlap the previous window so clock skew between workers can't skip a revocation
+        revocations = await fetch(self.synced_until - self.interval)
+        self.apply(revocations, now)
+        self.synced_until = now
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, fetch: Callable[[float], Awaitable[List[Dict[str, Any]]]], clock: Callable[[], float]):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run(fetch, clock))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, fetch, clock):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync(fetch, clock())
+            except Exception:
+                # A failed sync is retried next tick, the job must keep running
+                logger.exception("Entitlement revocation sync failed")
@@ -0,0 +1,68 @@
+import math
+from typing import List, Tuple
+
+# Same Earth radius as the haversine distance in calculate_distance
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Grid used to key per-area state (versions, caches). 0.1 degree is ~11km,
+# about the largest alert radius, so a nearby query touches at most 3x3 cells.
+CELL_SIZE_DEG = 0.1
+
+Cell = Tuple[int, int]
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points in kilometers using Haversine formula"""
+    R = 6371  # Earth's radius in kilometers
+    
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+    
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    distance = R * c
+    
+    return distance
+
+
+def cell_of(latitude: float, longitude: float, size_deg: float = CELL_SIZE_DEG) -> Cell:
+    return (math.floor(latitude / size_deg), math.floor(longitude / size_deg))
+
+
+def cells_covering(latitude: float, longitude: float, radius_km: float, size_deg: float = CELL_SIZE_DEG) -> List[Cell]:
+    """Grid cells intersecting the bounding box of a circle around the point"""
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+    min_lat, min_lon = cell_of(south, west, size_deg)
+    max_lat, max_lon = cell_of(north, east, size_deg)
+    return [
+        (cell_lat, cell_lon)
+        for cell_lat in range(min_lat, max_lat + 1)
+        for cell_lon in range(min_lon, max_lon + 1)
+    ]
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle around the point"""
+    delta_lat = radius_km / KM_PER_DEGREE_LAT
+    # Widest longitude span of the circle, reached slightly poleward of the
+    # center, so points at exactly radius_km are never cut off
+    angular = radius_km / EARTH_RADIUS_KM
+    ratio = math.sin(angular) / max(math.cos(math.radians(latitude)), 0.01)
+    delta_lon = math.degrees(math.asin(ratio)) if ratio < 1 else 180.0
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def cell_center(cell: Cell, size_deg: float = CELL_SIZE_DEG) -> Tuple[float, float]:
+    return (cell[0] + 0.5) * size_deg, (cell[1] + 0.5) * size_deg
+
+
+def cell_reach_km(cell: Cell, size_deg: float = CELL_SIZE_DEG) -> float:
+    """Upper bound on the distance from a cell's center to any point in it"""
+    center_lat, _ = cell_center(cell, size_deg)
+    widest = math.cos(math.radians(max(abs(center_lat) - size_deg / 2, 0.0)))
+    half_side_km = size_deg / 2 * KM_PER_DEGREE_LAT
+    # Along the meridian to the corner's latitude, then along its parallel
+    return half_side_km + half_side_km * widest
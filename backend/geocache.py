@@ -0,0 +1,101 @@
+"""
+LRU cache of nearby candidate sets, invalidated by writes to their area.
+
+An entry is the result of one store fetch around a point (see
+server.nearby_area) and remembers the bounding box it covered. Writes
+report their position with invalidate(), which drops exactly the entries
+whose box contains it, found through an index of grid cells. A fetch that
+was running while such a write happened is returned but not cached, so a
+result read before the write can't be stored after it.
+"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from geo import CELL_SIZE_DEG, Cell, bounding_box, cell_of, cells_covering
+from metrics import geo_cache_evictions, geo_cache_hit_ratio, geo_cache_requests
+
+
+class _Entry:
+    __slots__ = ("value", "box", "cells")
+
+    def __init__(self, value: Any, box: Tuple[float, float, float, float], cells: List[Cell]):
+        self.value = value
+        self.box = box
+        self.cells = cells
+
+
+class GeoCache:
+    def __init__(self, name: str, capacity: int, cell_size_deg: float = CELL_SIZE_DEG):
+        self.name = name
+        self.capacity = capacity
+        self.cell_size_deg = cell_size_deg
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_cell: Dict[Cell, Set[Hashable]] = {}
+        # Bumped by every invalidation in a cell, to spot writes during a fetch
+        self._generations: Dict[Cell, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            geo_cache_requests.inc(self.name, "miss")
+        else:
+            self.hits += 1
+            geo_cache_requests.inc(self.name, "hit")
+            self._entries.move_to_end(key)
+        geo_cache_hit_ratio.set(self.hits / (self.hits + self.misses), self.name)
+        return entry.value if entry is not None else None
+
+    async def fetch(
+        self, key: Hashable, latitude: float, longitude: float, radius_km: float, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run fetch for the circle around the point and cache its result, unless a write touched the area meanwhile"""
+        cells = cells_covering(latitude, longitude, radius_km, self.cell_size_deg)
+        before = [self._generations.get(cell, 0) for cell in cells]
+        value = await fetch()
+        if before == [self._generations.get(cell, 0) for cell in cells]:
+            self._put(key, _Entry(value, bounding_box(latitude, longitude, radius_km), cells))
+        return value
+
+    def invalidate(self, latitude: float, longitude: float) -> int:
+        """Drop entries whose area contains the point, returning how many"""
+        cell = cell_of(latitude, longitude, self.cell_size_deg)
+        self._generations[cell] = self._generations.get(cell, 0) + 1
+        dropped = 0
+        for key in list(self._by_cell.get(cell, ())):
+            south, north, west, east = self._entries[key].box
+            if south <= latitude <= north and west <= longitude <= east:
+                self._remove(key)
+                dropped += 1
+        if dropped:
+            geo_cache_evictions.inc(self.name, "invalidated", amount=dropped)
+        return dropped
+
+    def clear(self):
+        self._entries.clear()
+        self._by_cell.clear()
+
+    def _put(self, key: Hashable, entry: _Entry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        for cell in entry.cells:
+            self._by_cell.setdefault(cell, set()).add(key)
+        while len(self._entries) > self.capacity:
+            self._remove(next(iter(self._entries)))
+            geo_cache_evictions.inc(self.name, "lru")
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        for cell in entry.cells:
+            keys = self._by_cell.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_cell[cell]
@@ -0,0 +1,219 @@
+"""
+Reverse geofence: which users' own alert radius covers a point.
+
+Every user is a disk, their last reported position with their
+alert_distance_km around it. A disk is filed under the grid cells its
+bounding box touches, on the grid level whose cells are at least its
+diameter wide, so it lands in a handful of cells whatever its radius (1m
+to 10km). A point then only needs one cell per level, and the disks found
+there are checked exactly, with numpy over columns of precomputed terms.
+
+The index is kept in memory and updated by the location and settings
+writes this worker serves. A background job also reads the writes made
+since its last sync, so those served by other workers show up within one
+sync interval. Each position and radius carries the server time it was
+written at, so an older read never overwrites a newer write.
+"""
+
+import asyncio
+import logging
+import math
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from geo import CELL_SIZE_DEG, EARTH_RADIUS_KM, KM_PER_DEGREE_LAT, Cell, cell_of, cells_covering
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Coarsest cells hold the 10km disks; each level below is 4x finer, down to ~40m
+LEVELS = tuple(CELL_SIZE_DEG / 4 ** level for level in range(5))
+
+Fetch = Callable[[datetime], Awaitable[List[Dict[str, Any]]]]
+
+
+class CellSlots:
+    """Slots filed under one cell, in a flat array numpy reads without copying"""
+
+    __slots__ = ("slots", "positions")
+
+    def __init__(self):
+        self.slots = array("q")
+        self.positions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, slot: int):
+        self.positions[slot] = len(self.slots)
+        self.slots.append(slot)
+
+    def discard(self, slot: int):
+        # Move the last slot into the hole, so removal is O(1)
+        position = self.positions.pop(slot)
+        last = self.slots.pop()
+        if last != slot:
+            self.slots[position] = last
+            self.positions[last] = position
+
+
+def level_for(radius_km: float) -> int:
+    """Finest level whose cells are at least the disk's diameter wide"""
+    level = 0
+    while level + 1 < len(LEVELS) and 2 * radius_km <= LEVELS[level + 1] * KM_PER_DEGREE_LAT:
+        level += 1
+    return level
+
+
+class GeofenceIndex:
+    def __init__(self, default_radius_km: float, interval: float = 5.0, overlap: timedelta = timedelta(seconds=5)):
+        self.default_radius_km = default_radius_km
+        self.interval = interval
+        self.overlap = overlap
+        self.synced_until: Optional[datetime] = None
+        # user_id -> (latitude, longitude, written at) and (radius, written at)
+        self._positions: Dict[str, Tuple[float, float, datetime]] = {}
+        self._radii: Dict[str, Tuple[float, datetime]] = {}
+        # Each filed disk has a slot: a row in the columns below, and the
+        # level and cells it is filed under
+        self._slots: Dict[str, int] = {}
+        self._filed: Dict[int, Tuple[int, Tuple[Cell, ...]]] = {}
+        self._user_ids: List[str] = []
+        self._cells: List[Dict[Cell, CellSlots]] = [{} for _ in LEVELS]
+        # Haversine terms: a point is inside when
+        # sin²(Δlat/2) + cos(lat)·cos(lat')·sin²(Δlon/2) <= threshold
+        self._columns = np.zeros((0, 4))
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def set_location(self, user_id: str, latitude: float, longitude: float, at: datetime):
+        current = self._positions.get(user_id)
+        if current is not None and current[2] > at:
+            return
+        self._positions[user_id] = (latitude, longitude, at)
+        self._refile(user_id)
+
+    def set_radius(self, user_id: str, radius_km: float, at: datetime):
+        current = self._radii.get(user_id)
+        if current is not None and current[1] > at:
+            return
+        self._radii[user_id] = (radius_km, at)
+        self._refile(user_id)
+
+    def covering(self, latitude: float, longitude: float) -> Set[str]:
+        """Users whose alert radius around their last position contains the point"""
+        candidates = [
+            slots
+            for size, cells in zip(LEVELS, self._cells) if cells
+            for slots in (cells.get(cell_of(latitude, longitude, size)),) if slots
+        ]
+        if not candidates:
+            return set()
+        slots = np.concatenate([np.frombuffer(group.slots, dtype=np.int64) for group in candidates])
+        lat_rad, lon_rad, cos_lat, threshold = self._columns[slots].T
+        a = np.sin((math.radians(latitude) - lat_rad) / 2) ** 2 + \
+            math.cos(math.radians(latitude)) * cos_lat * np.sin((math.radians(longitude) - lon_rad) / 2) ** 2
+        user_ids = self._user_ids
+        return {user_ids[slot] for slot in slots[a <= threshold].tolist()}
+
+    def apply(self, locations: List[Dict[str, Any]], radii: List[Dict[str, Any]]):
+        """Merge positions and radii read from the store"""
+        for location in locations:
+            self.set_location(location["user_id"], location["latitude"], location["longitude"], location["updated_at"])
+        for settings in radii:
+            self.set_radius(settings["user_id"], settings["alert_distance_km"], settings["updated_at"])
+
+    async def sync(self, fetch_locations: Fetch, fetch_radii: Fetch, now: datetime):
+        # The first sync loads everything; later ones overlap the previous
+        # window so clock skew between workers can't skip a write
+        since = EPOCH if self.synced_until is None else self.synced_until - self.overlap
+        locations, radii = await asyncio.gather(fetch_locations(since), fetch_radii(since))
+        self.apply(locations, radii)
+        self.synced_until = now
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, fetch_locations: Fetch, fetch_radii: Fetch, clock: Callable[[], datetime]):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run(fetch_locations, fetch_radii, clock))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, fetch_locations, fetch_radii, clock):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync(fetch_locations, fetch_radii, clock())
+            except Exception:
+                # A failed sync is retried next tick, the job must keep running
+                logger.exception("Geofence sync failed")
+
+    def clear(self):
+        self._positions.clear()
+        self._radii.clear()
+        self._slots.clear()
+        self._filed.clear()
+        self._user_ids.clear()
+        for cells in self._cells:
+            cells.clear()
+        self._columns = np.zeros((0, 4))
+        self.synced_until = None
+
+    def _refile(self, user_id: str):
+        position = self._positions.get(user_id)
+        if position is None:
+            return
+        latitude, longitude, _ = position
+        radius = self._radii.get(user_id)
+        radius_km = radius[0] if radius is not None else self.default_radius_km
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._allocate(user_id)
+        else:
+            self._unfile(slot)
+        level = level_for(radius_km)
+        cells = tuple(cells_covering(latitude, longitude, radius_km, LEVELS[level]))
+        lat_rad = math.radians(latitude)
+        self._columns[slot] = (
+            lat_rad, math.radians(longitude), math.cos(lat_rad),
+            math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2) ** 2,
+        )
+        self._filed[slot] = (level, cells)
+        index = self._cells[level]
+        for cell in cells:
+            index.setdefault(cell, CellSlots()).add(slot)
+
+    def _allocate(self, user_id: str) -> int:
+        slot = len(self._user_ids)
+        self._user_ids.append(user_id)
+        if slot == len(self._columns):
+            # Grow by doubling, so filing n users copies O(n) rows in total
+            grown = np.zeros((max(16, 2 * len(self._columns)), 4))
+            grown[:slot] = self._columns
+            self._columns = grown
+        self._slots[user_id] = slot
+        return slot
+
+    def _unfile(self, slot: int):
+        level, cells = self._filed.pop(slot)
+        index = self._cells[level]
+        for cell in cells:
+            slots = index[cell]
+            slots.discard(slot)
+            if not slots:
+                del index[cell]
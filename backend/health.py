@@ -0,0 +1,38 @@
+"""
+Reports behind /healthz (liveness) and /readyz (readiness).
+
+Liveness only says the event loop answered. Readiness also fails while the
+app is starting or stopping, when the last loop lag sample or the Mongo
+pool wait queue is past its threshold, or when a background job has died.
+"""
+
+from typing import Dict, List, Optional
+
+
+def health_report(
+    loop_lag_seconds: float,
+    socketio_clients: float,
+    pool: Optional[Dict[str, int]],
+    jobs: Dict[str, bool],
+) -> dict:
+    return {
+        "loop_lag_ms": round(loop_lag_seconds * 1000, 3),
+        "socketio_clients": int(socketio_clients),
+        "mongo_pool": pool,
+        "background_jobs": jobs,
+    }
+
+
+def readiness_failures(report: dict, started: bool, max_loop_lag_ms: float, max_pool_wait_queue: int) -> List[str]:
+    failures = []
+    if not started:
+        failures.append("not started")
+    if report["loop_lag_ms"] > max_loop_lag_ms:
+        failures.append(f"event loop lag {report['loop_lag_ms']}ms > {max_loop_lag_ms}ms")
+    pool = report["mongo_pool"]
+    if pool is not None and pool["wait_queue"] > max_pool_wait_queue:
+        failures.append(f"mongo pool wait queue {pool['wait_queue']} > {max_pool_wait_queue}")
+    for name, running in report["background_jobs"].items():
+        if not running:
+            failures.append(f"background job {name} is not running")
+    return failures
@@ -0,0 +1,105 @@
+"""
+Idempotency-Key support for POST endpoints whose retries must not repeat writes.
+
+A key belongs to one user and route. The first request with it reserves
+the key in the store, where a unique index makes the reservation atomic
+across workers. It then runs and saves its response, and a retry with
+the same key and body gets that response back without running anything.
+Retries arriving while the first request is still running share its
+result on the same worker and get 409 from another. Reusing a key with a
+different body is an error, and a request that fails releases its key so
+it can be retried.
+
+Completed responses are also kept in a small LRU in front of the store,
+so most replays never reach Mongo.
+"""
+
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+from coalescing import SingleFlight
+
+# A reservation whose request never finished (worker died) frees the key after this
+PENDING_TTL = timedelta(minutes=1)
+
+
+class IdempotencyConflict(Exception):
+    """The key's first request is still running on another worker"""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was already used with a different request body"""
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class Idempotency:
+    def __init__(self, capacity: int, ttl: timedelta):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._responses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._flights = SingleFlight("idempotency")
+
+    def __len__(self):
+        return len(self._responses)
+
+    async def run(
+        self, repository, key: str, payload: Dict[str, Any], execute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Response for the request and whether it is a replay of an earlier one"""
+        request = fingerprint(payload)
+        record = self._cached(key)
+        if record is not None:
+            return self._replay(record, request)
+        return await self._flights.run((key, request), lambda: self._execute(repository, key, request, execute))
+
+    async def _execute(self, repository, key, request, execute):
+        now = datetime.utcnow()
+        existing = await repository.reserve(
+            {"key": key, "fingerprint": request, "response": None, "expires_at": now + PENDING_TTL}, now
+        )
+        if existing is not None:
+            if existing["response"] is None and existing["fingerprint"] == request:
+                raise IdempotencyConflict(key)
+            return self._replay(self._remember(key, existing), request)
+        try:
+            response = await execute()
+        except BaseException:
+            await repository.release(key)
+            raise
+        expires_at = datetime.utcnow() + self.ttl
+        await repository.complete(key, response, expires_at)
+        self._remember(key, {"fingerprint": request, "response": response, "expires_at": expires_at})
+        return response, False
+
+    def _replay(self, record, request):
+        if record["fingerprint"] != request:
+            raise IdempotencyMismatch()
+        return record["response"], True
+
+    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._responses.get(key)
+        if record is None:
+            return None
+        if record["expires_at"] <= datetime.utcnow():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return record
+
+    def _remember(self, key: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        if record["response"] is not None:
+            self._responses[key] = record
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.capacity:
+                self._responses.popitem(last=False)
+        return record
+
+    def clear(self):
+        self._responses.clear()
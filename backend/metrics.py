@@ -0,0 +1,336 @@
+"""
+Prometheus-style metrics with no external dependency.
+
+Counters, gauges and histograms keep their values in plain dicts keyed by
+label values and render the Prometheus text exposition format on demand.
+Updates take an uncontended lock because Mongo command events arrive on
+Motor's executor threads; everything else runs on the event loop.
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Iterable[str]) -> LabelValues:
+        key = tuple(str(value) for value in labels)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return key
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "saferide_http_request_duration_seconds",
+    "HTTP request latency by API route",
+    ("method", "route", "status"),
+)
+mongo_command_duration = registry.histogram(
+    "saferide_mongo_command_duration_seconds",
+    "MongoDB command latency by collection and operation",
+    ("collection", "command", "outcome"),
+)
+socketio_connected_clients = registry.gauge(
+    "saferide_socketio_connected_clients",
+    "Socket.IO clients currently connected",
+)
+socketio_emits = registry.counter(
+    "saferide_socketio_emits_total",
+    "Socket.IO events emitted by event name",
+    ("event",),
+)
+socketio_fanout = registry.histogram(
+    "saferide_socketio_fanout_clients",
+    "Clients targeted by each Socket.IO emit",
+    ("event",),
+    buckets=SIZE_BUCKETS,
+)
+mongo_pool_connections = registry.gauge(
+    "saferide_mongo_pool_connections",
+    "MongoDB pool connections by state (open, checked_out, waiting for a checkout)",
+    ("state",),
+)
+event_loop_lag = registry.histogram(
+    "saferide_event_loop_lag_seconds",
+    "Delay between a scheduled event loop wakeup and when it actually ran",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+event_loop_lag_last = registry.gauge(
+    "saferide_event_loop_lag_last_seconds",
+    "Most recent event loop lag sample",
+)
+
+singleflight_calls = registry.counter(
+    "saferide_singleflight_calls_total",
+    "Coalesced reads by whether they ran the fetch (leader) or joined one in flight (follower)",
+    ("flight", "role"),
+)
+
+geo_cache_requests = registry.counter(
+    "saferide_geo_cache_requests_total",
+    "Nearby candidate cache lookups by result",
+    ("cache", "result"),
+)
+geo_cache_hit_ratio = registry.gauge(
+    "saferide_geo_cache_hit_ratio",
+    "Share of nearby candidate cache lookups served from the cache since start",
+    ("cache",),
+)
+geo_cache_evictions = registry.counter(
+    "saferide_geo_cache_evictions_total",
+    "Nearby candidate cache entries dropped, by reason (lru, invalidated)",
+    ("cache", "reason"),
+)
+sse_connections = registry.gauge(
+    "saferide_sse_connections",
+    "Server-Sent Events alert streams currently open",
+)
+sse_events = registry.counter(
+    "saferide_sse_events_total",
+    "Events queued to alert streams, by event name",
+    ("event",),
+)
+sse_resyncs = registry.counter(
+    "saferide_sse_resyncs_total",
+    "Alert streams told to refetch, by reason (overflow, resume)",
+    ("reason",),
+)
+push_messages = registry.counter(
+    "saferide_push_messages_total",
+    "Push notifications by outcome (accepted, rejected, unregistered, failed)",
+    ("status",),
+)
+push_requests = registry.counter(
+    "saferide_push_requests_total",
+    "Requests to the push service by outcome (ok, retried, rejected, failed)",
+    ("outcome",),
+)
+
+
+class MetricsMiddleware:
+    """Times every request that matched an API route, labelled by route template"""
+
+    def __init__(self, app, prefix: str = "/api", exclude_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.prefix = prefix
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path is not None and path.startswith(self.prefix):
+                http_request_duration.observe(
+                    time.perf_counter() - start, scope["method"], path, str(status)
+                )
+
+
+class LoopLagMonitor:
+    """Samples event loop lag by measuring how late a periodic sleep wakes up"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - scheduled)
+            event_loop_lag.observe(self.last_lag)
+            event_loop_lag_last.set(self.last_lag)
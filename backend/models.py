@@ -0,0 +1,96 @@
+from pydantic import BaseModel, Field, EmailStr
+from datetime import datetime
+from typing import List
+import uuid
+
+class UserCreate(BaseModel):
+    email: EmailStr
+    password: str
+    name: str
+    vehicle_plate: str
+
+class UserLogin(BaseModel):
+    email: EmailStr
+    password: str
+
+class PasswordResetRequest(BaseModel):
+    email: EmailStr
+
+class PasswordReset(BaseModel):
+    token: str
+    new_password: str
+
+class User(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    email: str
+    name: str
+    vehicle_plate: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class UserSettings(BaseModel):
+    emergency_contacts: List[str] = Field(default_factory=list)  # Phone numbers
+    alert_distance_km: float = Field(default=10.0)  # Distance in kilometers
+
+class UserSettingsUpdate(BaseModel):
+    emergency_contacts: List[str] = Field(..., min_items=1, max_items=5)
+    alert_distance_km: float = Field(..., ge=0.001, le=10.0)  # 1m to 10km
+
+class DeviceBinding(BaseModel):
+    user_id: str
+    device_id: str
+    device_name: str
+    device_brand: str
+    subscription_type: str
+    bound_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SubscriptionUpdate(BaseModel):
+    device_id: str
+    device_name: str
+    device_brand: str
+    subscription_type: str
+    expires_at: datetime
+
+class PushTokenRegistration(BaseModel):
+    # Expo push token, as returned by getExpoPushTokenAsync
+    token: str = Field(..., pattern=r"^Expo(nent)?PushToken\[[^\]]+\]$")
+
+class ChatMessage(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    user_name: str
+    message: str
+    latitude: float
+    longitude: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    message_type: str = "text"  # text, emergency, location
+
+class ChatMessageCreate(BaseModel):
+    message: str
+    latitude: float
+    longitude: float
+    message_type: str = "text"
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    user: User
+
+class EmergencyCreate(BaseModel):
+    latitude: float
+    longitude: float
+
+class Emergency(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    user_name: str
+    vehicle_plate: str
+    latitude: float
+    longitude: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+
+class UserLocation(BaseModel):
+    user_id: str
+    latitude: float
+    longitude: float
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,111 @@
+"""
+pymongo event listeners for metrics, request tracing and pool health.
+
+Kept apart from metrics.py and profiling.py so pymongo is only imported
+when the Mongo store is opened.
+"""
+
+import threading
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+from metrics import mongo_command_duration, mongo_pool_connections
+from profiling import record_db_time
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding mongo_command_duration"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, object], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = "-"
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        collection, command = pending
+        # duration_micros is measured by the driver around the wire round trip
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, command, outcome)
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    """Adds driver-measured command time to the request that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_db_time(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_db_time(event.duration_micros / 1e6)
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """Connections open, checked out and waited for across the client's pools"""
+
+    # pymongo's default, PoolCreatedEvent only carries options that were set
+    DEFAULT_MAX_POOL_SIZE = 100
+
+    def __init__(self):
+        self._max_sizes: Dict[object, int] = {}
+
+    def stats(self) -> dict:
+        return {
+            "max_size": sum(self._max_sizes.values()),
+            "open": int(mongo_pool_connections.value("open")),
+            "checked_out": int(mongo_pool_connections.value("checked_out")),
+            "wait_queue": int(mongo_pool_connections.value("waiting")),
+        }
+
+    def pool_created(self, event):
+        self._max_sizes[event.address] = event.options.get("maxPoolSize", self.DEFAULT_MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self._max_sizes.pop(event.address, None)
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc("open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec("open")
+
+    def connection_check_out_started(self, event):
+        mongo_pool_connections.inc("waiting")
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_connections.dec("waiting")
+
+    def connection_checked_out(self, event):
+        mongo_pool_connections.dec("waiting")
+        mongo_pool_connections.inc("checked_out")
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.dec("checked_out")
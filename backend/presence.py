@@ -0,0 +1,72 @@
+"""
+Recent positions of users who report their location, for density checks.
+
+Each worker keeps the last position every user reported to it within a
+time window, counted per grid cell, so "how many users are around here"
+is a dict lookup instead of a query over user_locations. Entries are kept
+in report order, so the stale ones are always at the front and are
+dropped as new reports come in, without a background job.
+
+Like the alert streams, a worker only sees the reports it served, so with
+several workers a count is that worker's share of the area.
+"""
+
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+from geo import Cell, cell_of
+
+# ~1km: the neighbourhood whose crowding decides how often to report
+PRESENCE_CELL_DEG = 0.01
+
+
+class Presence(NamedTuple):
+    latitude: float
+    longitude: float
+    cell: Cell
+    at: float
+
+
+class PresenceIndex:
+    def __init__(self, ttl_seconds: float, cell_size_deg: float = PRESENCE_CELL_DEG):
+        self.ttl_seconds = ttl_seconds
+        self.cell_size_deg = cell_size_deg
+        self._entries: "OrderedDict[str, Presence]" = OrderedDict()
+        self._counts: Dict[Cell, int] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def report(self, user_id: str, latitude: float, longitude: float, now: float):
+        self.expire(now)
+        self._remove(user_id)
+        presence = Presence(latitude, longitude, cell_of(latitude, longitude, self.cell_size_deg), now)
+        self._entries[user_id] = presence
+        self._counts[presence.cell] = self._counts.get(presence.cell, 0) + 1
+
+    def density(self, latitude: float, longitude: float, now: float) -> int:
+        """Users who reported from the point's cell within the window"""
+        self.expire(now)
+        return self._counts.get(cell_of(latitude, longitude, self.cell_size_deg), 0)
+
+    def expire(self, now: float):
+        horizon = now - self.ttl_seconds
+        while self._entries:
+            user_id, presence = next(iter(self._entries.items()))
+            if presence.at >= horizon:
+                break
+            self._remove(user_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._counts.clear()
+
+    def _remove(self, user_id: str):
+        presence = self._entries.pop(user_id, None)
+        if presence is None:
+            return
+        remaining = self._counts[presence.cell] - 1
+        if remaining:
+            self._counts[presence.cell] = remaining
+        else:
+            del self._counts[presence.cell]
@@ -0,0 +1,186 @@
+"""
+On-demand sampling profiler and slow-request capture.
+
+SamplingProfiler samples the event loop thread's stack from a background
+thread and aggregates it into folded stacks ("frame;frame;frame count"),
+the input format of flamegraph.pl, speedscope and inferno.
+
+Every HTTP request gets a RequestTrace in a context variable. Code marks
+phases with span("auth") etc., Mongo time is added by the command listener
+(Motor copies the context into its executor threads), and requests slower
+than the threshold are kept in a bounded ring buffer with their breakdown.
+"""
+
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class RequestTrace:
+    __slots__ = ("spans", "db_seconds", "db_commands", "_lock")
+
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        self.db_seconds = 0.0
+        self.db_commands = 0
+        self._lock = threading.Lock()
+
+    def add_db(self, seconds: float):
+        with self._lock:
+            self.db_seconds += seconds
+            self.db_commands += 1
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a phase of the current request, excluding Mongo time spent inside it"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    db_before = trace.db_seconds
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start - (trace.db_seconds - db_before)
+        trace.spans[name] = trace.spans.get(name, 0.0) + max(elapsed, 0.0)
+
+
+def record_db_time(seconds: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_db(seconds)
+
+
+class SlowRequestLog:
+    def __init__(self, threshold_ms: float, capacity: int):
+        self.threshold_ms = threshold_ms
+        self.entries: Deque[dict] = deque(maxlen=capacity)
+
+    def maybe_record(self, method: str, path: str, route: Optional[str], status: int, total: float, trace: RequestTrace):
+        total_ms = total * 1000
+        if total_ms < self.threshold_ms:
+            return
+        spans_ms = {name: round(seconds * 1000, 3) for name, seconds in trace.spans.items()}
+        spans_ms["db"] = round(trace.db_seconds * 1000, 3)
+        spans_ms["other"] = round(max(total_ms - sum(spans_ms.values()), 0.0), 3)
+        self.entries.append({
+            "started_at": datetime.utcnow().isoformat(),
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "total_ms": round(total_ms, 3),
+            "db_commands": trace.db_commands,
+            "spans_ms": spans_ms,
+        })
+
+
+class TracingMiddleware:
+    """Gives each HTTP request a RequestTrace and logs it when it is slow"""
+
+    def __init__(self, app, log: SlowRequestLog, exclude_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.log = log
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            self.log.maybe_record(scope["method"], scope["path"], route, status, time.perf_counter() - start, trace)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Statistical profiler for one thread, one session at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self, interval: float, thread_id: Optional[int] = None) -> "ProfileSession":
+        """Start sampling thread_id, by default the calling (event loop) thread"""
+        with self._lock:
+            if self._running:
+                raise ProfilerBusy("A profiling session is already running")
+            self._running = True
+        session = ProfileSession(self, thread_id or threading.get_ident(), interval)
+        session.thread.start()
+        return session
+
+    def _finished(self):
+        with self._lock:
+            self._running = False
+
+
+class ProfileSession:
+    def __init__(self, profiler: SamplingProfiler, thread_id: int, interval: float):
+        self.profiler = profiler
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.samples[_fold(frame)] += 1
+        finally:
+            self.profiler._finished()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self.thread.join()
+        return folded_output(self.samples)
+
+
+def _fold(frame) -> str:
+    stack: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+def folded_output(samples: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
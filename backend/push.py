@@ -0,0 +1,243 @@
+"""
+Expo push notifications for users with no live connection.
+
+Alerts reach open apps over Socket.IO and SSE; a backgrounded app has
+neither, so its users get a push instead. Messages go to Expo's push API
+in batches of up to 100 (its limit per request) over one pooled HTTP
+session, with a bounded number of batches in flight. A batch that fails
+with a network error, a 429 or a 5xx is retried with exponential backoff,
+honouring Retry-After; messages Expo rejects one by one are not.
+
+Expo accepts a message by returning a ticket; whether it reached the
+device is only known from its receipt, which Expo recommends reading
+after a delay. Ticket ids are kept until then, and a background job reads
+the receipts that are due. Tokens that tickets or receipts report as
+DeviceNotRegistered are handed to a callback, to be forgotten.
+
+aiohttp is imported when the dispatcher starts, not at import.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from metrics import push_messages, push_requests
+
+logger = logging.getLogger(__name__)
+
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push"
+# Expo's limits on messages per send and ticket ids per receipts request
+MAX_BATCH_SIZE = 100
+MAX_RECEIPTS_PER_REQUEST = 1000
+UNREGISTERED = "DeviceNotRegistered"
+
+OnUnregistered = Callable[[List[str]], Awaitable[None]]
+
+
+class PushFailed(Exception):
+    """A request was refused, or not answered after every attempt"""
+
+
+class TransientPushError(Exception):
+    """Expo is rate limiting or failing; the request can be retried"""
+
+    def __init__(self, reason: str, retry_after: float = 0.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class DispatchResult(NamedTuple):
+    accepted: int
+    failed: int
+    unregistered: List[str]
+
+
+def batches(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class PushDispatcher:
+    def __init__(
+        self,
+        batch_size: int = MAX_BATCH_SIZE,
+        concurrency: int = 4,
+        max_attempts: int = 4,
+        backoff: float = 0.5,
+        timeout: float = 10.0,
+        receipt_delay: float = 15 * 60.0,
+        receipt_interval: float = 60.0,
+    ):
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.receipt_delay = receipt_delay
+        self.receipt_interval = receipt_interval
+        self.url = EXPO_PUSH_URL
+        self._headers: Dict[str, str] = {}
+        self._session = None
+        self._on_unregistered: Optional[OnUnregistered] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+        # (due at, {ticket id: token}) in the order tickets were issued
+        self._receipts: Deque[Tuple[float, Dict[str, str]]] = deque()
+        self._deliveries = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_receipts(self) -> int:
+        return sum(len(tickets) for _, tickets in self._receipts)
+
+    async def send(self, messages: List[Dict[str, Any]]) -> DispatchResult:
+        """Send messages in concurrent batches and remember their tickets for the receipt check"""
+        results = await asyncio.gather(
+            *(self._send_batch(batch) for batch in batches(messages, self.batch_size)), return_exceptions=True
+        )
+        accepted, failed, unregistered = 0, 0, []
+        tickets: Dict[str, str] = {}
+        for batch, result in zip(batches(messages, self.batch_size), results):
+            if isinstance(result, BaseException):
+                if isinstance(result, PushFailed):
+                    logger.warning("Push batch of %d messages failed: %s", len(batch), result)
+                else:
+                    logger.error("Push batch failed", exc_info=result)
+                failed += len(batch)
+                push_messages.inc("failed", amount=len(batch))
+                continue
+            for message, ticket in zip(batch, result):
+                if ticket.get("status") == "ok":
+                    accepted += 1
+                    tickets[ticket["id"]] = message["to"]
+                    push_messages.inc("accepted")
+                elif ticket.get("details", {}).get("error") == UNREGISTERED:
+                    unregistered.append(message["to"])
+                    push_messages.inc("unregistered")
+                else:
+                    failed += 1
+                    push_messages.inc("rejected")
+        if tickets:
+            self._receipts.append((time.monotonic() + self.receipt_delay, tickets))
+        if unregistered:
+            await self._forget(unregistered)
+        return DispatchResult(accepted, failed, unregistered)
+
+    def submit(self, messages: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+        """Build and send messages in the background, so the caller doesn't wait on Expo"""
+        task = asyncio.get_running_loop().create_task(self._deliver(messages))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def check_receipts(self, now: Optional[float] = None) -> List[str]:
+        """Read the receipts that are due; tokens reported as unregistered are forgotten"""
+        now = time.monotonic() if now is None else now
+        due: Dict[str, str] = {}
+        while self._receipts and self._receipts[0][0] <= now:
+            due.update(self._receipts.popleft()[1])
+        unregistered = []
+        for ids in batches(list(due), MAX_RECEIPTS_PER_REQUEST):
+            try:
+                receipts = await self._post("/getReceipts", {"ids": ids})
+            except Exception:
+                # Receipts are advisory; a token that stays broken fails again later
+                logger.exception("Push receipt check failed")
+                continue
+            for ticket_id, receipt in receipts.items():
+                if receipt.get("status") == "error" and receipt.get("details", {}).get("error") == UNREGISTERED:
+                    unregistered.append(due[ticket_id])
+        if unregistered:
+            push_messages.inc("unregistered", amount=len(unregistered))
+            await self._forget(unregistered)
+        return unregistered
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, url: str, access_token: Optional[str], on_unregistered: OnUnregistered):
+        if self.running:
+            return
+        import aiohttp
+
+        self.url = url.rstrip("/")
+        self._headers = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+        if access_token:
+            self._headers["Authorization"] = f"Bearer {access_token}"
+        self._on_unregistered = on_unregistered
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+        )
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.receipt_interval)
+            try:
+                await self.check_receipts()
+            except Exception:
+                logger.exception("Push receipt check failed")
+
+    async def _deliver(self, build):
+        try:
+            messages = await build()
+            if messages:
+                await self.send(messages)
+        except Exception:
+            logger.exception("Push delivery failed")
+
+    async def _send_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        async with self._limit:
+            return await self._post("/send", batch)
+
+    async def _post(self, path: str, payload: Any) -> Any:
+        import aiohttp
+
+        delay = self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                body = await self._request(path, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError, TransientPushError) as error:
+                if attempt == self.max_attempts:
+                    push_requests.inc("failed")
+                    raise PushFailed(str(error) or type(error).__name__) from error
+                push_requests.inc("retried")
+                await asyncio.sleep(max(delay, getattr(error, "retry_after", 0.0)))
+                delay *= 2
+            else:
+                push_requests.inc("ok")
+                return body["data"]
+
+    async def _request(self, path: str, payload: Any) -> Any:
+        async with self._session.post(self.url + path, json=payload, headers=self._headers) as response:
+            if response.status == 429 or response.status >= 500:
+                retry_after = response.headers.get("Retry-After", "")
+                raise TransientPushError(
+                    f"HTTP {response.status}", float(retry_after) if retry_after.isdigit() else 0.0
+                )
+            if response.status >= 400:
+                # A malformed request fails the same way every time
+                push_requests.inc("rejected")
+                raise PushFailed(f"HTTP {response.status}: {await response.text()}")
+            return await response.json()
+
+    async def _forget(self, tokens: List[str]):
+        if self._on_unregistered is not None:
+            await self._on_unregistered(tokens)
@@ -0,0 +1,78 @@
+"""
+Region keys: the partition key of the geo collections.
+
+A region is the geohash of a point, cut to REGION_PRECISION characters
+(about 39km by 20km). Geohashes of nearby points share prefixes and sort
+next to each other, so a range of region keys is a contiguous area. Mongo
+can keep a range on one shard, and an index led by the region only
+visits the few regions a query covers, however many documents the rest
+of the country holds. A shorter prefix names a larger area, such as
+"6g" for most of São Paulo state, for zones and splits.
+"""
+
+import math
+from typing import List
+
+from geo import bounding_box
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+REGION_PRECISION = 4
+
+
+def _bits(precision: int):
+    """(latitude bits, longitude bits) of a geohash; longitude takes the odd one"""
+    total = 5 * precision
+    return total // 2, total - total // 2
+
+
+def _index(value: float, low: float, high: float, bits: int) -> int:
+    return min(int((value - low) / (high - low) * (1 << bits)), (1 << bits) - 1)
+
+
+def _encode(lat_index: int, lon_index: int, precision: int) -> str:
+    lat_bits, lon_bits = _bits(precision)
+    code = 0
+    # Bits interleave starting with longitude
+    for i in range(lon_bits + lat_bits):
+        if i % 2 == 0:
+            lon_bits -= 1
+            code = code << 1 | (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            code = code << 1 | (lat_index >> lat_bits) & 1
+    return "".join(BASE32[code >> shift & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    lat_bits, lon_bits = _bits(precision)
+    return _encode(
+        _index(latitude, -90.0, 90.0, lat_bits), _index(longitude, -180.0, 180.0, lon_bits), precision
+    )
+
+
+def region_of(latitude: float, longitude: float) -> str:
+    return geohash(latitude, longitude, REGION_PRECISION)
+
+
+def regions_covering(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Regions intersecting the bounding box of a circle around the point"""
+    lat_bits, lon_bits = _bits(REGION_PRECISION)
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+    lat_low = _index(max(south, -90.0), -90.0, 90.0, lat_bits)
+    lat_high = _index(min(north, 90.0), -90.0, 90.0, lat_bits)
+    lon_cells = 1 << lon_bits
+    lon_size = 360.0 / lon_cells
+    lon_low = math.floor((west + 180.0) / lon_size)
+    lon_high = math.floor((east + 180.0) / lon_size)
+    # Circles crossing the antimeridian wrap around to the other side
+    lon_indexes = {index % lon_cells for index in range(lon_low, min(lon_high, lon_low + lon_cells - 1) + 1)}
+    return sorted(
+        _encode(lat_index, lon_index, REGION_PRECISION)
+        for lat_index in range(lat_low, lat_high + 1)
+        for lon_index in lon_indexes
+    )
+
+
+def prefix_end(prefix: str) -> str:
+    """Smallest key after every key starting with prefix (BASE32 is in ASCII order)"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
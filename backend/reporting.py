@@ -0,0 +1,41 @@
+"""
+How often a client should report its location.
+
+Positions only matter for deciding who is near an emergency, so the
+closer a user is to an active one the more often they report and the
+smaller the move worth reporting. Far from any, reports can be rare, and
+rarer still in crowded areas, where many users write positions for the
+same few cells and one user's exact position adds little.
+"""
+
+from typing import NamedTuple, Optional
+
+
+class ReportingPlan(NamedTuple):
+    interval_seconds: int
+    min_displacement_m: int
+
+
+# (nearest active emergency within km, plan), checked in order
+NEAR_EMERGENCY_PLANS = (
+    (1.0, ReportingPlan(5, 10)),
+    (3.0, ReportingPlan(10, 25)),
+    (10.0, ReportingPlan(30, 100)),
+)
+QUIET_PLAN = ReportingPlan(120, 250)
+CROWDED_QUIET_PLAN = ReportingPlan(300, 500)
+
+# Users reporting from the same ~1km cell for it to count as crowded
+CROWDED_USERS = 50
+
+# Longest wait between reports of a client following the recommendations
+LONGEST_INTERVAL_SECONDS = CROWDED_QUIET_PLAN.interval_seconds
+
+
+def recommend(nearest_emergency_km: Optional[float], nearby_users: int) -> ReportingPlan:
+    """Plan for a user the given distance from the nearest active emergency (None if there is none)"""
+    if nearest_emergency_km is not None:
+        for within_km, plan in NEAR_EMERGENCY_PLANS:
+            if nearest_emergency_km <= within_km:
+                return plan
+    return CROWDED_QUIET_PLAN if nearby_users >= CROWDED_USERS else QUIET_PLAN
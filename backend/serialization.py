@@ -0,0 +1,54 @@
+from typing import Any, AsyncIterator, Dict, Optional, Type
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, StreamingResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Handlers that return an instance of this class directly skip FastAPI's
+    jsonable_encoder pass, so the content must already be plain JSON types
+    (dicts, lists, str, numbers, datetimes).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, int]:
+    """Mongo projection that returns exactly the fields of a response model"""
+    projection = {"_id": 0}
+    projection.update({name: 1 for name in model.model_fields})
+    return projection
+
+
+def lean_document(doc: Dict[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+    """Trust a projected document as a response item.
+
+    Documents written by this service already carry every model field in
+    model order, so they are used as-is. Older documents missing a field fall
+    back to model validation so defaults are filled in.
+    """
+    if len(doc) == len(model.model_fields):
+        return doc
+    return model(**doc).dict()
+
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+async def ndjson_lines(items: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode items one JSON document per line as they are produced"""
+    async for item in items:
+        yield orjson.dumps(item, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+def ndjson_response(items: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    return StreamingResponse(ndjson_lines(items), media_type=NDJSON_MEDIA_TYPE)
@@ -1,143 +1,203 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-import os
+from functools import lru_cache
 import logging
 import socketio
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
-import uuid
+from typing import Optional
 import hashlib
-from passlib.context import CryptContext
 from jose import JWTError, jwt
+from pydantic import ValidationError
 import math
 import secrets
+import time
+import asyncio
+from starlette.responses import PlainTextResponse, StreamingResponse
+from alerts import AlertBroker
+from archive import EmergencyArchiver, decode_history_cursor, encode_history_cursor
+from coalescing import SingleFlight
+from delta import SyncToken, decode_sync_token, encode_sync_token
+from compression import CompressionMiddleware
+from config import Config
+from entitlements import InvalidEntitlement, RevocationList, decode_entitlement, issue_entitlement, signing_key, timestamp
+from health import health_report, readiness_failures
+from profiling import ProfilerBusy, SamplingProfiler, SlowRequestLog, TracingMiddleware, span
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, LoopLagMonitor, MetricsMiddleware,
+    registry as metrics_registry, socketio_connected_clients, socketio_emits, socketio_fanout,
+)
+from geo import calculate_distance, cell_center, cell_of, cell_reach_km, cells_covering
+from geocache import GeoCache
+from geofence import GeofenceIndex
+from idempotency import Idempotency, IdempotencyConflict, IdempotencyMismatch
+from presence import PresenceIndex
+from push import PushDispatcher
+from reporting import LONGEST_INTERVAL_SECONDS, recommend
+from versions import ResourceVersions, content_etag, etag_matches
+from serialization import FastJSONResponse, lean_document, ndjson_response, wants_ndjson
+from storage import Store, open_store
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Security
 SECRET_KEY = "your-super-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-security = HTTPBearer()
+# Subscription entitlements (see entitlements.py) are short-lived so a
+# revocation only has to be remembered for this long
+ENTITLEMENT_KEY = signing_key(SECRET_KEY)
+ENTITLEMENT_TTL_SECONDS = 60 * 60
+
+# Set by create_app() from its Config
+ADMIN_TOKEN: Optional[str] = None
+slow_requests: Optional[SlowRequestLog] = None
+
+# Opened by the app's lifespan, so importing this module never connects anywhere
+store: Optional[Store] = None
+
+# Largest alert radius a user can configure (see UserSettingsUpdate)
+MAX_ALERT_DISTANCE_KM = 10.0
+# Alert radius of users who never saved settings
+DEFAULT_ALERT_DISTANCE_KM = 10.0
+
+# Socket.IO room of each signed-in client, and of clients that connected
+# without a token and still receive every alert
+USER_ROOM = "user:{}"
+ANONYMOUS_ROOM = "anonymous"
+
+# Chat ETags roll over with this bucket so messages ageing out of the 24h
+# window are eventually dropped even when nothing new is posted
+CHAT_ETAG_BUCKET_SECONDS = 300
+
+# Nearby reads coalesce per cell of this size (~1km) and whole-km radius:
+# one fetch covers everything any caller in the cell could see
+NEARBY_QUERY_CELL_DEG = 0.01
+
+# Nearby results are cached per query area until a write lands in it. Keys
+# also carry a time bucket so entries age out even without writes (chat
+# messages leave the 24h window, other workers' writes aren't seen). The
+# emergency ETag carries the same bucket, so a write on another worker
+# reaches a polling client within it.
+NEARBY_CACHE_SIZE = 4096
+EMERGENCY_CACHE_BUCKET_SECONDS = 60
+
+# Delta reads (since=) look this far behind their token so writes that
+# committed late, or on a worker with a skewed clock, aren't skipped.
+# Clients apply changes by id, so the overlap is harmless.
+DELTA_OVERLAP = timedelta(seconds=5)
+
+# Tokens older than this, or deltas with more changes, get the full list
+# instead. Must stay within the chat tombstone retention.
+DELTA_MAX_AGE = timedelta(hours=1)
+DELTA_MAX_CHANGES = 1000
+
+# Resolved emergencies move to the archive once no honoured sync token
+# can still be waiting to see them resolved
+EMERGENCY_ARCHIVE_AFTER = DELTA_MAX_AGE + 2 * DELTA_OVERLAP
+EMERGENCY_HISTORY_MAX_LIMIT = 100
+
+# Responses of POSTs sent with an Idempotency-Key are replayed to retries
+# for this long. The most recent ones are also kept in memory.
+IDEMPOTENCY_TTL = timedelta(hours=24)
+IDEMPOTENCY_CACHE_SIZE = 10000
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
 
-# Create the main app
-app = FastAPI()
+# Sections of /api/sync, in response order
+SYNC_SECTIONS = ("settings", "active_emergency", "emergencies", "chat", "device")
 
-# Create Socket.IO server
+# Streaming endpoints kept out of request latency metrics and slow-request traces
+LONG_LIVED_PATHS = ("/api/alerts/stream",)
+
+# Bodies below this size go out uncompressed, headers would eat the savings
+COMPRESSION_MIN_SIZE = 1024
+
+# Chat history is the largest and most repetitive payload and most phones
+# only offer gzip, so it gets a higher gzip level than other routes
+COMPRESSION_ROUTE_LEVELS = {
+    "/api/chat/nearby": {"gzip": 6},
+}
+
+security = HTTPBearer()
+
+# Socket.IO server. Handlers register on it at import; each app mounts it.
 sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode='asgi')
-socket_app = socketio.ASGIApp(sio)
+
+# Event loop lag sampler, started with the app
+loop_lag_monitor = LoopLagMonitor()
+
+# Entitlements revoked by unbinding, synced from the store by a background job
+entitlement_revocations = RevocationList(ENTITLEMENT_TTL_SECONDS)
+
+# SSE alert streams and the heartbeat keeping them open
+alert_broker = AlertBroker(MAX_ALERT_DISTANCE_KM)
+
+# Users whose own alert radius covers a point, kept in sync with locations and settings
+geofence = GeofenceIndex(DEFAULT_ALERT_DISTANCE_KM)
+
+# Push notifications for recipients with no open socket or stream, and the
+# job reading their receipts
+push_dispatcher = PushDispatcher()
+
+# Moves resolved emergencies out of the live collection
+emergency_archiver = EmergencyArchiver(EMERGENCY_ARCHIVE_AFTER)
+
+# Background tasks the app runs, reported by /healthz and required by /readyz
+BACKGROUND_JOBS = {
+    "loop_lag_monitor": loop_lag_monitor,
+    "entitlement_revocations": entitlement_revocations,
+    "alert_heartbeat": alert_broker,
+    "geofence_sync": geofence,
+    "push_receipts": push_dispatcher,
+    "emergency_archiver": emergency_archiver,
+}
+
+# Profiling surface for the admin endpoints
+profiler = SamplingProfiler()
+
+# Versions behind the ETags of nearby queries: the settings they use and the cells they cover
+resource_versions = ResourceVersions()
+
+# In-flight nearby fetches shared by concurrent identical queries, and the
+# cache of their results
+emergency_flights = SingleFlight("emergencies_nearby")
+chat_flights = SingleFlight("chat_nearby")
+emergency_cache = GeoCache("emergencies_nearby", NEARBY_CACHE_SIZE)
+chat_cache = GeoCache("chat_nearby", NEARBY_CACHE_SIZE)
+
+# Idempotency-Key reservations and replayed responses
+idempotency = Idempotency(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+
+# Who reported their location lately, for the density behind reporting intervals
+presence = PresenceIndex(2 * LONGEST_INTERVAL_SECONDS)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Models
-class UserCreate(BaseModel):
-    email: EmailStr
-    password: str
-    name: str
-    vehicle_plate: str
-
-class UserLogin(BaseModel):
-    email: EmailStr
-    password: str
-
-class PasswordResetRequest(BaseModel):
-    email: EmailStr
-
-class PasswordReset(BaseModel):
-    token: str
-    new_password: str
-
-class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    email: str
-    name: str
-    vehicle_plate: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-
-class UserSettings(BaseModel):
-    emergency_contacts: List[str] = Field(default_factory=list)  # Phone numbers
-    alert_distance_km: float = Field(default=10.0)  # Distance in kilometers
-
-class UserSettingsUpdate(BaseModel):
-    emergency_contacts: List[str] = Field(..., min_items=1, max_items=5)
-    alert_distance_km: float = Field(..., ge=0.001, le=10.0)  # 1m to 10km
-
-class DeviceBinding(BaseModel):
-    user_id: str
-    device_id: str
-    device_name: str
-    device_brand: str
-    subscription_type: str
-    bound_at: datetime = Field(default_factory=datetime.utcnow)
-
-class SubscriptionUpdate(BaseModel):
-    device_id: str
-    device_name: str
-    device_brand: str
-    subscription_type: str
-    expires_at: datetime
-
-class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    user_id: str
-    user_name: str
-    message: str
-    latitude: float
-    longitude: float
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    message_type: str = "text"  # text, emergency, location
-
-class ChatMessageCreate(BaseModel):
-    message: str
-    latitude: float
-    longitude: float
-    message_type: str = "text"
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-    user: User
-
-class EmergencyCreate(BaseModel):
-    latitude: float
-    longitude: float
-
-class Emergency(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    user_id: str
-    user_name: str
-    vehicle_plate: str
-    latitude: float
-    longitude: float
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    is_active: bool = True
-
-class UserLocation(BaseModel):
-    user_id: str
-    latitude: float
-    longitude: float
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+from models import (
+    UserCreate, UserLogin, PasswordResetRequest, PasswordReset, User, UserSettings,
+    UserSettingsUpdate, DeviceBinding, SubscriptionUpdate, ChatMessage, ChatMessageCreate,
+    Token, EmergencyCreate, Emergency, UserLocation, PushTokenRegistration,
+)
 
 # Helper functions
+@lru_cache(maxsize=None)
+def password_context():
+    """bcrypt context, built on first use instead of at import"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -149,35 +209,326 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_access_token(token: str) -> Optional[str]:
+    """User id of a valid access token, else None"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    with span("auth"):
+        user_id = decode_access_token(credentials.credentials)
         if user_id is None:
             raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+        
+        user = await store.users.get_by_id(user_id)
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        return User(**user)
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def live_entitlement(token: Optional[str], user_id: str, device_id: Optional[str]) -> Optional[dict]:
+    """Claims of token if it is an unrevoked entitlement of this user on this device"""
+    if not token or not device_id:
+        return None
+    try:
+        claims = decode_entitlement(ENTITLEMENT_KEY, token)
+    except InvalidEntitlement:
+        return None
+    if claims["sub"] != user_id or claims["dev"] != device_id or entitlement_revocations.is_revoked(claims):
+        return None
+    return claims
+
+async def revoke_entitlements(user_id: str):
+    now = time.time()
+    entitlement_revocations.revoke(user_id, now)
+    await store.subscriptions.add_revocation(
+        user_id, now, datetime.utcfromtimestamp(now + ENTITLEMENT_TTL_SECONDS)
+    )
+
+async def settings_for(user_id: str) -> UserSettings:
+    settings = await store.settings.get(user_id)
+    
+    if not settings:
+        # Return default settings
+        default_settings = UserSettings()
+        return default_settings
+    
+    return UserSettings(**settings)
+
+async def device_status(user_id: str, device_id: str, entitlement: Optional[str]) -> Optional[dict]:
+    """Subscription bound to the device, with a fresh entitlement while it lasts; None if not bound"""
+    # A live entitlement answers without touching the bindings or subscriptions
+    claims = live_entitlement(entitlement, user_id, device_id)
+    if claims is not None:
+        return {
+            "device_bound": True,
+            "device_name": claims["dnm"],
+            "subscription_type": claims["typ"],
+            "expires_at": datetime.utcfromtimestamp(claims["sxp"]),
+            "entitlement": entitlement,
+            "entitlement_expires_at": claims["exp"],
+        }
+    
+    binding = await store.subscriptions.get_binding_for_device(user_id, device_id)
+    
+    if not binding:
+        return None
+    
+    subscription = await store.subscriptions.get_expiry(user_id)
+    expires_at = subscription.get("expires_at") if subscription else None
+    
+    response = {
+        "device_bound": True,
+        "device_name": binding["device_name"],
+        "subscription_type": binding["subscription_type"],
+        "expires_at": expires_at
+    }
+    now = time.time()
+    if expires_at is not None and timestamp(expires_at) > now:
+        response.update(issue_entitlement(
+            ENTITLEMENT_KEY, user_id, {**binding, "device_id": device_id}, expires_at,
+            now, ENTITLEMENT_TTL_SECONDS,
+        ))
+    return response
+
+async def get_alert_distance(user_id: str) -> float:
+    """User's alert radius in kilometers (10km when no settings are stored)"""
+    alert_distance = await store.settings.get_alert_distance(user_id)
+    return alert_distance if alert_distance is not None else DEFAULT_ALERT_DISTANCE_KM
+
+def nearby_item(doc, model, latitude, longitude, alert_distance):
+    """Response item for a projected document within alert_distance of the point, else None"""
+    distance = calculate_distance(latitude, longitude, doc["latitude"], doc["longitude"])
+    if distance > alert_distance:
+        return None
+    # Copy, documents may be shared between concurrent requests
+    return {**lean_document(doc, model), "distance_km": round(distance, 2)}
+
+async def stream_nearby(documents, model, latitude, longitude, alert_distance, exclude_user_id=None, limit=None):
+    """Yield nearby items as documents come out of the store, one batch in memory at a time"""
+    sent = 0
+    try:
+        async for doc in documents:
+            if doc["user_id"] == exclude_user_id:
+                continue
+            item = nearby_item(doc, model, latitude, longitude, alert_distance)
+            if item is None:
+                continue
+            yield item
+            sent += 1
+            if limit is not None and sent >= limit:
+                break
+    finally:
+        await documents.aclose()
+
+def nearby_area(latitude, longitude, radius_km):
+    """Query cell and whole-km radius shared by nearby queries, and the center and reach one fetch must cover"""
+    cell = cell_of(latitude, longitude, NEARBY_QUERY_CELL_DEG)
+    radius = math.ceil(radius_km)
+    center_lat, center_lon = cell_center(cell, NEARBY_QUERY_CELL_DEG)
+    return (cell, radius), center_lat, center_lon, radius + cell_reach_km(cell, NEARBY_QUERY_CELL_DEG)
+
+async def cached_nearby(cache, flight, key, center_lat, center_lon, reach, fetch):
+    """Cached result for the area, else one shared fetch that fills the cache"""
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    return await flight.run(key, lambda: cache.fetch(key, center_lat, center_lon, reach, fetch))
+
+async def active_emergencies_near(latitude, longitude, radius_km):
+    """Active emergencies that may lie within radius_km, fetched once per area for concurrent callers,
+    and the time they were read from the store"""
+    area, center_lat, center_lon, reach = nearby_area(latitude, longitude, radius_km)
+    key = (area, int(time.time() // EMERGENCY_CACHE_BUCKET_SECONDS))
+    
+    async def fetch():
+        read_at = datetime.utcnow()
+        return await store.emergencies.find_active_near(center_lat, center_lon, reach, 1000), read_at
+    
+    return await cached_nearby(emergency_cache, emergency_flights, key, center_lat, center_lon, reach, fetch)
+
+async def recent_chat_near(latitude, longitude, radius_km, limit):
+    """Last 24 hours of chat that may lie within radius_km, newest first, fetched once per area and limit,
+    and the time they were read from the store"""
+    area, center_lat, center_lon, reach = nearby_area(latitude, longitude, radius_km)
+    key = (area, limit, int(time.time() // CHAT_ETAG_BUCKET_SECONDS))
+    
+    async def fetch():
+        read_at = datetime.utcnow()
+        twenty_four_hours_ago = read_at - timedelta(hours=24)
+        # Get more than the limit since some fall outside the radius
+        messages = await store.chat.find_recent_near(center_lat, center_lon, reach, twenty_four_hours_ago, limit * 3)
+        return messages, read_at
+    
+    return await cached_nearby(chat_cache, chat_flights, key, center_lat, center_lon, reach, fetch)
+
+async def nearby_emergency_items(user_id, latitude, longitude, alert_distance):
+    """Other users' active emergencies within alert_distance, with their distance, and when they were read"""
+    # Get active emergencies around the user, shared with concurrent callers nearby
+    emergencies, read_at = await active_emergencies_near(latitude, longitude, alert_distance)
     
-    user = await db.users.find_one({"id": user_id})
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return User(**user)
+    # Filter emergencies within user's preferred radius
+    nearby_emergencies = []
+    with span("compute"):
+        for emergency in emergencies:
+            if emergency["user_id"] != user_id:  # Don't show own emergency
+                item = nearby_item(emergency, Emergency, latitude, longitude, alert_distance)
+                if item is not None:  # Within user's preferred radius
+                    nearby_emergencies.append(item)
+    return nearby_emergencies, read_at
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in kilometers using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
+async def nearby_chat_items(latitude, longitude, alert_distance, limit):
+    """Up to limit chat messages of the last 24 hours within alert_distance, newest first, and when they were read"""
+    # Get recent chat messages around the user, shared with concurrent callers nearby
+    chat_messages, read_at = await recent_chat_near(latitude, longitude, alert_distance, limit)
     
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
+    # Filter messages within user's preferred radius
+    nearby_messages = []
+    with span("compute"):
+        for message in chat_messages:
+            item = nearby_item(message, ChatMessage, latitude, longitude, alert_distance)
+            if item is not None:
+                nearby_messages.append(item)
+    
+    # Return only the requested limit
+    return nearby_messages[:limit], read_at
+
+def sync_token(latitude, longitude, alert_distance, at):
+    """Token for a list read from the store at a time: a cached list's, not the response's, so the
+    next delta also covers what was written after the cache was filled"""
+    return encode_sync_token(SyncToken(at, latitude, longitude, alert_distance))
+
+def delta_start(since, latitude, longitude, alert_distance, now):
+    """Time to read changes from for a client's sync token, None if it needs the full list"""
+    token = decode_sync_token(since)
+    if (token is None or (token.latitude, token.longitude) != (latitude, longitude)
+            or token.radius_km != alert_distance or token.at < now - DELTA_MAX_AGE):
+        return None
+    return token.at - DELTA_OVERLAP
+
+async def emergency_changes(user_id, latitude, longitude, alert_distance, start):
+    """Emergencies that appeared in or left the user's nearby list since start, None if too many"""
+    changed = await store.emergencies.find_changed_near(
+        latitude, longitude, alert_distance, start, DELTA_MAX_CHANGES + 1
+    )
+    if len(changed) > DELTA_MAX_CHANGES:
+        return None
+    items, removed = [], []
+    with span("compute"):
+        for emergency in changed:
+            if not emergency["is_active"]:
+                removed.append(emergency["id"])
+            elif emergency["user_id"] != user_id:
+                item = nearby_item(emergency, Emergency, latitude, longitude, alert_distance)
+                if item is not None:
+                    items.append(item)
+    return {"items": items, "removed": removed}
+
+async def chat_changes(latitude, longitude, alert_distance, limit, start):
+    """Messages posted and deleted near the user since start, None if too many"""
+    posted, deleted = await asyncio.gather(
+        store.chat.find_posted_near(latitude, longitude, alert_distance, start, DELTA_MAX_CHANGES + 1),
+        store.chat.find_deleted_near(latitude, longitude, alert_distance, start, DELTA_MAX_CHANGES + 1),
+    )
+    if len(posted) > DELTA_MAX_CHANGES or len(deleted) > DELTA_MAX_CHANGES:
+        return None
+    items = []
+    with span("compute"):
+        for message in posted:
+            item = nearby_item(message, ChatMessage, latitude, longitude, alert_distance)
+            if item is not None:
+                items.append(item)
+    return {"items": items[:limit], "removed": [message["id"] for message in deleted]}
+
+def delta_response(changes, full, token, etag):
+    """Body of a delta read: the changes, or the full list with reset set"""
+    if changes is None:
+        changes = {"reset": True, "items": full, "removed": []}
+    else:
+        changes = {"reset": False, **changes}
+    with span("serialize"):
+        return FastJSONResponse({**changes, "sync_token": token}, headers={"ETag": etag})
+
+def area_changed(kind, latitude, longitude):
+    """Record a write of an emergency or chat message at a position: new ETags, cached results dropped"""
+    resource_versions.bump((kind, cell_of(latitude, longitude)))
+    (emergency_cache if kind == "emergencies" else chat_cache).invalidate(latitude, longitude)
+
+def nearby_etag(kind, user_id, latitude, longitude, *params):
+    """ETag of a nearby query: the user's settings plus every cell a maximum radius can reach"""
+    keys = [("settings", user_id)]
+    keys += [(kind, cell) for cell in cells_covering(latitude, longitude, MAX_ALERT_DISTANCE_KM)]
+    return resource_versions.etag(keys, user_id, latitude, longitude, *params)
+
+def not_modified_response(etag):
+    return Response(status_code=304, headers={"ETag": etag})
+
+async def idempotent(route, user_id, idempotency_key, payload, execute):
+    """Run execute once per Idempotency-Key, replaying its response to retries instead of writing again"""
+    if idempotency_key is None:
+        return await execute()
+    if not idempotency_key or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
     
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    distance = R * c
+    async def run():
+        return (await execute()).dict()
     
-    return distance
+    try:
+        response, replayed = await idempotency.run(
+            store.idempotency, f"{route}:{user_id}:{idempotency_key}", payload, run
+        )
+    except IdempotencyMismatch:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    return FastJSONResponse(response, headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+async def emit_event(event, data, room=None, latitude=None, longitude=None, recipients=None):
+    """Emit a Socket.IO event, recording it and how many clients it targets.
+    Broadcasts also go to the SSE alert streams near latitude/longitude.
+    With recipients, Socket.IO sends it only to those users and to anonymous clients."""
+    if recipients is not None:
+        alert_broker.publish(event, data, latitude, longitude, recipients=recipients)
+        room = [USER_ROOM.format(user_id) for user_id in recipients] + [ANONYMOUS_ROOM]
+        fanout = sum(1 for _ in sio.manager.get_participants("/", room))
+    elif room is None:
+        alert_broker.publish(event, data, latitude, longitude)
+        fanout = socketio_connected_clients.value()
+    else:
+        fanout = sum(1 for _ in sio.manager.get_participants("/", room))
+    socketio_emits.inc(event)
+    socketio_fanout.observe(fanout, event)
+    with span("emit"):
+        await sio.emit(event, data, room=room)
+
+def is_online(user_id: str) -> bool:
+    """Whether the user has a signed-in socket or an alert stream on this worker"""
+    if alert_broker.connected(user_id):
+        return True
+    return any(True for _ in sio.manager.get_participants("/", USER_ROOM.format(user_id)))
+
+def push_offline(user_ids, title, body, data):
+    """Push to the devices of users who can't get the event live, without waiting on it"""
+    offline = [user_id for user_id in user_ids if not is_online(user_id)]
+    if not offline or not push_dispatcher.running:
+        return
+    
+    async def messages():
+        tokens = await store.push_tokens.tokens_for(offline)
+        return [
+            {"to": token["token"], "title": title, "body": body, "data": data, "sound": "default", "priority": "high"}
+            for token in tokens
+        ]
+    
+    push_dispatcher.submit(messages)
 
 async def send_reset_email(email: str, reset_token: str):
     """Send password reset email (simplified version for demo)"""
@@ -205,8 +556,7 @@ async def send_reset_email(email: str, reset_token: str):
 @api_router.post("/forgot-password")
 async def forgot_password(request: PasswordResetRequest):
     # Check if user exists
-    user = await db.users.find_one({"email": request.email})
-    if not user:
+    if not await store.users.email_exists(request.email):
         # Don't reveal if email exists or not for security
         return {"message": "If the email exists, a reset link will be sent"}
     
@@ -215,7 +565,7 @@ async def forgot_password(request: PasswordResetRequest):
     expires_at = datetime.utcnow() + timedelta(minutes=15)  # 15 minutes expiry
     
     # Store reset token in database
-    await db.password_resets.insert_one({
+    await store.password_resets.insert({
         "email": request.email,
         "token": reset_token,
         "expires_at": expires_at,
@@ -234,38 +584,25 @@ async def forgot_password(request: PasswordResetRequest):
 @api_router.post("/reset-password")
 async def reset_password(request: PasswordReset):
     # Find valid reset token
-    reset_record = await db.password_resets.find_one({
-        "token": request.token,
-        "used": False,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
+    reset_record = await store.password_resets.find_valid(request.token, datetime.utcnow())
     
     if not reset_record:
         raise HTTPException(status_code=400, detail="Invalid or expired reset token")
     
     # Update user password
     hashed_password = get_password_hash(request.new_password)
-    result = await db.users.update_one(
-        {"email": reset_record["email"]},
-        {"$set": {"password": hashed_password}}
-    )
-    
-    if result.matched_count == 0:
+    if not await store.users.set_password(reset_record["email"], hashed_password):
         raise HTTPException(status_code=404, detail="User not found")
     
     # Mark token as used
-    await db.password_resets.update_one(
-        {"token": request.token},
-        {"$set": {"used": True}}
-    )
+    await store.password_resets.mark_used(request.token)
     
     return {"message": "Password reset successfully"}
 
 @api_router.post("/register", response_model=Token)
 async def register(user_create: UserCreate):
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_create.email})
-    if existing_user:
+    if await store.users.email_exists(user_create.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
@@ -275,7 +612,7 @@ async def register(user_create: UserCreate):
     user_obj = User(**{k: v for k, v in user_dict.items() if k != "password"})
     
     # Save to database
-    await db.users.insert_one({**user_obj.dict(), "password": hashed_password})
+    await store.users.insert({**user_obj.dict(), "password": hashed_password})
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -288,7 +625,7 @@ async def register(user_create: UserCreate):
 @api_router.post("/login", response_model=Token)
 async def login(user_login: UserLogin):
     # Find user
-    user_data = await db.users.find_one({"email": user_login.email})
+    user_data = await store.users.get_for_login(user_login.email)
     if not user_data or not verify_password(user_login.password, user_data["password"]):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     
@@ -304,14 +641,19 @@ async def login(user_login: UserLogin):
 
 # Emergency endpoints
 @api_router.post("/emergency", response_model=Emergency)
-async def create_emergency(emergency_create: EmergencyCreate, current_user: User = Depends(get_current_user)):
+async def create_emergency(
+    emergency_create: EmergencyCreate,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    return await idempotent(
+        "emergency", current_user.id, idempotency_key, emergency_create.dict(),
+        lambda: raise_emergency(emergency_create, current_user)
+    )
+
+async def raise_emergency(emergency_create: EmergencyCreate, current_user: User) -> Emergency:
     # Check if user already has an active emergency
-    existing_emergency = await db.emergencies.find_one({
-        "user_id": current_user.id,
-        "is_active": True
-    })
-    
-    if existing_emergency:
+    if await store.emergencies.has_active(current_user.id):
         raise HTTPException(status_code=400, detail="You already have an active emergency")
     
     # Create emergency
@@ -324,61 +666,100 @@ async def create_emergency(emergency_create: EmergencyCreate, current_user: User
     )
     
     # Save to database
-    await db.emergencies.insert_one(emergency_obj.dict())
-    
-    # Notify nearby users via WebSocket
-    await sio.emit('emergency_alert', {
+    await store.emergencies.insert(emergency_obj.dict())
+    area_changed("emergencies", emergency_obj.latitude, emergency_obj.longitude)
+    
+    # Notify the users whose own alert radius covers it
+    with span("geofence"):
+        recipients = geofence.covering(emergency_obj.latitude, emergency_obj.longitude)
+        recipients.discard(current_user.id)
+    await emit_event('emergency_alert', {
         'emergency_id': emergency_obj.id,
         'user_name': emergency_obj.user_name,
         'vehicle_plate': emergency_obj.vehicle_plate,
         'latitude': emergency_obj.latitude,
         'longitude': emergency_obj.longitude,
         'created_at': emergency_obj.created_at.isoformat()
-    })
+    }, latitude=emergency_obj.latitude, longitude=emergency_obj.longitude, recipients=recipients)
+    push_offline(
+        recipients,
+        "EMERGÊNCIA PRÓXIMA!",
+        f"{emergency_obj.user_name} ({emergency_obj.vehicle_plate}) precisa de ajuda!",
+        {"type": "emergency_alert", "emergency_id": emergency_obj.id,
+         "latitude": emergency_obj.latitude, "longitude": emergency_obj.longitude},
+    )
     
     return emergency_obj
 
-@api_router.get("/emergencies/nearby")
+@api_router.get("/emergencies/nearby", response_class=FastJSONResponse)
 async def get_nearby_emergencies(
     latitude: float,
     longitude: float,
+    since: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    # Get user's settings for alert distance
-    user_settings = await db.user_settings.find_one({"user_id": current_user.id})
-    alert_distance = user_settings.get("alert_distance_km", 10.0) if user_settings else 10.0
-    
-    # Get all active emergencies
-    emergencies = await db.emergencies.find({"is_active": True}).to_list(1000)
+    """Active emergencies around the user.
+    
+    Responses carry a sync token (X-Sync-Token, or sync_token in deltas).
+    Passing it back as since returns {"reset", "items", "removed", "sync_token"}:
+    only emergencies raised or resolved since, unless reset is set, in
+    which case items is the whole list.
+    """
+    ndjson = wants_ndjson(accept)
+    etag = nearby_etag(
+        "emergencies", current_user.id, latitude, longitude, ndjson, since,
+        int(time.time() // EMERGENCY_CACHE_BUCKET_SECONDS)
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
     
-    # Filter emergencies within user's preferred radius
-    nearby_emergencies = []
-    for emergency in emergencies:
-        if emergency["user_id"] != current_user.id:  # Don't show own emergency
-            distance = calculate_distance(
-                latitude, longitude,
-                emergency["latitude"], emergency["longitude"]
-            )
-            if distance <= alert_distance:  # Within user's preferred radius
-                emergency_obj = Emergency(**emergency)
-                nearby_emergencies.append({
-                    **emergency_obj.dict(),
-                    "distance_km": round(distance, 2)
-                })
-    
-    return nearby_emergencies
+    # Get user's settings for alert distance
+    alert_distance = await get_alert_distance(current_user.id)
+    now = datetime.utcnow()
+    
+    if since is not None:
+        start = delta_start(since, latitude, longitude, alert_distance, now)
+        changes = None
+        if start is not None:
+            changes = await emergency_changes(current_user.id, latitude, longitude, alert_distance, start)
+        full, read_at = None, now
+        if changes is None:
+            full, read_at = await nearby_emergency_items(current_user.id, latitude, longitude, alert_distance)
+        return delta_response(changes, full, sync_token(latitude, longitude, alert_distance, read_at), etag)
+    
+    if ndjson:
+        # Stream matches as they arrive instead of buffering the whole result
+        response = ndjson_response(stream_nearby(
+            store.emergencies.iter_active_near(latitude, longitude, alert_distance), Emergency, latitude, longitude, alert_distance,
+            exclude_user_id=current_user.id
+        ))
+        response.headers["ETag"] = etag
+        response.headers["X-Sync-Token"] = sync_token(latitude, longitude, alert_distance, now)
+        return response
+    
+    nearby_emergencies, read_at = await nearby_emergency_items(current_user.id, latitude, longitude, alert_distance)
+    token = sync_token(latitude, longitude, alert_distance, read_at)
+    
+    with span("serialize"):
+        return FastJSONResponse(nearby_emergencies, headers={"ETag": etag, "X-Sync-Token": token})
 
 # User Settings endpoints
 @api_router.get("/settings", response_model=UserSettings)
-async def get_user_settings(current_user: User = Depends(get_current_user)):
-    settings = await db.user_settings.find_one({"user_id": current_user.id})
-    
-    if not settings:
-        # Return default settings
-        default_settings = UserSettings()
-        return default_settings
-    
-    return UserSettings(**{k: v for k, v in settings.items() if k != "_id" and k != "user_id"})
+async def get_user_settings(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    settings = await settings_for(current_user.id)
+    # From the stored settings, so a change made through another worker shows
+    etag = content_etag(current_user.id, settings.dict())
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    
+    return settings
 
 # Device Binding endpoints
 @api_router.post("/subscription/bind-device")
@@ -387,10 +768,9 @@ async def bind_device_to_subscription(
     current_user: User = Depends(get_current_user)
 ):
     # Check if this subscription is already bound to another device
-    existing_binding = await db.device_bindings.find_one({
-        "user_id": current_user.id,
-        "subscription_type": subscription_data.subscription_type
-    })
+    existing_binding = await store.subscriptions.get_binding_for_type(
+        current_user.id, subscription_data.subscription_type
+    )
     
     if existing_binding and existing_binding["device_id"] != subscription_data.device_id:
         raise HTTPException(
@@ -407,54 +787,71 @@ async def bind_device_to_subscription(
         subscription_type=subscription_data.subscription_type
     )
     
-    await db.device_bindings.update_one(
-        {"user_id": current_user.id},
-        {"$set": binding_data.dict()},
-        upsert=True
-    )
+    # Tokens for whatever was bound before no longer apply
+    await revoke_entitlements(current_user.id)
+    await store.subscriptions.bind_device(current_user.id, binding_data.dict())
     
     # Update user subscription
-    await db.user_subscriptions.update_one(
-        {"user_id": current_user.id},
-        {"$set": {
-            "type": subscription_data.subscription_type,
-            "expires_at": subscription_data.expires_at,
-            "device_id": subscription_data.device_id,
-            "updated_at": datetime.utcnow()
-        }},
-        upsert=True
-    )
+    await store.subscriptions.update_subscription(current_user.id, {
+        "type": subscription_data.subscription_type,
+        "expires_at": subscription_data.expires_at,
+        "device_id": subscription_data.device_id,
+        "updated_at": datetime.utcnow()
+    })
     
-    return {"message": "Device bound to subscription successfully"}
+    return {
+        "message": "Device bound to subscription successfully",
+        **issue_entitlement(
+            ENTITLEMENT_KEY, current_user.id, binding_data.dict(), subscription_data.expires_at,
+            time.time(), ENTITLEMENT_TTL_SECONDS,
+        ),
+    }
 
 @api_router.get("/subscription/check-device")
 async def check_device_binding(
     device_id: str,
+    x_entitlement: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    binding = await db.device_bindings.find_one({
-        "user_id": current_user.id,
-        "device_id": device_id
-    })
+    status = await device_status(current_user.id, device_id, x_entitlement)
     
-    if not binding:
+    if status is None:
         raise HTTPException(status_code=404, detail="No subscription found for this device")
-    
-    subscription = await db.user_subscriptions.find_one({"user_id": current_user.id})
-    
-    return {
-        "device_bound": True,
-        "device_name": binding["device_name"],
-        "subscription_type": binding["subscription_type"],
-        "expires_at": subscription.get("expires_at") if subscription else None
-    }
+    return status
+
+@api_router.post("/subscription/unbind-device")
+async def unbind_device(current_user: User = Depends(get_current_user)):
+    """Free the subscription for another device, voiding entitlements already handed out"""
+    binding = await store.subscriptions.unbind_device(current_user.id)
+    if not binding:
+        raise HTTPException(status_code=404, detail="No device bound to this subscription")
+    await revoke_entitlements(current_user.id)
+    return {"message": "Device unbound from subscription", "device_id": binding["device_id"]}
 
 # Chat endpoints
+@api_router.post("/push/register")
+async def register_push_token(registration: PushTokenRegistration, current_user: User = Depends(get_current_user)):
+    """Receive emergency alerts as push notifications on this device while the app has no connection"""
+    await store.push_tokens.register(current_user.id, registration.token, datetime.utcnow())
+    return {"message": "Push token registered"}
+
+@api_router.post("/push/unregister")
+async def unregister_push_token(registration: PushTokenRegistration, current_user: User = Depends(get_current_user)):
+    await store.push_tokens.unregister(current_user.id, registration.token)
+    return {"message": "Push token removed"}
+
 @api_router.post("/chat/send", response_model=ChatMessage)
 async def send_chat_message(
     message_data: ChatMessageCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
+    return await idempotent(
+        "chat", current_user.id, idempotency_key, message_data.dict(),
+        lambda: post_chat_message(message_data, current_user)
+    )
+
+async def post_chat_message(message_data: ChatMessageCreate, current_user: User) -> ChatMessage:
     # Create chat message
     chat_message = ChatMessage(
         user_id=current_user.id,
@@ -466,14 +863,14 @@ async def send_chat_message(
     )
     
     # Save to database
-    await db.chat_messages.insert_one(chat_message.dict())
+    await store.chat.insert(chat_message.dict())
+    area_changed("chat", chat_message.latitude, chat_message.longitude)
     
     # Get user's alert distance preference
-    user_settings = await db.user_settings.find_one({"user_id": current_user.id})
-    alert_distance = user_settings.get("alert_distance_km", 10.0) if user_settings else 10.0
+    alert_distance = await get_alert_distance(current_user.id)
     
     # Emit to nearby users via WebSocket
-    await sio.emit('new_chat_message', {
+    await emit_event('new_chat_message', {
         'message_id': chat_message.id,
         'user_name': chat_message.user_name,
         'message': chat_message.message,
@@ -482,58 +879,79 @@ async def send_chat_message(
         'message_type': chat_message.message_type,
         'created_at': chat_message.created_at.isoformat(),
         'alert_distance_km': alert_distance
-    })
+    }, latitude=chat_message.latitude, longitude=chat_message.longitude)
     
     return chat_message
 
-@api_router.get("/chat/nearby")
+@api_router.get("/chat/nearby", response_class=FastJSONResponse)
 async def get_nearby_chat_messages(
     latitude: float,
     longitude: float,
     limit: int = 50,
+    since: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    # Get user's alert distance preference
-    user_settings = await db.user_settings.find_one({"user_id": current_user.id})
-    alert_distance = user_settings.get("alert_distance_km", 10.0) if user_settings else 10.0
-    
-    # Get recent chat messages (last 24 hours)
-    twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
-    
-    chat_messages = await db.chat_messages.find({
-        "created_at": {"$gte": twenty_four_hours_ago}
-    }).sort("created_at", -1).limit(limit * 3).to_list(limit * 3)  # Get more to filter by distance
-    
-    # Filter messages within user's preferred radius
-    nearby_messages = []
-    for message in chat_messages:
-        distance = calculate_distance(
-            latitude, longitude,
-            message["latitude"], message["longitude"]
-        )
-        if distance <= alert_distance:
-            message_obj = ChatMessage(**message)
-            nearby_messages.append({
-                **message_obj.dict(),
-                "distance_km": round(distance, 2)
-            })
+    """Last 24 hours of chat around the user, newest first.
+    
+    since works as for /emergencies/nearby, with removed listing deleted
+    messages. Clients doing deltas drop messages older than 24 hours
+    themselves.
+    """
+    ndjson = wants_ndjson(accept)
+    etag = nearby_etag(
+        "chat", current_user.id, latitude, longitude, limit, ndjson, since,
+        int(time.time() // CHAT_ETAG_BUCKET_SECONDS)
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
     
-    # Return only the requested limit
-    return nearby_messages[:limit]
+    # Get user's alert distance preference
+    alert_distance = await get_alert_distance(current_user.id)
+    now = datetime.utcnow()
+    
+    if since is not None:
+        start = delta_start(since, latitude, longitude, alert_distance, now)
+        changes = None
+        if start is not None:
+            changes = await chat_changes(latitude, longitude, alert_distance, limit, start)
+        full, read_at = None, now
+        if changes is None:
+            full, read_at = await nearby_chat_items(latitude, longitude, alert_distance, limit)
+        return delta_response(changes, full, sync_token(latitude, longitude, alert_distance, read_at), etag)
+    
+    if ndjson:
+        # Get recent chat messages (last 24 hours), more than the limit since some fall outside the radius
+        twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
+        response = ndjson_response(stream_nearby(
+            store.chat.iter_recent_near(latitude, longitude, alert_distance, twenty_four_hours_ago, limit * 3),
+            ChatMessage, latitude, longitude, alert_distance, limit=limit
+        ))
+        response.headers["ETag"] = etag
+        response.headers["X-Sync-Token"] = sync_token(latitude, longitude, alert_distance, now)
+        return response
+    
+    nearby_messages, read_at = await nearby_chat_items(latitude, longitude, alert_distance, limit)
+    token = sync_token(latitude, longitude, alert_distance, read_at)
+    
+    with span("serialize"):
+        return FastJSONResponse(nearby_messages, headers={"ETag": etag, "X-Sync-Token": token})
 
 @api_router.delete("/chat/{message_id}")
 async def delete_chat_message(message_id: str, current_user: User = Depends(get_current_user)):
     # Only allow user to delete their own messages
-    result = await db.chat_messages.delete_one({
-        "id": message_id,
-        "user_id": current_user.id
-    })
+    message = await store.chat.delete_own(message_id, current_user.id)
     
-    if result.deleted_count == 0:
+    if not message:
         raise HTTPException(status_code=404, detail="Message not found or not authorized")
+    area_changed("chat", message["latitude"], message["longitude"])
     
     # Notify via WebSocket that message was deleted
-    await sio.emit('chat_message_deleted', {'message_id': message_id})
+    await emit_event(
+        'chat_message_deleted', {'message_id': message_id},
+        latitude=message["latitude"], longitude=message["longitude"]
+    )
     
     return {"message": "Chat message deleted"}
 
@@ -557,109 +975,243 @@ async def update_user_settings(
     settings_dict["updated_at"] = datetime.utcnow()
     
     # Update or insert user settings
-    await db.user_settings.update_one(
-        {"user_id": current_user.id},
-        {"$set": settings_dict},
-        upsert=True
-    )
+    await store.settings.upsert(current_user.id, settings_dict)
+    resource_versions.bump(("settings", current_user.id))
+    geofence.set_radius(current_user.id, settings_update.alert_distance_km, settings_dict["updated_at"])
     
     return UserSettings(**{k: v for k, v in settings_dict.items() if k != "_id" and k != "user_id" and k != "updated_at"})
 
+@api_router.get("/emergencies/history", response_class=FastJSONResponse)
+async def get_emergency_history(
+    limit: int = 20,
+    before: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """The user's resolved emergencies, newest first, a page at a time.
+    
+    Returns {"items", "next"}; passing next back as before returns the
+    following page. next is null on the last page.
+    """
+    position = None
+    if before is not None:
+        position = decode_history_cursor(before)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Invalid history cursor")
+    limit = max(1, min(limit, EMERGENCY_HISTORY_MAX_LIMIT))
+    # One more than the page shows whether another follows
+    emergencies = await store.emergencies.find_history(current_user.id, position, limit + 1)
+    page = emergencies[:limit]
+    with span("serialize"):
+        return FastJSONResponse({
+            "items": [lean_document(emergency, Emergency) for emergency in page],
+            "next": encode_history_cursor(page[-1]) if len(emergencies) > limit else None,
+        })
+
 @api_router.get("/user/active-emergency")
-async def get_user_active_emergency(current_user: User = Depends(get_current_user)):
+async def get_user_active_emergency(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     # Get user's active emergency
-    emergency = await db.emergencies.find_one({
-        "user_id": current_user.id,
-        "is_active": True
-    })
+    emergency = await store.emergencies.get_active_for_user(current_user.id)
     
     if not emergency:
         raise HTTPException(status_code=404, detail="No active emergency found")
     
-    return Emergency(**emergency)
+    # From the stored emergency: a cancel through another worker must never get a 304
+    emergency = Emergency(**emergency)
+    etag = content_etag(current_user.id, emergency.dict())
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    return emergency
 
 @api_router.post("/emergency/cancel")
 async def cancel_user_emergency(current_user: User = Depends(get_current_user)):
-    # Find and cancel user's active emergency
-    result = await db.emergencies.update_one(
-        {"user_id": current_user.id, "is_active": True},
-        {"$set": {"is_active": False}}
-    )
+    # Find and cancel user's active emergency, reading back only its ID and
+    # position for the WebSocket notification and cache versions
+    emergency = await store.emergencies.deactivate_active_for_user(current_user.id)
     
-    if result.matched_count == 0:
+    if not emergency:
         raise HTTPException(status_code=404, detail="No active emergency found")
+    area_changed("emergencies", emergency["latitude"], emergency["longitude"])
     
-    # Get the emergency ID for WebSocket notification
-    emergency = await db.emergencies.find_one({
-        "user_id": current_user.id,
-        "is_active": False
-    }, sort=[("created_at", -1)])
-    
-    if emergency:
-        # Notify via WebSocket that emergency is resolved
-        await sio.emit('emergency_resolved', {'emergency_id': emergency["id"]})
-    
-    return {"message": "Emergency canceled successfully"}
-
-@api_router.post("/emergency/cancel")
-async def cancel_user_emergency(current_user: User = Depends(get_current_user)):
-    # Find and cancel user's active emergency
-    result = await db.emergencies.update_one(
-        {"user_id": current_user.id, "is_active": True},
-        {"$set": {"is_active": False}}
+    # Notify via WebSocket that emergency is resolved
+    await emit_event(
+        'emergency_resolved', {'emergency_id': emergency["id"]},
+        latitude=emergency["latitude"], longitude=emergency["longitude"]
     )
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="No active emergency found")
-    
-    # Get the emergency ID for WebSocket notification
-    emergency = await db.emergencies.find_one({
-        "user_id": current_user.id,
-        "is_active": False
-    }, sort=[("created_at", -1)])
-    
-    if emergency:
-        # Notify via WebSocket that emergency is resolved
-        await sio.emit('emergency_resolved', {'emergency_id': emergency["id"]})
-    
     return {"message": "Emergency canceled successfully"}
 
 @api_router.delete("/emergency/{emergency_id}")
 async def deactivate_emergency(emergency_id: str, current_user: User = Depends(get_current_user)):
     # Update emergency to inactive
-    result = await db.emergencies.update_one(
-        {"id": emergency_id, "user_id": current_user.id},
-        {"$set": {"is_active": False}}
-    )
+    emergency = await store.emergencies.deactivate(emergency_id, current_user.id)
     
-    if result.matched_count == 0:
+    if not emergency:
         raise HTTPException(status_code=404, detail="Emergency not found")
+    area_changed("emergencies", emergency["latitude"], emergency["longitude"])
     
     # Notify via WebSocket that emergency is resolved
-    await sio.emit('emergency_resolved', {'emergency_id': emergency_id})
+    await emit_event(
+        'emergency_resolved', {'emergency_id': emergency_id},
+        latitude=emergency["latitude"], longitude=emergency["longitude"]
+    )
     
     return {"message": "Emergency deactivated"}
 
+@api_router.get("/sync", response_class=FastJSONResponse)
+async def sync_state(
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    device_id: Optional[str] = None,
+    include: Optional[str] = None,
+    chat_limit: int = 50,
+    x_entitlement: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Everything the app loads on launch and resume, in one round trip.
+    
+    include is a comma separated list of SYNC_SECTIONS; without it every
+    section whose inputs were given is returned. Sections are fetched
+    concurrently and share one settings read.
+    """
+    has_position = latitude is not None and longitude is not None
+    if include is None:
+        sections = [name for name in SYNC_SECTIONS
+                    if (name not in ("emergencies", "chat") or has_position) and (name != "device" or device_id)]
+    else:
+        sections = list(dict.fromkeys(name.strip() for name in include.split(",") if name.strip()))
+        unknown = [name for name in sections if name not in SYNC_SECTIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sync sections: {', '.join(unknown)}")
+        if not has_position and ("emergencies" in sections or "chat" in sections):
+            raise HTTPException(status_code=400, detail="latitude and longitude are required for nearby sections")
+        if not device_id and "device" in sections:
+            raise HTTPException(status_code=400, detail="device_id is required for the device section")
+    
+    settings = None
+    if {"settings", "emergencies", "chat"} & set(sections):
+        settings = asyncio.ensure_future(settings_for(current_user.id))
+    
+    async def section(name):
+        if name == "settings":
+            return (await settings).dict()
+        if name == "active_emergency":
+            emergency = await store.emergencies.get_active_for_user(current_user.id)
+            return Emergency(**emergency).dict() if emergency else None
+        if name == "emergencies":
+            alert_distance = (await settings).alert_distance_km
+            items, _ = await nearby_emergency_items(current_user.id, latitude, longitude, alert_distance)
+            return items
+        if name == "chat":
+            alert_distance = (await settings).alert_distance_km
+            items, _ = await nearby_chat_items(latitude, longitude, alert_distance, chat_limit)
+            return items
+        return await device_status(current_user.id, device_id, x_entitlement)
+    
+    results = await asyncio.gather(*(section(name) for name in sections))
+    with span("serialize"):
+        return FastJSONResponse(dict(zip(sections, results)))
+
+@api_router.get("/alerts/stream")
+async def stream_alerts(
+    latitude: float,
+    longitude: float,
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Server-Sent Events with the Socket.IO alert and chat events within the user's alert radius.
+    
+    The stream follows positions posted to /api/location. A resync event
+    means events were missed, so the client should refetch the nearby lists.
+    """
+    alert_distance = await get_alert_distance(current_user.id)
+    return StreamingResponse(
+        alert_broker.stream(current_user.id, latitude, longitude, alert_distance, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def record_location(user_id: str, location: UserLocation) -> dict:
+    """Store a reported position and tell the client when to report again"""
+    location.user_id = user_id
+    # Ordered by server time: a phone's clock must not decide which report is newest
+    location.updated_at = datetime.utcnow()
+    
+    # Update or insert user location
+    await store.locations.upsert(user_id, location.dict())
+    alert_broker.move(user_id, location.latitude, location.longitude)
+    geofence.set_location(user_id, location.latitude, location.longitude, location.updated_at)
+    now = time.time()
+    presence.report(user_id, location.latitude, location.longitude, now)
+    
+    # Same cached area read as the nearby list, so this costs no query most of the time
+    emergencies, _ = await active_emergencies_near(location.latitude, location.longitude, MAX_ALERT_DISTANCE_KM)
+    with span("compute"):
+        nearest = min(
+            (calculate_distance(location.latitude, location.longitude, e["latitude"], e["longitude"])
+             for e in emergencies),
+            default=None,
+        )
+        plan = recommend(nearest, presence.density(location.latitude, location.longitude, now))
+    
+    return {
+        "message": "Location updated",
+        "next_report_seconds": plan.interval_seconds,
+        "min_displacement_m": plan.min_displacement_m,
+    }
+
 @api_router.post("/location")
 async def update_location(location: UserLocation, current_user: User = Depends(get_current_user)):
-    location.user_id = current_user.id
+    """Store the user's position, with when to report next: sooner and for smaller moves near active emergencies"""
+    return await record_location(current_user.id, location)
+
+# Admin endpoints
+@api_router.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profiler(
+    seconds: float = Query(10.0, gt=0, le=120),
+    interval_ms: float = Query(5.0, ge=1, le=1000)
+):
+    """Sample the event loop for a few seconds and return folded stacks for a flamegraph"""
+    try:
+        session = profiler.start(interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    # Update or insert user location
-    await db.user_locations.update_one(
-        {"user_id": current_user.id},
-        {"$set": location.dict()},
-        upsert=True
-    )
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        folded = session.stop()
     
-    return {"message": "Location updated"}
+    filename = f"profile-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.folded"
+    return PlainTextResponse(folded, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@api_router.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def get_slow_requests():
+    return {
+        "threshold_ms": slow_requests.threshold_ms,
+        "requests": list(reversed(slow_requests.entries))
+    }
 
 # Socket.IO events
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
+    socketio_connected_clients.inc()
+    # Anonymous clients still get every alert; with a token, only those within their radius
+    user_id = decode_access_token(auth["token"]) if isinstance(auth, dict) and auth.get("token") else None
+    if user_id is not None:
+        await sio.save_session(sid, {"user_id": user_id})
+        await sio.enter_room(sid, USER_ROOM.format(user_id))
+    else:
+        await sio.enter_room(sid, ANONYMOUS_ROOM)
     print(f"Client {sid} connected")
 
 @sio.event
 async def disconnect(sid):
+    socketio_connected_clients.dec()
     print(f"Client {sid} disconnected")
 
 @sio.event
@@ -668,19 +1220,44 @@ async def join_location_updates(sid, data):
     # You could implement room-based updates here
     await sio.enter_room(sid, "location_updates")
 
-# Include the router in the main app
-app.include_router(api_router)
+@sio.on("update_location")
+async def update_location_event(sid, data):
+    """Socket counterpart of POST /api/location, answered through the ack"""
+    user_id = (await sio.get_session(sid)).get("user_id")
+    if user_id is None:
+        return {"error": "Could not validate credentials"}
+    try:
+        location = UserLocation(user_id=user_id, latitude=data["latitude"], longitude=data["longitude"])
+    except (TypeError, KeyError, ValidationError):
+        return {"error": "latitude and longitude are required"}
+    return await record_location(user_id, location)
 
-# Mount Socket.IO
-app.mount("/socket.io", socket_app)
+# Prometheus scrape endpoint, outside /api so it is not timed as an API route
+async def metrics():
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Probes for the orchestrator, also outside /api
+def current_health():
+    return health_report(
+        loop_lag_monitor.last_lag,
+        socketio_connected_clients.value(),
+        store.pool_stats() if store is not None else None,
+        {name: job.running for name, job in BACKGROUND_JOBS.items()},
+    )
+
+async def healthz():
+    """Liveness: the worker's event loop is answering"""
+    return {"status": "ok", **current_health()}
+
+async def readyz(request: Request):
+    """Readiness: started, loop not lagging, Mongo pool not exhausted, background jobs alive"""
+    config = request.app.state.config
+    report = current_health()
+    failures = readiness_failures(
+        report, request.app.state.started, config.ready_max_loop_lag_ms, config.ready_max_pool_wait_queue
+    )
+    body = {"status": "fail" if failures else "ok", "failures": failures, **report}
+    return FastJSONResponse(body, status_code=503 if failures else 200)
 
 # Configure logging
 logging.basicConfig(
@@ -689,6 +1266,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+def create_app(config: Optional[Config] = None) -> FastAPI:
+    """Build the ASGI app. Connections are opened by its lifespan, not here."""
+    global ADMIN_TOKEN, slow_requests
+    config = config or Config.from_env()
+    ADMIN_TOKEN = config.admin_token
+    slow_requests = SlowRequestLog(config.slow_request_threshold_ms, config.slow_request_buffer_size)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        global store
+        loop_lag_monitor.start()
+        alert_broker.start()
+        store = open_store(config)
+        # Uvicorn only accepts connections once startup returns, so the pool
+        # is warm before the first request
+        started = time.perf_counter()
+        await asyncio.gather(store.warm_up(config.mongo_warmup_connections), store.ensure_indexes())
+        await entitlement_revocations.sync(store.subscriptions.revocations_since, time.time())
+        entitlement_revocations.start(store.subscriptions.revocations_since, time.time)
+        await geofence.sync(store.locations.changed_since, store.settings.radii_changed_since, datetime.utcnow())
+        geofence.start(store.locations.changed_since, store.settings.radii_changed_since, datetime.utcnow)
+        push_dispatcher.start(
+            config.expo_push_url, config.expo_access_token, lambda tokens: store.push_tokens.remove(tokens)
+        )
+        emergency_archiver.start(store.emergencies.archive_resolved, datetime.utcnow)
+        logger.info("%s store ready in %.1fms", config.storage_backend, (time.perf_counter() - started) * 1000)
+        app.state.started = True
+        try:
+            yield
+        finally:
+            # Fail readiness first so no new traffic arrives while closing
+            app.state.started = False
+            await loop_lag_monitor.stop()
+            await alert_broker.stop()
+            await entitlement_revocations.stop()
+            await geofence.stop()
+            await push_dispatcher.stop()
+            await emergency_archiver.stop()
+            await store.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.config = config
+    app.state.started = False
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
+    app.add_api_route("/healthz", healthz, include_in_schema=False)
+    app.add_api_route("/readyz", readyz, include_in_schema=False)
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    
+    # Mount Socket.IO
+    app.mount("/socket.io", socketio.ASGIApp(sio))
+    
+    # Compress API responses for mobile clients. Socket.IO frames its own payloads.
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        route_levels=COMPRESSION_ROUTE_LEVELS,
+        exclude_paths=("/socket.io",),
+    )
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Outermost so latency covers CORS and compression too. Alert streams
+    # stay open for hours and would only skew latencies and fill the slow log.
+    app.add_middleware(MetricsMiddleware, exclude_paths=LONG_LIVED_PATHS)
+    app.add_middleware(TracingMiddleware, log=slow_requests, exclude_paths=LONG_LIVED_PATHS)
+    return app
+
+# uvicorn server:app
+app = create_app()
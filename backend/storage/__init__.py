@@ -0,0 +1,24 @@
+"""
+Storage backends behind the API handlers.
+
+MongoStore wraps a Motor database; MemoryStore keeps everything in process
+so the API can run in tests and benchmarks without outside services.
+"""
+
+from storage.base import Store
+from storage.memory import MemoryStore
+from storage.mongo import MongoStore, connect as connect_mongo
+from storage.projections import PROJECTIONS
+
+BACKENDS = ("mongo", "memory")
+
+
+def open_store(config) -> Store:
+    if config.storage_backend == "memory":
+        return MemoryStore()
+    if config.storage_backend == "mongo":
+        return connect_mongo(config)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {config.storage_backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+__all__ = ["BACKENDS", "MemoryStore", "MongoStore", "PROJECTIONS", "Store", "open_store"]
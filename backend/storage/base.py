@@ -0,0 +1,253 @@
+"""
+Repository interfaces used by the API handlers.
+
+Documents are plain dicts in the shape the handlers already used with
+Mongo. Read methods return only the fields their callers need, matching
+the projections of the Motor implementation.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+Document = Dict[str, Any]
+
+# How long deleted chat messages are remembered for delta reads, the same
+# window chat history covers
+TOMBSTONE_RETENTION = timedelta(hours=24)
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get_by_id(self, user_id: str) -> Optional[Document]:
+        """User model fields, without the password hash"""
+
+    @abstractmethod
+    async def get_for_login(self, email: str) -> Optional[Document]:
+        """User model fields plus the password hash"""
+
+    @abstractmethod
+    async def email_exists(self, email: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def insert(self, user: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def set_password(self, email: str, password_hash: str) -> bool:
+        """False when no user has this email"""
+
+
+class PasswordResetRepository(ABC):
+    @abstractmethod
+    async def insert(self, reset: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def find_valid(self, token: str, now: datetime) -> Optional[Document]:
+        """Unused, unexpired reset (email only)"""
+
+    @abstractmethod
+    async def mark_used(self, token: str) -> None:
+        ...
+
+
+class SettingsRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[Document]:
+        """UserSettings fields"""
+
+    @abstractmethod
+    async def get_alert_distance(self, user_id: str) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    async def upsert(self, user_id: str, settings: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def radii_changed_since(self, since: datetime) -> List[Document]:
+        """user_id, alert_distance_km and updated_at of settings written at or after since"""
+
+
+class EmergencyRepository(ABC):
+    @abstractmethod
+    async def has_active(self, user_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def insert(self, emergency: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def find_active_near(self, latitude: float, longitude: float, radius_km: float, limit: int) -> List[Document]:
+        """Active emergencies that may lie within radius_km (callers still filter by distance)"""
+
+    @abstractmethod
+    def iter_active_near(self, latitude: float, longitude: float, radius_km: float) -> AsyncIterator[Document]:
+        """Streaming form of find_active_near, holding one batch at a time"""
+
+    @abstractmethod
+    async def get_active_for_user(self, user_id: str) -> Optional[Document]:
+        ...
+
+    @abstractmethod
+    async def deactivate_active_for_user(self, user_id: str) -> Optional[Document]:
+        """Deactivate the user's active emergency, returning its id and position"""
+
+    @abstractmethod
+    async def deactivate(self, emergency_id: str, user_id: str) -> Optional[Document]:
+        """Deactivate one of the user's emergencies, returning its id and position"""
+
+    @abstractmethod
+    async def find_changed_near(
+        self, latitude: float, longitude: float, radius_km: float, since: datetime, limit: int
+    ) -> List[Document]:
+        """Emergencies created or deactivated since a time that may lie within radius_km, active or not"""
+
+    @abstractmethod
+    async def archive_resolved(self, before: datetime, limit: int) -> int:
+        """Move up to limit emergencies resolved before a time to the archive; the number moved"""
+
+    @abstractmethod
+    async def find_history(
+        self, user_id: str, before: Optional[Tuple[datetime, str]], limit: int
+    ) -> List[Document]:
+        """The user's resolved emergencies after a (created_at, id) position, newest first, archived or not yet"""
+
+
+class ChatRepository(ABC):
+    @abstractmethod
+    async def insert(self, message: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def find_recent_near(
+        self, latitude: float, longitude: float, radius_km: float, since: datetime, limit: int
+    ) -> List[Document]:
+        """Newest first messages since a time that may lie within radius_km, from the primary"""
+
+    @abstractmethod
+    def iter_recent_near(
+        self, latitude: float, longitude: float, radius_km: float, since: datetime, limit: int
+    ) -> AsyncIterator[Document]:
+        """find_recent_near as a stream, read as chat_history is routed"""
+
+    @abstractmethod
+    async def find_posted_near(
+        self, latitude: float, longitude: float, radius_km: float, since: datetime, limit: int
+    ) -> List[Document]:
+        """find_recent_near for delta reads, which must stay on the primary so none of the changes is missed"""
+
+    @abstractmethod
+    async def delete_own(self, message_id: str, user_id: str) -> Optional[Document]:
+        """Delete a user's message, leaving a tombstone, and return its position"""
+
+    @abstractmethod
+    async def find_deleted_near(
+        self, latitude: float, longitude: float, radius_km: float, since: datetime, limit: int
+    ) -> List[Document]:
+        """Ids of messages deleted since a time that may have lain within radius_km"""
+
+
+class LocationRepository(ABC):
+    @abstractmethod
+    async def upsert(self, user_id: str, location: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def changed_since(self, since: datetime) -> List[Document]:
+        """user_id, latitude, longitude and updated_at of locations written at or after since"""
+
+
+class SubscriptionRepository(ABC):
+    @abstractmethod
+    async def get_binding_for_type(self, user_id: str, subscription_type: str) -> Optional[Document]:
+        """device_id, device_name and device_brand of the user's binding for a type"""
+
+    @abstractmethod
+    async def get_binding_for_device(self, user_id: str, device_id: str) -> Optional[Document]:
+        """device_name and subscription_type of the user's binding for a device"""
+
+    @abstractmethod
+    async def bind_device(self, user_id: str, binding: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def update_subscription(self, user_id: str, subscription: Document) -> None:
+        ...
+
+    @abstractmethod
+    async def get_expiry(self, user_id: str) -> Optional[Document]:
+        """expires_at of the user's subscription"""
+
+    @abstractmethod
+    async def unbind_device(self, user_id: str) -> Optional[Document]:
+        """Remove the user's binding, returning its device_id, device_name and device_brand"""
+
+    @abstractmethod
+    async def add_revocation(self, user_id: str, revoked_at: float, expires_at: datetime) -> None:
+        """Record that the user's entitlements issued before revoked_at are void, until expires_at"""
+
+    @abstractmethod
+    async def revocations_since(self, since: float) -> List[Document]:
+        """user_id and revoked_at of revocations made at or after since"""
+
+
+class PushTokenRepository(ABC):
+    @abstractmethod
+    async def register(self, user_id: str, token: str, now: datetime) -> None:
+        """Attach a device's push token to the user, taking it from whoever had it"""
+
+    @abstractmethod
+    async def unregister(self, user_id: str, token: str) -> None:
+        ...
+
+    @abstractmethod
+    async def tokens_for(self, user_ids: List[str]) -> List[Document]:
+        """user_id and token of every registered device of the users"""
+
+    @abstractmethod
+    async def remove(self, tokens: List[str]) -> None:
+        """Forget tokens the push service no longer accepts"""
+
+
+class IdempotencyRepository(ABC):
+    @abstractmethod
+    async def reserve(self, record: Document, now: datetime) -> Optional[Document]:
+        """Claim record["key"] unless an unexpired record holds it, returning that record's
+        fingerprint, response and expires_at instead"""
+
+    @abstractmethod
+    async def complete(self, key: str, response: Document, expires_at: datetime) -> None:
+        ...
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        ...
+
+
+class Store(ABC):
+    users: UserRepository
+    password_resets: PasswordResetRepository
+    settings: SettingsRepository
+    emergencies: EmergencyRepository
+    chat: ChatRepository
+    locations: LocationRepository
+    subscriptions: SubscriptionRepository
+    idempotency: IdempotencyRepository
+    push_tokens: PushTokenRepository
+
+    async def warm_up(self, connections: int) -> None:
+        """Open connections ahead of the first requests"""
+
+    async def ensure_indexes(self) -> None:
+        """Create the indexes the repositories rely on, if missing"""
+
+    def pool_stats(self) -> Optional[Dict[str, int]]:
+        """Connection pool usage, None for stores without a pool"""
+        return None
+
+    async def close(self) -> None:
+        pass
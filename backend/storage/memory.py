@@ -0,0 +1,359 @@
+"""
+In-memory implementation of the repositories.
+
+Documents live in dicts keyed the way the handlers look them up, and
+positioned documents are also indexed in a SpatialGrid of geo cells so a
+nearby query only looks at the cells its radius can reach. State is per
+process and lost on restart: this is for tests, benchmarks and local runs.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+from geo import Cell, cell_of, cells_covering
+from storage.base import (
+    TOMBSTONE_RETENTION, ChatRepository, Document, EmergencyRepository, IdempotencyRepository, LocationRepository,
+    PasswordResetRepository, PushTokenRepository, SettingsRepository, Store, SubscriptionRepository, UserRepository,
+)
+from storage.projections import project
+
+
+class SpatialGrid:
+    """Documents bucketed by the geo cell of their latitude/longitude"""
+
+    def __init__(self):
+        self.cells: Dict[Cell, Dict[str, Document]] = defaultdict(dict)
+
+    def add(self, key: str, doc: Document):
+        self.cells[cell_of(doc["latitude"], doc["longitude"])][key] = doc
+
+    def remove(self, key: str, doc: Document):
+        cell = cell_of(doc["latitude"], doc["longitude"])
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.cells[cell]
+
+    def near(self, latitude: float, longitude: float, radius_km: float) -> Iterator[Document]:
+        """Documents in every cell the circle's bounding box touches"""
+        for cell in cells_covering(latitude, longitude, radius_km):
+            bucket = self.cells.get(cell)
+            if bucket:
+                yield from bucket.values()
+
+
+async def iterate(docs: List[Document]):
+    for doc in docs:
+        yield doc
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.by_id: Dict[str, Document] = {}
+        self.by_email: Dict[str, Document] = {}
+
+    async def get_by_id(self, user_id):
+        return project(self.by_id.get(user_id), "current_user")
+
+    async def get_for_login(self, email):
+        return project(self.by_email.get(email), "login")
+
+    async def email_exists(self, email):
+        return email in self.by_email
+
+    async def insert(self, user):
+        user = dict(user)
+        self.by_id[user["id"]] = user
+        self.by_email[user["email"]] = user
+
+    async def set_password(self, email, password_hash):
+        user = self.by_email.get(email)
+        if user is None:
+            return False
+        user["password"] = password_hash
+        return True
+
+
+class MemoryPasswordResetRepository(PasswordResetRepository):
+    def __init__(self):
+        self.by_token: Dict[str, Document] = {}
+
+    async def insert(self, reset):
+        self.by_token[reset["token"]] = dict(reset)
+
+    async def find_valid(self, token, now):
+        reset = self.by_token.get(token)
+        if reset is None or reset["used"] or reset["expires_at"] <= now:
+            return None
+        return project(reset, "password_reset")
+
+    async def mark_used(self, token):
+        reset = self.by_token.get(token)
+        if reset is not None:
+            reset["used"] = True
+
+
+class MemorySettingsRepository(SettingsRepository):
+    def __init__(self):
+        self.by_user: Dict[str, Document] = {}
+
+    async def get(self, user_id):
+        return project(self.by_user.get(user_id), "settings")
+
+    async def get_alert_distance(self, user_id):
+        settings = self.by_user.get(user_id)
+        return settings.get("alert_distance_km") if settings else None
+
+    async def upsert(self, user_id, settings):
+        self.by_user.setdefault(user_id, {"user_id": user_id}).update(settings)
+
+    async def radii_changed_since(self, since):
+        return [
+            project(doc, "geofence_radius") for doc in self.by_user.values()
+            if "alert_distance_km" in doc and doc.get("updated_at") is not None and doc["updated_at"] >= since
+        ]
+
+
+class MemoryEmergencyRepository(EmergencyRepository):
+    def __init__(self):
+        self.by_id: Dict[str, Document] = {}
+        self.active_by_user: Dict[str, Document] = {}
+        self.active = SpatialGrid()
+        # Every insert and deactivation in time order, for delta reads
+        self.changes: List[Document] = []
+        self.change_times: List[datetime] = []
+        self.archive: Dict[str, Document] = {}
+
+    async def has_active(self, user_id):
+        return user_id in self.active_by_user
+
+    async def insert(self, emergency):
+        emergency = {**emergency, "updated_at": datetime.utcnow()}
+        self.by_id[emergency["id"]] = emergency
+        self._changed(emergency)
+        if emergency.get("is_active"):
+            self.active_by_user[emergency["user_id"]] = emergency
+            self.active.add(emergency["id"], emergency)
+
+    def _active_near(self, latitude, longitude, radius_km):
+        return [project(doc, "emergency") for doc in self.active.near(latitude, longitude, radius_km)]
+
+    async def find_active_near(self, latitude, longitude, radius_km, limit):
+        return self._active_near(latitude, longitude, radius_km)[:limit]
+
+    def iter_active_near(self, latitude, longitude, radius_km):
+        return iterate(self._active_near(latitude, longitude, radius_km))
+
+    async def get_active_for_user(self, user_id):
+        return project(self.active_by_user.get(user_id), "emergency")
+
+    def _deactivate(self, emergency):
+        if emergency["is_active"]:
+            emergency["is_active"] = False
+            emergency["updated_at"] = datetime.utcnow()
+            self._changed(emergency)
+            self.active.remove(emergency["id"], emergency)
+            if self.active_by_user.get(emergency["user_id"]) is emergency:
+                del self.active_by_user[emergency["user_id"]]
+        return project(emergency, "emergency_ref")
+
+    async def deactivate_active_for_user(self, user_id):
+        emergency = self.active_by_user.get(user_id)
+        return self._deactivate(emergency) if emergency else None
+
+    async def deactivate(self, emergency_id, user_id):
+        emergency = self.by_id.get(emergency_id)
+        if emergency is None or emergency["user_id"] != user_id:
+            return None
+        return self._deactivate(emergency)
+
+    async def find_changed_near(self, latitude, longitude, radius_km, since, limit):
+        cells = set(cells_covering(latitude, longitude, radius_km))
+        changed = {}
+        for doc in self.changes[bisect_left(self.change_times, since):]:
+            if cell_of(doc["latitude"], doc["longitude"]) in cells:
+                changed[doc["id"]] = project(doc, "emergency")
+        return list(changed.values())[:limit]
+
+    async def archive_resolved(self, before, limit):
+        # As in Mongo, documents older than updated_at count from their creation
+        resolved = [
+            doc for doc in self.by_id.values()
+            if not doc["is_active"] and doc.get("updated_at", doc["created_at"]) < before
+        ]
+        for doc in resolved[:limit]:
+            del self.by_id[doc["id"]]
+            self.archive[doc["id"]] = doc
+        # Delta reads never go back this far
+        cut = bisect_left(self.change_times, before)
+        del self.changes[:cut], self.change_times[:cut]
+        return len(resolved[:limit])
+
+    async def find_history(self, user_id, before, limit):
+        resolved = [
+            doc for doc in (*self.archive.values(), *self.by_id.values())
+            if doc["user_id"] == user_id and not doc["is_active"]
+            and (before is None or (doc["created_at"], doc["id"]) < before)
+        ]
+        resolved.sort(key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+        return [project(doc, "emergency") for doc in resolved[:limit]]
+
+    def _changed(self, emergency):
+        self.change_times.append(emergency["updated_at"])
+        self.changes.append(emergency)
+
+
+class MemoryChatRepository(ChatRepository):
+    def __init__(self):
+        self.by_id: Dict[str, Document] = {}
+        self.grid = SpatialGrid()
+        self.tombstones: List[Document] = []
+
+    async def insert(self, message):
+        message = dict(message)
+        self.by_id[message["id"]] = message
+        self.grid.add(message["id"], message)
+
+    def _recent_near(self, latitude, longitude, radius_km, since, limit):
+        recent = [doc for doc in self.grid.near(latitude, longitude, radius_km) if doc["created_at"] >= since]
+        recent.sort(key=lambda doc: doc["created_at"], reverse=True)
+        return [project(doc, "chat_message") for doc in recent[:limit]]
+
+    async def find_recent_near(self, latitude, longitude, radius_km, since, limit):
+        return self._recent_near(latitude, longitude, radius_km, since, limit)
+
+    def iter_recent_near(self, latitude, longitude, radius_km, since, limit):
+        return iterate(self._recent_near(latitude, longitude, radius_km, since, limit))
+
+    async def find_posted_near(self, latitude, longitude, radius_km, since, limit):
+        return self._recent_near(latitude, longitude, radius_km, since, limit)
+
+    async def delete_own(self, message_id, user_id):
+        message = self.by_id.get(message_id)
+        if message is None or message["user_id"] != user_id:
+            return None
+        del self.by_id[message_id]
+        self.grid.remove(message_id, message)
+        now = datetime.utcnow()
+        self.tombstones = [doc for doc in self.tombstones if doc["deleted_at"] >= now - TOMBSTONE_RETENTION]
+        self.tombstones.append({
+            "id": message_id, "latitude": message["latitude"], "longitude": message["longitude"], "deleted_at": now,
+        })
+        return project(message, "chat_location")
+
+    async def find_deleted_near(self, latitude, longitude, radius_km, since, limit):
+        cells = set(cells_covering(latitude, longitude, radius_km))
+        deleted = [
+            project(doc, "chat_tombstone") for doc in self.tombstones
+            if doc["deleted_at"] >= since and cell_of(doc["latitude"], doc["longitude"]) in cells
+        ]
+        return deleted[:limit]
+
+
+class MemoryLocationRepository(LocationRepository):
+    def __init__(self):
+        self.by_user: Dict[str, Document] = {}
+        self.grid = SpatialGrid()
+
+    async def upsert(self, user_id, location):
+        previous = self.by_user.get(user_id)
+        if previous is not None:
+            self.grid.remove(user_id, previous)
+        location = {**(previous or {}), **location}
+        self.by_user[user_id] = location
+        self.grid.add(user_id, location)
+
+    async def changed_since(self, since):
+        return [project(doc, "geofence_location") for doc in self.by_user.values() if doc["updated_at"] >= since]
+
+
+class MemorySubscriptionRepository(SubscriptionRepository):
+    def __init__(self):
+        self.bindings: Dict[str, Document] = {}
+        self.subscriptions: Dict[str, Document] = {}
+        self.revocations: List[Document] = []
+
+    async def get_binding_for_type(self, user_id, subscription_type):
+        binding = self.bindings.get(user_id)
+        if binding is None or binding.get("subscription_type") != subscription_type:
+            return None
+        return project(binding, "binding_conflict")
+
+    async def get_binding_for_device(self, user_id, device_id):
+        binding = self.bindings.get(user_id)
+        if binding is None or binding.get("device_id") != device_id:
+            return None
+        return project(binding, "device_binding")
+
+    async def bind_device(self, user_id, binding):
+        self.bindings.setdefault(user_id, {"user_id": user_id}).update(binding)
+
+    async def update_subscription(self, user_id, subscription):
+        self.subscriptions.setdefault(user_id, {"user_id": user_id}).update(subscription)
+
+    async def get_expiry(self, user_id):
+        return project(self.subscriptions.get(user_id), "subscription_expiry")
+
+    async def unbind_device(self, user_id):
+        return project(self.bindings.pop(user_id, None), "binding_conflict")
+
+    async def add_revocation(self, user_id, revoked_at, expires_at):
+        self.revocations.append({"user_id": user_id, "revoked_at": revoked_at, "expires_at": expires_at})
+
+    async def revocations_since(self, since):
+        return [project(doc, "revocation") for doc in self.revocations if doc["revoked_at"] >= since]
+
+
+class MemoryIdempotencyRepository(IdempotencyRepository):
+    def __init__(self):
+        self.by_key: Dict[str, Document] = {}
+
+    async def reserve(self, record, now):
+        existing = self.by_key.get(record["key"])
+        if existing is not None and existing["expires_at"] > now:
+            return project(existing, "idempotency")
+        self.by_key[record["key"]] = dict(record)
+        return None
+
+    async def complete(self, key, response, expires_at):
+        self.by_key[key].update(response=response, expires_at=expires_at)
+
+    async def release(self, key):
+        if key in self.by_key and self.by_key[key]["response"] is None:
+            del self.by_key[key]
+
+
+class MemoryPushTokenRepository(PushTokenRepository):
+    def __init__(self):
+        self.by_token: Dict[str, Document] = {}
+
+    async def register(self, user_id, token, now):
+        self.by_token[token] = {"user_id": user_id, "token": token, "updated_at": now}
+
+    async def unregister(self, user_id, token):
+        if self.by_token.get(token, {}).get("user_id") == user_id:
+            del self.by_token[token]
+
+    async def tokens_for(self, user_ids):
+        wanted = set(user_ids)
+        return [project(doc, "push_token") for doc in self.by_token.values() if doc["user_id"] in wanted]
+
+    async def remove(self, tokens):
+        for token in tokens:
+            self.by_token.pop(token, None)
+
+
+class MemoryStore(Store):
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.password_resets = MemoryPasswordResetRepository()
+        self.settings = MemorySettingsRepository()
+        self.emergencies = MemoryEmergencyRepository()
+        self.chat = MemoryChatRepository()
+        self.locations = MemoryLocationRepository()
+        self.subscriptions = MemorySubscriptionRepository()
+        self.idempotency = MemoryIdempotencyRepository()
+        self.push_tokens = MemoryPushTokenRepository()
@@ -0,0 +1,419 @@
+"""
+Motor (MongoDB) implementation of the repositories.
+
+Every read passes a projection from PROJECTIONS so Mongo never ships whole
+documents (password hashes, unused settings) to a hot path. Reads go to
+the primary, except those given a read preference in
+storage/read_preferences.py.
+
+Emergencies, chat messages and tombstones, and user locations carry the
+region of their position (see regions.py); writes add it and every query
+by position filters on the regions the circle covers, so it can be
+served from the regions' index ranges (and shards) alone.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from geo import bounding_box
+from regions import region_of, regions_covering
+from storage.base import (
+    TOMBSTONE_RETENTION, ChatRepository, Document, EmergencyRepository, IdempotencyRepository, LocationRepository,
+    PasswordResetRepository, PushTokenRepository, SettingsRepository, Store, SubscriptionRepository, UserRepository,
+)
+from storage.projections import PROJECTIONS
+from storage.read_preferences import build_read_preferences
+
+# Documents per Mongo batch when streaming, small so the first items go out quickly
+STREAM_BATCH_SIZE = 50
+
+
+def near_filter(latitude: float, longitude: float, radius_km: float) -> dict:
+    """Region and bounding-box filter around a circle, so Mongo skips far away documents"""
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+    return {
+        "region": {"$in": regions_covering(latitude, longitude, radius_km)},
+        "latitude": {"$gte": south, "$lte": north},
+        "longitude": {"$gte": west, "$lte": east},
+    }
+
+
+async def iterate(cursor):
+    """Yield documents from a cursor one batch at a time, closing it when done"""
+    try:
+        async for doc in cursor.batch_size(STREAM_BATCH_SIZE):
+            yield doc
+    finally:
+        await cursor.close()
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def get_by_id(self, user_id):
+        return await self.collection.find_one({"id": user_id}, PROJECTIONS["current_user"])
+
+    async def get_for_login(self, email):
+        return await self.collection.find_one({"email": email}, PROJECTIONS["login"])
+
+    async def email_exists(self, email):
+        return await self.collection.find_one({"email": email}, PROJECTIONS["exists"]) is not None
+
+    async def insert(self, user):
+        await self.collection.insert_one(user)
+
+    async def set_password(self, email, password_hash):
+        result = await self.collection.update_one({"email": email}, {"$set": {"password": password_hash}})
+        return result.matched_count > 0
+
+
+class MongoPasswordResetRepository(PasswordResetRepository):
+    def __init__(self, db):
+        self.collection = db.password_resets
+
+    async def insert(self, reset):
+        await self.collection.insert_one(reset)
+
+    async def find_valid(self, token, now):
+        return await self.collection.find_one({
+            "token": token,
+            "used": False,
+            "expires_at": {"$gt": now}
+        }, PROJECTIONS["password_reset"])
+
+    async def mark_used(self, token):
+        await self.collection.update_one({"token": token}, {"$set": {"used": True}})
+
+
+class MongoSettingsRepository(SettingsRepository):
+    def __init__(self, db):
+        self.collection = db.user_settings
+
+    async def get(self, user_id):
+        return await self.collection.find_one({"user_id": user_id}, PROJECTIONS["settings"])
+
+    async def get_alert_distance(self, user_id):
+        settings = await self.collection.find_one({"user_id": user_id}, PROJECTIONS["alert_distance"])
+        return settings.get("alert_distance_km") if settings else None
+
+    async def upsert(self, user_id, settings):
+        await self.collection.update_one({"user_id": user_id}, {"$set": settings}, upsert=True)
+
+    async def radii_changed_since(self, since):
+        cursor = self.collection.find({"updated_at": {"$gte": since}}, PROJECTIONS["geofence_radius"])
+        return await cursor.to_list(None)
+
+
+def history_query(user_id, before):
+    query = {"user_id": user_id, "is_active": False}
+    if before is not None:
+        created_at, emergency_id = before
+        query["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "id": {"$lt": emergency_id}}]
+    return query
+
+
+def resolved_before(before):
+    # Emergencies resolved before updated_at was written only have their creation time
+    return {"is_active": False, "$or": [
+        {"updated_at": {"$lt": before}},
+        {"updated_at": {"$exists": False}, "created_at": {"$lt": before}},
+    ]}
+
+
+class MongoEmergencyRepository(EmergencyRepository):
+    def __init__(self, db):
+        self.collection = db.emergencies
+        self.archive = db.emergencies_archive
+
+    async def has_active(self, user_id):
+        found = await self.collection.find_one({"user_id": user_id, "is_active": True}, PROJECTIONS["exists"])
+        return found is not None
+
+    async def insert(self, emergency):
+        # insert_one adds _id to the dict it is given
+        await self.collection.insert_one({
+            **emergency,
+            "region": region_of(emergency["latitude"], emergency["longitude"]),
+            "updated_at": datetime.utcnow(),
+        })
+
+    def _active_near(self, latitude, longitude, radius_km):
+        query = {"is_active": True, **near_filter(latitude, longitude, radius_km)}
+        return self.collection.find(query, PROJECTIONS["emergency"])
+
+    async def find_active_near(self, latitude, longitude, radius_km, limit) -> List[Document]:
+        return await self._active_near(latitude, longitude, radius_km).to_list(limit)
+
+    def iter_active_near(self, latitude, longitude, radius_km):
+        return iterate(self._active_near(latitude, longitude, radius_km))
+
+    async def get_active_for_user(self, user_id):
+        return await self.collection.find_one({"user_id": user_id, "is_active": True}, PROJECTIONS["emergency"])
+
+    async def deactivate_active_for_user(self, user_id):
+        return await self.collection.find_one_and_update(
+            {"user_id": user_id, "is_active": True},
+            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}},
+            projection=PROJECTIONS["emergency_ref"]
+        )
+
+    async def deactivate(self, emergency_id, user_id):
+        return await self.collection.find_one_and_update(
+            {"id": emergency_id, "user_id": user_id},
+            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}},
+            projection=PROJECTIONS["emergency_ref"]
+        )
+
+    async def find_changed_near(self, latitude, longitude, radius_km, since, limit):
+        query = {"updated_at": {"$gte": since}, **near_filter(latitude, longitude, radius_km)}
+        return await self.collection.find(query, PROJECTIONS["emergency"]).to_list(limit)
+
+    async def archive_resolved(self, before, limit):
+        from pymongo.errors import BulkWriteError
+
+        # Whole documents move, so no projection
+        resolved = await self.collection.find(resolved_before(before)).to_list(limit)
+        if not resolved:
+            return 0
+        try:
+            await self.archive.insert_many(resolved, ordered=False)
+        except BulkWriteError as error:
+            # Copies left by a move that stopped before its delete collide on _id
+            if any(failure["code"] != 11000 for failure in error.details["writeErrors"]):
+                raise
+        await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in resolved]}, "is_active": False})
+        return len(resolved)
+
+    async def find_history(self, user_id, before, limit):
+        order = [("created_at", -1), ("id", -1)]
+        query = history_query(user_id, before)
+        # Emergencies resolved recently are still live; one being moved is in both for a moment
+        archived, live = await asyncio.gather(
+            self.archive.find(query, PROJECTIONS["emergency"]).sort(order).limit(limit).to_list(limit),
+            self.collection.find(query, PROJECTIONS["emergency"]).sort(order).limit(limit).to_list(limit),
+        )
+        resolved = {doc["id"]: doc for doc in (*archived, *live)}
+        return sorted(resolved.values(), key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)[:limit]
+
+
+def routed(collection, read_preference):
+    """The collection reading with a read preference, or as it is (from the primary) for None"""
+    return collection if read_preference is None else collection.with_options(read_preference=read_preference)
+
+
+class MongoChatRepository(ChatRepository):
+    def __init__(self, db, read_preferences: Optional[Dict[str, object]] = None):
+        read_preferences = read_preferences or {}
+        self.collection = db.chat_messages
+        self.history = routed(db.chat_messages, read_preferences.get("chat_history"))
+        self.tombstones = db.chat_tombstones
+
+    async def insert(self, message):
+        await self.collection.insert_one({**message, "region": region_of(message["latitude"], message["longitude"])})
+
+    def _recent_near(self, collection, latitude, longitude, radius_km, since, limit):
+        query = {"created_at": {"$gte": since}, **near_filter(latitude, longitude, radius_km)}
+        return collection.find(query, PROJECTIONS["chat_message"]).sort("created_at", -1).limit(limit)
+
+    async def find_recent_near(self, latitude, longitude, radius_km, since, limit):
+        # Fills the nearby cache, which would pin a lagging secondary's answer for a whole bucket
+        return await self._recent_near(self.collection, latitude, longitude, radius_km, since, limit).to_list(limit)
+
+    def iter_recent_near(self, latitude, longitude, radius_km, since, limit):
+        return iterate(self._recent_near(self.history, latitude, longitude, radius_km, since, limit))
+
+    async def find_posted_near(self, latitude, longitude, radius_km, since, limit):
+        return await self._recent_near(self.collection, latitude, longitude, radius_km, since, limit).to_list(limit)
+
+    async def delete_own(self, message_id, user_id):
+        message = await self.collection.find_one_and_delete(
+            {"id": message_id, "user_id": user_id},
+            projection=PROJECTIONS["chat_location"]
+        )
+        if message is not None:
+            await self.tombstones.insert_one({
+                "id": message_id,
+                **message,
+                "region": region_of(message["latitude"], message["longitude"]),
+                "deleted_at": datetime.utcnow(),
+            })
+        return message
+
+    async def find_deleted_near(self, latitude, longitude, radius_km, since, limit):
+        query = {"deleted_at": {"$gte": since}, **near_filter(latitude, longitude, radius_km)}
+        return await self.tombstones.find(query, PROJECTIONS["chat_tombstone"]).to_list(limit)
+
+
+class MongoLocationRepository(LocationRepository):
+    def __init__(self, db):
+        self.collection = db.user_locations
+
+    async def upsert(self, user_id, location):
+        location = {**location, "region": region_of(location["latitude"], location["longitude"])}
+        await self.collection.update_one({"user_id": user_id}, {"$set": location}, upsert=True)
+
+    async def changed_since(self, since):
+        cursor = self.collection.find({"updated_at": {"$gte": since}}, PROJECTIONS["geofence_location"])
+        return await cursor.to_list(None)
+
+
+class MongoSubscriptionRepository(SubscriptionRepository):
+    def __init__(self, db):
+        self.bindings = db.device_bindings
+        self.subscriptions = db.user_subscriptions
+        self.revocations = db.entitlement_revocations
+
+    async def get_binding_for_type(self, user_id, subscription_type):
+        return await self.bindings.find_one({
+            "user_id": user_id,
+            "subscription_type": subscription_type
+        }, PROJECTIONS["binding_conflict"])
+
+    async def get_binding_for_device(self, user_id, device_id):
+        return await self.bindings.find_one({
+            "user_id": user_id,
+            "device_id": device_id
+        }, PROJECTIONS["device_binding"])
+
+    async def bind_device(self, user_id, binding):
+        await self.bindings.update_one({"user_id": user_id}, {"$set": binding}, upsert=True)
+
+    async def update_subscription(self, user_id, subscription):
+        await self.subscriptions.update_one({"user_id": user_id}, {"$set": subscription}, upsert=True)
+
+    async def get_expiry(self, user_id):
+        return await self.subscriptions.find_one({"user_id": user_id}, PROJECTIONS["subscription_expiry"])
+
+    async def unbind_device(self, user_id):
+        return await self.bindings.find_one_and_delete({"user_id": user_id}, projection=PROJECTIONS["binding_conflict"])
+
+    async def add_revocation(self, user_id, revoked_at, expires_at):
+        await self.revocations.insert_one({"user_id": user_id, "revoked_at": revoked_at, "expires_at": expires_at})
+
+    async def revocations_since(self, since):
+        cursor = self.revocations.find({"revoked_at": {"$gte": since}}, PROJECTIONS["revocation"])
+        return await cursor.to_list(None)
+
+
+class MongoIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, db):
+        self.collection = db.idempotency_keys
+
+    async def reserve(self, record, now):
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            # Takes over an expired record the TTL monitor hasn't removed yet;
+            # a live one makes the upsert collide on the unique key index
+            await self.collection.update_one(
+                {"key": record["key"], "expires_at": {"$lte": now}}, {"$set": record}, upsert=True
+            )
+            return None
+        except DuplicateKeyError:
+            return await self.collection.find_one({"key": record["key"]}, PROJECTIONS["idempotency"])
+
+    async def complete(self, key, response, expires_at):
+        await self.collection.update_one({"key": key}, {"$set": {"response": response, "expires_at": expires_at}})
+
+    async def release(self, key):
+        await self.collection.delete_one({"key": key, "response": None})
+
+
+class MongoPushTokenRepository(PushTokenRepository):
+    def __init__(self, db):
+        self.collection = db.push_tokens
+
+    async def register(self, user_id, token, now):
+        await self.collection.update_one(
+            {"token": token}, {"$set": {"user_id": user_id, "token": token, "updated_at": now}}, upsert=True
+        )
+
+    async def unregister(self, user_id, token):
+        await self.collection.delete_one({"user_id": user_id, "token": token})
+
+    async def tokens_for(self, user_ids):
+        cursor = self.collection.find({"user_id": {"$in": user_ids}}, PROJECTIONS["push_token"])
+        return await cursor.to_list(None)
+
+    async def remove(self, tokens):
+        await self.collection.delete_many({"token": {"$in": tokens}})
+
+
+class MongoStore(Store):
+    def __init__(self, db, client=None, pool_monitor=None, read_preferences=None):
+        self.db = db
+        self.client = client
+        self.pool_monitor = pool_monitor
+        self.users = MongoUserRepository(db)
+        self.password_resets = MongoPasswordResetRepository(db)
+        self.settings = MongoSettingsRepository(db)
+        self.emergencies = MongoEmergencyRepository(db)
+        self.chat = MongoChatRepository(db, read_preferences)
+        self.locations = MongoLocationRepository(db)
+        self.subscriptions = MongoSubscriptionRepository(db)
+        self.idempotency = MongoIdempotencyRepository(db)
+        self.push_tokens = MongoPushTokenRepository(db)
+
+    async def warm_up(self, connections):
+        # Concurrent pings each need their own socket, so the pool opens
+        # (and authenticates) that many connections now instead of on the
+        # first burst of requests
+        await asyncio.gather(*(self.db.command("ping") for _ in range(connections)))
+
+    async def ensure_indexes(self):
+        revocations = self.db.entitlement_revocations
+        await asyncio.gather(
+            revocations.create_index("revoked_at"),
+            # Mongo drops each revocation once no token it covers can still be valid
+            revocations.create_index("expires_at", expireAfterSeconds=0),
+            # Queries by position read only the index ranges of the regions
+            # they cover; delta reads only what changed there since their token
+            self.db.emergencies.create_index([("region", 1), ("is_active", 1)]),
+            self.db.emergencies.create_index([("region", 1), ("updated_at", 1)]),
+            # The user's own emergency, and resolved ones waiting to be archived
+            self.db.emergencies.create_index([("user_id", 1), ("is_active", 1)]),
+            self.db.emergencies.create_index([("is_active", 1), ("updated_at", 1)]),
+            # History pages, newest first
+            self.db.emergencies_archive.create_index([("user_id", 1), ("created_at", -1), ("id", -1)]),
+            self.db.chat_messages.create_index([("region", 1), ("created_at", 1)]),
+            self.db.chat_tombstones.create_index([("region", 1), ("deleted_at", 1)]),
+            self.db.chat_tombstones.create_index(
+                "deleted_at", expireAfterSeconds=int(TOMBSTONE_RETENTION.total_seconds())
+            ),
+            # Geofence syncs read the positions and radii written since the last one
+            self.db.user_locations.create_index("updated_at"),
+            self.db.user_settings.create_index("updated_at"),
+            self.db.idempotency_keys.create_index("key", unique=True),
+            self.db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0),
+            # A device's token belongs to whoever registered it last
+            self.db.push_tokens.create_index("token", unique=True),
+            self.db.push_tokens.create_index("user_id"),
+        )
+
+    def pool_stats(self):
+        return self.pool_monitor.stats() if self.pool_monitor is not None else None
+
+    async def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+def connect(config) -> MongoStore:
+    """MongoStore with a new Motor client. Motor and pymongo are imported here, on first use."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from mongo_listeners import MongoCommandMetrics, MongoPoolMonitor, MongoTraceListener
+
+    if not config.mongo_url or not config.db_name:
+        raise RuntimeError("MONGO_URL and DB_NAME must be set for the mongo storage backend")
+    read_preferences = build_read_preferences(config.mongo_read_preferences, config.mongo_max_staleness_seconds)
+    pool_monitor = MongoPoolMonitor()
+    # The client connects in the background, nothing blocks here
+    client = AsyncIOMotorClient(
+        config.mongo_url,
+        minPoolSize=config.mongo_min_pool_size,
+        maxPoolSize=config.mongo_max_pool_size,
+        event_listeners=[MongoCommandMetrics(), MongoTraceListener(), pool_monitor],
+    )
+    return MongoStore(client[config.db_name], client, pool_monitor, read_preferences)
@@ -0,0 +1,141 @@
+"""
+Partitioning the geo collections by region (see regions.py).
+
+    python -m storage.partitioning backfill
+        Set the region of documents written before it existed. Queries by
+        position filter on it, so run this before deploying and once more
+        after, for what older workers wrote in between.
+
+    python -m storage.partitioning plan --prefix-length 2
+        Documents per region prefix in each collection, to choose zones
+        and split points.
+
+    python -m storage.partitioning shard --zone sp=6g --zone rj=75 --split-prefix 6g --split-prefix 75
+        Shard the collections on region-led keys, split their chunks at
+        region prefix boundaries and pin prefixes to zones. Shards are
+        added to the zones separately (sh.addShardToZone). Updates and
+        deletes that find documents by user or id rather than position,
+        and location upserts that move a user into another region, need
+        MongoDB 7.1 or later.
+
+Run from backend/ with MONGO_URL and DB_NAME set, as for the server.
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Dict, List, Tuple
+
+from regions import REGION_PRECISION, prefix_end, region_of
+
+# Shard key of each collection: the region first, so a region's documents
+# are one contiguous range, then a field that spreads a busy region over chunks
+SHARD_KEYS: Dict[str, Dict[str, int]] = {
+    "emergencies": {"region": 1, "id": 1},
+    "chat_messages": {"region": 1, "id": 1},
+    "chat_tombstones": {"region": 1, "id": 1},
+    "user_locations": {"region": 1, "user_id": 1},
+}
+BACKFILL_BATCH_SIZE = 1000
+
+
+def key_bound(collection: str, region: str) -> dict:
+    """Smallest shard key value in a region (and every region after it)"""
+    from bson.min_key import MinKey
+
+    return {field: region if field == "region" else MinKey() for field in SHARD_KEYS[collection]}
+
+
+def shard_commands(db_name: str, zones: List[Tuple[str, str]], split_prefixes: List[str]) -> List[dict]:
+    """Admin commands that shard the collections, split them at region prefixes and assign zone ranges"""
+    commands = [{"enableSharding": db_name}]
+    for collection, key in SHARD_KEYS.items():
+        namespace = f"{db_name}.{collection}"
+        commands.append({"shardCollection": namespace, "key": key})
+        for prefix in split_prefixes:
+            commands.append({"split": namespace, "middle": key_bound(collection, prefix)})
+        for zone, prefix in zones:
+            commands.append({
+                "updateZoneKeyRange": namespace,
+                "min": key_bound(collection, prefix),
+                "max": key_bound(collection, prefix_end(prefix)),
+                "zone": zone,
+            })
+    return commands
+
+
+async def backfill(db) -> Dict[str, int]:
+    """Set the region of every document without one; counts of documents updated per collection"""
+    from pymongo import UpdateOne
+
+    updated = {}
+    for collection in SHARD_KEYS:
+        updated[collection] = 0
+        cursor = db[collection].find(
+            {"region": {"$exists": False}}, {"_id": 1, "latitude": 1, "longitude": 1}
+        ).batch_size(BACKFILL_BATCH_SIZE)
+        batch = []
+        async for doc in cursor:
+            region = region_of(doc["latitude"], doc["longitude"])
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"region": region}}))
+            if len(batch) == BACKFILL_BATCH_SIZE:
+                updated[collection] += (await db[collection].bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            updated[collection] += (await db[collection].bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+
+async def plan(db, prefix_length: int) -> Dict[str, Dict[str, int]]:
+    """Documents per region prefix in each collection"""
+    counts = {}
+    for collection in SHARD_KEYS:
+        cursor = db[collection].aggregate([
+            {"$group": {"_id": {"$substrCP": ["$region", 0, prefix_length]}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ])
+        counts[collection] = {doc["_id"]: doc["count"] async for doc in cursor}
+    return counts
+
+
+async def run(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo_url, db_name = os.environ.get("MONGO_URL"), os.environ.get("DB_NAME")
+    if not mongo_url or not db_name:
+        raise SystemExit("MONGO_URL and DB_NAME must be set")
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        db = client[db_name]
+        if args.command == "backfill":
+            for collection, count in (await backfill(db)).items():
+                print(f"{collection}: {count} documents updated")
+        elif args.command == "plan":
+            for collection, counts in (await plan(db, args.prefix_length)).items():
+                print(collection)
+                for prefix, count in counts.items():
+                    print(f"  {prefix or '(none)'}\t{count}")
+        else:
+            zones = [tuple(zone.split("=", 1)) for zone in args.zone]
+            for command in shard_commands(db_name, zones, args.split_prefix):
+                print(command)
+                await client.admin.command(command)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill")
+    plan_parser = commands.add_parser("plan")
+    plan_parser.add_argument("--prefix-length", type=int, default=2, choices=range(1, REGION_PRECISION + 1))
+    shard_parser = commands.add_parser("shard")
+    shard_parser.add_argument("--zone", action="append", default=[], metavar="NAME=PREFIX")
+    shard_parser.add_argument("--split-prefix", action="append", default=[], metavar="PREFIX",
+                              help="split chunks where this region prefix starts")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
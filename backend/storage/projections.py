@@ -0,0 +1,38 @@
+"""
+Fields each read returns. The Motor store sends these to Mongo, the
+in-memory store applies them to its documents, so both hand handlers the
+same shapes.
+"""
+
+from models import ChatMessage, Emergency, User, UserSettings
+from serialization import model_projection
+
+PROJECTIONS = {
+    "exists": {"_id": 1},
+    "current_user": model_projection(User),
+    "login": {**model_projection(User), "password": 1},
+    "password_reset": {"_id": 0, "email": 1},
+    "settings": model_projection(UserSettings),
+    "alert_distance": {"_id": 0, "alert_distance_km": 1},
+    "geofence_radius": {"_id": 0, "user_id": 1, "alert_distance_km": 1, "updated_at": 1},
+    "emergency": model_projection(Emergency),
+    "emergency_ref": {"_id": 0, "id": 1, "latitude": 1, "longitude": 1},
+    "chat_message": model_projection(ChatMessage),
+    "chat_location": {"_id": 0, "latitude": 1, "longitude": 1},
+    "chat_tombstone": {"_id": 0, "id": 1},
+    "binding_conflict": {"_id": 0, "device_id": 1, "device_name": 1, "device_brand": 1},
+    "device_binding": {"_id": 0, "device_name": 1, "subscription_type": 1},
+    "subscription_expiry": {"_id": 0, "expires_at": 1},
+    "geofence_location": {"_id": 0, "user_id": 1, "latitude": 1, "longitude": 1, "updated_at": 1},
+    "revocation": {"_id": 0, "user_id": 1, "revoked_at": 1},
+    "push_token": {"_id": 0, "user_id": 1, "token": 1},
+    "idempotency": {"_id": 0, "fingerprint": 1, "response": 1, "expires_at": 1},
+}
+
+
+def project(doc, name):
+    """Copy of doc with only the fields of the named projection (None passes through)"""
+    if doc is None:
+        return None
+    fields = PROJECTIONS[name]
+    return {key: doc[key] for key, include in fields.items() if include and key != "_id" and key in doc}
@@ -0,0 +1,75 @@
+"""
+Which replica set members each read may be served by.
+
+Every read goes to the primary unless it is named here. The reads that
+may be routed elsewhere are the ones that tolerate a slightly stale
+answer and are heavy enough to be worth taking off the primary:
+
+    chat_history   the last 24 hours of chat streamed to a user (NDJSON)
+
+The full chat list is not routed although it is the same read: it fills
+the nearby cache, which would keep a lagging secondary's answer, with an
+ETag clients revalidate against, for a whole cache bucket after the
+write that invalidated it. Only reads that go straight to the client may
+be stale, and then only by the staleness bound.
+
+Safety-critical reads are deliberately not routable. A secondary could
+still show an emergency that was resolved, miss one that was just raised
+or accept a revoked password, and delta reads and geofence syncs would
+skip writes that were older than their overlap by the time they
+replicated. Those all stay on the primary.
+
+Preferences come from MONGO_READ_PREFERENCES, e.g.
+"chat_history=secondaryPreferred", and secondaries are only picked while
+they are at most MONGO_MAX_STALENESS_SECONDS behind the primary. pymongo
+is imported when a preference is built, not at import.
+"""
+
+from typing import Dict
+
+MODES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+TOLERANT_READS = ("chat_history",)
+DEFAULT_READ_PREFERENCES = {"chat_history": "secondaryPreferred"}
+# The smallest bound Mongo accepts: a secondary's lag is only known to
+# within a heartbeat plus an idle write period
+MIN_MAX_STALENESS_SECONDS = 90
+
+
+def parse_read_preferences(value: str) -> Dict[str, str]:
+    """The defaults updated with "read=mode,..." pairs; raises RuntimeError for unknown or safety-critical reads"""
+    preferences = dict(DEFAULT_READ_PREFERENCES)
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        name, _, mode = (item.strip() for item in pair.partition("="))
+        if name not in TOLERANT_READS:
+            raise RuntimeError(f"{name!r} reads always go to the primary; routable reads: {', '.join(TOLERANT_READS)}")
+        if mode not in MODES:
+            raise RuntimeError(f"Unknown read preference {mode!r} for {name}, expected one of {', '.join(MODES)}")
+        preferences[name] = mode
+    return preferences
+
+
+def build_read_preference(mode: str, max_staleness_seconds: int):
+    """pymongo read preference for a mode (None for primary, the default); a staleness of 0 is unbounded"""
+    from pymongo import read_preferences
+
+    if mode == "primary":
+        return None
+    if 0 < max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+        raise RuntimeError(f"Max staleness must be at least {MIN_MAX_STALENESS_SECONDS}s, got {max_staleness_seconds}s")
+    cls = {
+        "primaryPreferred": read_preferences.PrimaryPreferred,
+        "secondary": read_preferences.Secondary,
+        "secondaryPreferred": read_preferences.SecondaryPreferred,
+        "nearest": read_preferences.Nearest,
+    }[mode]
+    return cls(max_staleness=max_staleness_seconds if max_staleness_seconds > 0 else -1)
+
+
+def build_read_preferences(value: str, max_staleness_seconds: int) -> Dict[str, object]:
+    """Read preference for each routed read, leaving out the ones on the primary"""
+    routes = {}
+    for name, mode in parse_read_preferences(value).items():
+        preference = build_read_preference(mode, max_staleness_seconds)
+        if preference is not None:
+            routes[name] = preference
+    return routes
@@ -0,0 +1,70 @@
+"""
+Version counters for conditional GETs.
+
+Every write that can change a cached response bumps the counter of the
+resource it touches (a user's settings, the emergencies or chat messages
+of a geo cell). ETags of nearby queries are derived from those counters
+alone, so their If-None-Match check never needs to read Mongo.
+
+Counters live in process memory and carry a random epoch, so a restart
+invalidates every ETag handed out before. A worker only counts the writes
+it serves itself, so with several workers the ETags of data other workers
+write (nearby emergencies and chat) also take a time bucket among their
+parameters, which bounds how long a write elsewhere can go unnoticed.
+
+A user's own settings and active emergency are one cheap read each, and a
+stale answer there is not acceptable for even a bucket: a cancelled
+emergency must not be confirmed as active. Their ETags are digests of the
+stored document instead (content_etag), read on every request, so they
+agree across workers and change with any write, wherever it happened.
+"""
+
+import hashlib
+import secrets
+from typing import Dict, Hashable, Iterable, Optional
+
+
+class ResourceVersions:
+    def __init__(self):
+        self._versions: Dict[Hashable, int] = {}
+        self._epoch = secrets.token_hex(4)
+
+    def get(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, key: Hashable) -> int:
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        return version
+
+    def etag(self, keys: Iterable[Hashable], *params) -> str:
+        """Weak ETag over the current versions of keys plus request parameters"""
+        return _weak_etag([self._epoch, *(f"{key!r}={self.get(key)}" for key in keys), *map(repr, params)])
+
+
+def content_etag(*params) -> str:
+    """Weak ETag over a response's own content, the same on every worker"""
+    return _weak_etag(map(repr, params))
+
+
+def _weak_etag(parts: Iterable[str]) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(f"|{part}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored on both sides
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+CPU cost vs bytes saved when compressing /api/chat/nearby payloads.
+
+Builds realistic responses through the same code path as
+get_nearby_chat_messages (projected documents + nearby_item + orjson) and
+compresses them with every available encoding and a range of levels.
+
+    python benchmarks/bench_compression.py --messages 50 150
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saferide_bench")
+
+from compression import ENCODERS, encode  # noqa: E402
+from serialization import FastJSONResponse  # noqa: E402
+from server import ChatMessage, nearby_item  # noqa: E402
+
+LEVELS = {"gzip": (1, 4, 6, 9), "br": (1, 4, 5, 6, 9), "zstd": (1, 3, 6, 10)}
+
+MESSAGES = [
+    "Trânsito parado na Marginal Pinheiros sentido Castelo",
+    "Acidente na Av. Paulista perto do MASP, evitem a faixa da esquerda",
+    "Blitz na Rebouças",
+    "Alguém precisa de ajuda? Estou parado no acostamento",
+    "Pneu furado na 23 de Maio, já chamei o guincho",
+    "Alagamento na Av. do Estado, não passem por aqui",
+]
+
+
+def chat_payload(count, seed=1):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    items = []
+    for i in range(count):
+        doc = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_name": rng.choice(["Maria Santos", "João Silva", "Ana Souza", "Carlos Lima"]),
+            "message": rng.choice(MESSAGES),
+            "latitude": -23.5505 + rng.uniform(-0.05, 0.05),
+            "longitude": -46.6333 + rng.uniform(-0.05, 0.05),
+            "created_at": now - timedelta(seconds=rng.randint(0, 86400)),
+            "message_type": "text",
+        }
+        items.append(nearby_item(doc, ChatMessage, -23.5505, -46.6333, 10.0))
+    return FastJSONResponse(items).body
+
+
+def measure(encoding, level, body, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compressed = encode(encoding, body, level)
+        best = min(best, time.perf_counter() - start)
+    return len(compressed), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 50, 150])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for count in args.messages:
+        body = chat_payload(count)
+        print(f"\n{count} messages, {len(body)} bytes identity")
+        print(f"{'encoding':<8}{'level':>6}{'bytes':>9}{'ratio':>8}{'us':>10}{'MB/s':>9}")
+        for encoding in ENCODERS:
+            for level in LEVELS[encoding]:
+                size, seconds = measure(encoding, level, body, args.repeat)
+                print(f"{encoding:<8}{level:>6}{size:>9}{len(body) / size:>8.2f}"
+                      f"{seconds * 1e6:>10.1f}{len(body) / seconds / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
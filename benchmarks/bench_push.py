@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Push dispatcher throughput against the local fake Expo push API.
+
+Sends one emergency's worth of notifications through PushDispatcher with
+a range of concurrency limits, with the fake adding Expo-like latency and
+transient failures, and reports messages per second and retries.
+
+    python benchmarks/bench_push.py --messages 20000 --latency-ms 80 --concurrency 1 4 8 16
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saferide_bench")
+
+from fake_push_server import FakePushServer  # noqa: E402
+from metrics import push_requests  # noqa: E402
+from push import PushDispatcher  # noqa: E402
+
+
+async def forget(tokens):
+    pass
+
+
+async def run(messages, concurrency, latency, error_rate, seed):
+    fake = FakePushServer(latency=latency, error_rate=error_rate, seed=seed, retry_after=0)
+    url = await fake.start()
+    dispatcher = PushDispatcher(concurrency=concurrency, backoff=0.05)
+    dispatcher.start(url, None, forget)
+    retried = push_requests.value("retried")
+    try:
+        started = time.perf_counter()
+        result = await dispatcher.send([
+            {"to": f"ExponentPushToken[{i}]", "title": "EMERGÊNCIA PRÓXIMA!", "body": "bench", "priority": "high"}
+            for i in range(messages)
+        ])
+        elapsed = time.perf_counter() - started
+    finally:
+        await dispatcher.stop()
+        await fake.stop()
+    return result, elapsed, push_requests.value("retried") - retried, fake.max_in_flight
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=46)
+    args = parser.parse_args()
+
+    print(f"{'concurrency':<13}{'msgs/s':>10}{'seconds':>10}{'accepted':>10}{'failed':>8}{'retries':>9}{'in flight':>11}")
+    for concurrency in args.concurrency:
+        result, elapsed, retries, in_flight = asyncio.run(
+            run(args.messages, concurrency, args.latency_ms / 1000, args.error_rate, args.seed)
+        )
+        print(f"{concurrency:<13}{args.messages / elapsed:>10.0f}{elapsed:>10.2f}"
+              f"{result.accepted:>10}{result.failed:>8}{retries:>9.0f}{in_flight:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Per-item serialization cost of the nearby endpoints.
+
+Compares the previous path (Model(**doc).dict() + jsonable_encoder + json)
+with the trusted read path (projected document + orjson).
+
+    python benchmarks/bench_serialization.py --items 300
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saferide_bench")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from models import ChatMessage, Emergency  # noqa: E402
+from serialization import FastJSONResponse, lean_document  # noqa: E402
+from storage import PROJECTIONS  # noqa: E402
+
+
+def make_emergencies(count):
+    now = datetime.utcnow()
+    return [{
+        "_id": uuid.uuid4().hex[:24],
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "user_name": f"Motorista {i}",
+        "vehicle_plate": f"ABC{i:04d}",
+        "latitude": -23.5505 + i * 1e-4,
+        "longitude": -46.6333 - i * 1e-4,
+        "created_at": now - timedelta(seconds=i),
+        "is_active": True,
+    } for i in range(count)]
+
+
+def make_chat_messages(count):
+    now = datetime.utcnow()
+    return [{
+        "_id": uuid.uuid4().hex[:24],
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "user_name": f"Motorista {i}",
+        "message": "Trânsito parado na Marginal Pinheiros, cuidado",
+        "latitude": -23.5505 + i * 1e-4,
+        "longitude": -46.6333 - i * 1e-4,
+        "created_at": now - timedelta(seconds=i),
+        "message_type": "text",
+    } for i in range(count)]
+
+
+def project(docs, projection):
+    return [{k: v for k, v in doc.items() if projection.get(k)} for doc in docs]
+
+
+def before(docs, model):
+    items = [{**model(**doc).dict(), "distance_km": 1.23} for doc in docs]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False).encode("utf-8")
+
+
+def after(docs, model):
+    items = []
+    for doc in docs:
+        item = lean_document(doc, model)
+        item["distance_km"] = 1.23
+        items.append(item)
+    return FastJSONResponse(items).body
+
+
+def measure(fn, make_docs, model, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        docs = make_docs()
+        start = time.perf_counter()
+        fn(docs, model)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    emergencies = make_emergencies(args.items)
+    messages = make_chat_messages(args.items)
+    cases = [
+        ("emergencies/nearby", Emergency, emergencies, PROJECTIONS["emergency"]),
+        ("chat/nearby", ChatMessage, messages, PROJECTIONS["chat_message"]),
+    ]
+
+    print(f"{'endpoint':<22}{'before us/item':>16}{'after us/item':>16}{'speedup':>10}")
+    for name, model, docs, projection in cases:
+        # The old path received full documents, the new one projected documents
+        slow = measure(before, lambda: [dict(d) for d in docs], model, args.repeat)
+        fast = measure(after, lambda: project(docs, projection), model, args.repeat)
+        per_slow = slow / args.items * 1e6
+        per_fast = fast / args.items * 1e6
+        print(f"{name:<22}{per_slow:>16.2f}{per_fast:>16.2f}{per_slow / per_fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
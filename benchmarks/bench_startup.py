@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cold-start cost of the backend, checked against a time budget.
+
+Each sample runs in a fresh interpreter, like a new worker: "import" is
+`import server`, "startup" is create_app() plus its lifespan startup
+(store opened and warmed up). Uses the in-memory store unless --mongo-url
+is given. Exits non-zero when a median goes over its budget.
+
+    python benchmarks/bench_startup.py --runs 7
+    python benchmarks/bench_startup.py --mongo-url mongodb://localhost:27017 --startup-budget-ms 300
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import server
+from config import Config
+imported = time.perf_counter()
+
+async def start():
+    app = server.create_app(Config.from_env())
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def sample(env):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-url", help="Measure the Mongo store, including pool warm-up")
+    parser.add_argument("--db-name", default="saferide_bench")
+    parser.add_argument("--import-budget-ms", type=float, default=1000.0)
+    parser.add_argument("--startup-budget-ms", type=float, default=250.0)
+    args = parser.parse_args(argv)
+
+    # No database settings unless asked for: importing must not need them
+    env = {k: v for k, v in os.environ.items() if k not in ("MONGO_URL", "DB_NAME", "STORAGE_BACKEND")}
+    if args.mongo_url:
+        env.update(STORAGE_BACKEND="mongo", MONGO_URL=args.mongo_url, DB_NAME=args.db_name)
+    else:
+        env["STORAGE_BACKEND"] = "memory"
+
+    samples = [sample(env) for _ in range(args.runs)]
+    failed = False
+    print(f"{'phase':<10}{'median ms':>12}{'max ms':>10}{'budget ms':>12}")
+    for phase, budget in (("import", args.import_budget_ms), ("startup", args.startup_budget_ms)):
+        values = [s[f"{phase}_ms"] for s in samples]
+        median = statistics.median(values)
+        over = median > budget
+        failed |= over
+        print(f"{phase:<10}{median:>12.1f}{max(values):>10.1f}{budget:>12.0f}{'  OVER BUDGET' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
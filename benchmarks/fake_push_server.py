@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Expo's push API, for push dispatcher tests and throughput runs.
+
+Implements /--/api/v2/push/send and /getReceipts with Expo's request and
+response shapes and its 100 messages per request limit. Latency, transient
+failures (503 or 429 with Retry-After) and unregistered devices can be
+injected, and every accepted message is counted.
+
+    python benchmarks/fake_push_server.py --port 8090 --latency-ms 80 --error-rate 0.05
+    EXPO_PUSH_URL=http://127.0.0.1:8090/--/api/v2/push uvicorn server:app
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from typing import Dict, Optional, Set
+
+from aiohttp import web
+
+BASE_PATH = "/--/api/v2/push"
+MAX_MESSAGES = 100
+
+
+class FakePushServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: Optional[int] = None,
+        retry_after: int = 1,
+    ):
+        self.latency = latency
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # Tokens whose tickets fail, and tokens whose receipts fail, with DeviceNotRegistered
+        self.unregistered: Set[str] = set()
+        self.uninstalled: Set[str] = set()
+        # Requests to fail before answering normally, e.g. [503, 429]
+        self.failures = []
+        self.delivered: Dict[str, int] = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._tickets: Dict[str, str] = {}
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(f"{BASE_PATH}/send", self.send)
+        app.router.add_post(f"{BASE_PATH}/getReceipts", self.get_receipts)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound}{BASE_PATH}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def delivered_total(self) -> int:
+        return sum(self.delivered.values())
+
+    async def send(self, request: web.Request) -> web.Response:
+        failure = await self._enter()
+        try:
+            if failure is not None:
+                return failure
+            messages = await request.json()
+            if not isinstance(messages, list):
+                messages = [messages]
+            if len(messages) > MAX_MESSAGES:
+                return web.json_response(
+                    {"errors": [{"code": "PUSH_TOO_MANY_NOTIFICATIONS", "message": "Too many notifications"}]},
+                    status=400,
+                )
+            tickets = []
+            for message in messages:
+                token = message["to"]
+                if token in self.unregistered:
+                    tickets.append({
+                        "status": "error",
+                        "message": f"{token} is not a registered push notification recipient",
+                        "details": {"error": "DeviceNotRegistered"},
+                    })
+                    continue
+                ticket_id = str(uuid.uuid4())
+                self._tickets[ticket_id] = token
+                self.delivered[token] = self.delivered.get(token, 0) + 1
+                tickets.append({"status": "ok", "id": ticket_id})
+            return web.json_response({"data": tickets})
+        finally:
+            self.in_flight -= 1
+
+    async def get_receipts(self, request: web.Request) -> web.Response:
+        failure = await self._enter()
+        try:
+            if failure is not None:
+                return failure
+            receipts = {}
+            for ticket_id in (await request.json())["ids"]:
+                token = self._tickets.get(ticket_id)
+                if token is None:
+                    continue
+                if token in self.uninstalled:
+                    receipts[ticket_id] = {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+                else:
+                    receipts[ticket_id] = {"status": "ok"}
+            return web.json_response({"data": receipts})
+        finally:
+            self.in_flight -= 1
+
+    async def _enter(self) -> Optional[web.Response]:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failures:
+            return self._failure(self.failures.pop(0))
+        roll = self._random.random()
+        if roll < self.error_rate:
+            return self._failure(503)
+        if roll < self.error_rate + self.rate_limit_rate:
+            return self._failure(429)
+        return None
+
+    def _failure(self, status: int) -> web.Response:
+        headers = {"Retry-After": str(self.retry_after)} if status == 429 else {}
+        return web.json_response({"errors": [{"code": "FAKE_FAILURE"}]}, status=status, headers=headers)
+
+
+async def serve(args):
+    server = FakePushServer(args.latency_ms / 1000, args.error_rate, args.rate_limit_rate, args.seed)
+    url = await server.start(args.host, args.port)
+    print(f"Fake Expo push API on {url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"{server.requests} requests, {server.delivered_total} messages delivered")
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--seed", type=int)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
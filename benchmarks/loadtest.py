@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Local load test for the SafeRide backend.
+
+Starts backend/server.py with uvicorn against a local MongoDB, or its
+in-memory store with --store memory (or targets an already running server
+with --base-url), and simulates concurrent drivers:
+register/login, location pings, nearby emergency and chat polls, chat
+messages, emergency create/cancel, plus Socket.IO listeners that measure
+alert delivery latency. Reports throughput and p50/p95/p99 per endpoint,
+writes the results as JSON and can fail on regressions against a baseline.
+
+    python benchmarks/loadtest.py --drivers 2000 --duration 60 \\
+        --mongo-url mongodb://localhost:27017 --output results/run.json
+    python benchmarks/loadtest.py --drivers 2000 --duration 60 \\
+        --baseline results/run.json --tolerance 0.2
+    python benchmarks/loadtest.py --store memory --drivers 2000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+import socketio
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# São Paulo, same reference point as backend_test.py
+CENTER = (-23.5505, -46.6333)
+
+# Relative frequency of driver actions between think times
+ACTIONS = {
+    "location": 40,
+    "nearby_emergencies": 25,
+    "nearby_chat": 20,
+    "chat_send": 10,
+    "emergency": 5,
+}
+
+CHAT_LINES = [
+    "Trânsito parado na Marginal Pinheiros",
+    "Acidente na Av. Paulista, evitem a faixa da esquerda",
+    "Blitz na Rebouças",
+    "Alagamento na Av. do Estado",
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, seconds, status):
+        self.statuses[name][status] += 1
+        if 200 <= status < 400:
+            self.latencies[name].append(seconds * 1000)
+        else:
+            self.errors[name] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[name])
+            count = len(values) + self.errors[name]
+            endpoints[name] = {
+                "count": count,
+                "errors": self.errors[name],
+                "rps": round(count / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+                "p50_ms": round(percentile(values, 0.50), 3),
+                "p95_ms": round(percentile(values, 0.95), 3),
+                "p99_ms": round(percentile(values, 0.99), 3),
+                "max_ms": round(values[-1], 3) if values else 0.0,
+                "statuses": dict(self.statuses[name]),
+            }
+        return endpoints
+
+
+class Driver:
+    def __init__(self, index, session, base_url, recorder, rng):
+        self.index = index
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.rng = rng
+        self.headers = {}
+        self.latitude = CENTER[0] + rng.uniform(-0.1, 0.1)
+        self.longitude = CENTER[1] + rng.uniform(-0.1, 0.1)
+        self.email = f"load-{uuid.uuid4().hex[:12]}@loadtest.saferide.com"
+        self.password = "load-test-123"
+
+    async def request(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, self.base_url + path, headers=self.headers, **kwargs) as response:
+                body = await response.read()
+                self.recorder.record(name, time.perf_counter() - start, response.status)
+                return response.status, body
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.recorder.record(name, time.perf_counter() - start, 599)
+            return 599, b""
+
+    async def sign_up(self, login):
+        status, body = await self.request("POST /api/register", "POST", "/api/register", json={
+            "email": self.email,
+            "password": self.password,
+            "name": f"Motorista {self.index}",
+            "vehicle_plate": f"LOD{self.index:04d}",
+        })
+        if status != 200:
+            return False
+        if login:
+            status, body = await self.request("POST /api/login", "POST", "/api/login", json={
+                "email": self.email,
+                "password": self.password,
+            })
+            if status != 200:
+                return False
+        self.headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+        return True
+
+    def move(self):
+        # Short random walk, roughly a car moving between pings
+        self.latitude += self.rng.uniform(-0.002, 0.002)
+        self.longitude += self.rng.uniform(-0.002, 0.002)
+
+    async def act(self, action):
+        position = {"latitude": self.latitude, "longitude": self.longitude}
+        if action == "location":
+            self.move()
+            await self.request("POST /api/location", "POST", "/api/location", json={
+                "user_id": "self", "latitude": self.latitude, "longitude": self.longitude,
+            })
+        elif action == "nearby_emergencies":
+            await self.request("GET /api/emergencies/nearby", "GET", "/api/emergencies/nearby", params=position)
+        elif action == "nearby_chat":
+            await self.request("GET /api/chat/nearby", "GET", "/api/chat/nearby", params=position)
+        elif action == "chat_send":
+            await self.request("POST /api/chat/send", "POST", "/api/chat/send", json={
+                **position, "message": self.rng.choice(CHAT_LINES),
+            })
+        elif action == "emergency":
+            status, _ = await self.request("POST /api/emergency", "POST", "/api/emergency", json=position)
+            if status == 200:
+                await asyncio.sleep(self.rng.uniform(0.5, 2.0))
+                await self.request("POST /api/emergency/cancel", "POST", "/api/emergency/cancel")
+
+    async def run(self, deadline, think_time):
+        names = list(ACTIONS)
+        weights = list(ACTIONS.values())
+        while time.monotonic() < deadline:
+            await self.act(self.rng.choices(names, weights)[0])
+            await asyncio.sleep(self.rng.expovariate(1 / think_time))
+
+
+class SocketListener:
+    """Socket.IO client counting broadcasts and measuring emergency alert delivery"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.received = defaultdict(int)
+        self.alert_latencies = []
+        self.client.on("*", self.on_event)
+
+    async def on_event(self, event, data):
+        self.received[event] += 1
+        if event == "emergency_alert" and data.get("created_at"):
+            sent = datetime.fromisoformat(data["created_at"])
+            self.alert_latencies.append((datetime.utcnow() - sent).total_seconds() * 1000)
+
+    async def connect(self):
+        try:
+            await self.client.connect(self.base_url, transports=["websocket"])
+            return True
+        except socketio.exceptions.ConnectionError:
+            return False
+
+    async def close(self):
+        if self.client.connected:
+            await self.client.disconnect()
+
+
+def socket_summary(listeners, connected):
+    received = defaultdict(int)
+    latencies = []
+    for listener in listeners:
+        for event, count in listener.received.items():
+            received[event] += count
+        latencies.extend(listener.alert_latencies)
+    latencies.sort()
+    return {
+        "listeners": len(listeners),
+        "connected": connected,
+        "events_received": dict(received),
+        "alert_delivery_p50_ms": round(percentile(latencies, 0.50), 3),
+        "alert_delivery_p95_ms": round(percentile(latencies, 0.95), 3),
+        "alert_delivery_p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def start_server(args):
+    env = dict(os.environ)
+    env.update(args.server_env)
+    env.setdefault("DB_NAME", f"saferide_load_{int(time.time())}")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app",
+         "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    return process, f"http://127.0.0.1:{args.port}"
+
+
+async def wait_until_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                async with session.get(base_url + "/readyz") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready in {timeout}s")
+
+
+async def run_load(args, base_url):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        drivers = [Driver(i, session, base_url, recorder, random.Random(rng.random())) for i in range(args.drivers)]
+
+        # Sign everyone up before the measured window so it measures steady
+        # state. Password hashing makes this bcrypt-bound, so register's token
+        # is reused and only a sample of drivers also logs in.
+        signup_started = time.monotonic()
+        gate = asyncio.Semaphore(args.signup_concurrency)
+
+        async def sign_up(driver):
+            async with gate:
+                return await driver.sign_up(login=rng.random() < args.login_ratio)
+
+        signed_up = await asyncio.gather(*(sign_up(driver) for driver in drivers))
+        active = [driver for driver, ok in zip(drivers, signed_up) if ok]
+        signup_seconds = time.monotonic() - signup_started
+
+        listeners = [SocketListener(base_url) for _ in range(args.sockets)]
+        connected = sum(await asyncio.gather(*(listener.connect() for listener in listeners)))
+
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            driver.run(deadline, args.think_time) for driver in active
+        ))
+        elapsed = time.monotonic() - start
+
+        await asyncio.gather(*(listener.close() for listener in listeners))
+
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "base_url": base_url,
+            "drivers": args.drivers,
+            "drivers_signed_up": len(active),
+            "signup_s": round(signup_seconds, 3),
+            "duration_s": round(elapsed, 3),
+            "think_time_s": args.think_time,
+            "connections": args.connections,
+            "seed": args.seed,
+        },
+        "endpoints": recorder.summary(elapsed),
+        "sockets": socket_summary(listeners, connected),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of p95 latency or throughput beyond tolerance, as messages"""
+    failures = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = results["endpoints"].get(name)
+        if current is None:
+            failures.append(f"{name}: missing from this run")
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms +{tolerance:.0%}")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {current['rps']} req/s < baseline {base['rps']} req/s -{tolerance:.0%}")
+    return failures
+
+
+def check_limits(results, max_p99_ms, max_error_rate):
+    failures = []
+    for name, stats in results["endpoints"].items():
+        if max_p99_ms is not None and stats["p99_ms"] > max_p99_ms:
+            failures.append(f"{name}: p99 {stats['p99_ms']}ms > {max_p99_ms}ms")
+        if stats["count"] and stats["errors"] / stats["count"] > max_error_rate:
+            failures.append(f"{name}: {stats['errors']}/{stats['count']} errors")
+    return failures
+
+
+def print_report(results):
+    meta = results["meta"]
+    print(f"\n{meta['drivers_signed_up']}/{meta['drivers']} drivers, {meta['duration_s']}s against {meta['base_url']}")
+    print(f"{'endpoint':<34}{'count':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:<34}{stats['count']:>8}{stats['errors']:>6}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    sockets = results["sockets"]
+    if sockets["listeners"]:
+        print(f"\nsockets: {sockets['connected']}/{sockets['listeners']} connected, "
+              f"events {sockets['events_received']}, alert delivery p50/p95/p99 "
+              f"{sockets['alert_delivery_p50_ms']}/{sockets['alert_delivery_p95_ms']}/{sockets['alert_delivery_p99_ms']}ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_argument_group("target")
+    target.add_argument("--base-url", help="Use an already running server instead of starting one")
+    target.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    target.add_argument("--db-name", help="Database for the spawned server (default: a fresh saferide_load_* name)")
+    target.add_argument("--port", type=int, default=8011)
+    target.add_argument("--store", choices=("mongo", "memory"), default="mongo",
+                        help="Storage backend of the spawned server")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--drivers", type=int, default=500)
+    load.add_argument("--sockets", type=int, default=50, help="Socket.IO listeners")
+    load.add_argument("--duration", type=float, default=30.0, help="Measured window in seconds")
+    load.add_argument("--think-time", type=float, default=1.0, help="Mean pause between driver actions")
+    load.add_argument("--connections", type=int, default=500, help="HTTP connection pool size")
+    load.add_argument("--request-timeout", type=float, default=30.0)
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--signup-concurrency", type=int, default=50)
+    load.add_argument("--login-ratio", type=float, default=0.1, help="Share of drivers that also log in")
+
+    report = parser.add_argument_group("report")
+    report.add_argument("--output", help="Write results JSON here")
+    report.add_argument("--baseline", help="Results JSON of a previous run to compare against")
+    report.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95/throughput regression")
+    report.add_argument("--max-p99-ms", type=float, help="Fail if any endpoint p99 exceeds this")
+    report.add_argument("--max-error-rate", type=float, default=0.01)
+
+    args = parser.parse_args(argv)
+    args.server_env = {"MONGO_URL": args.mongo_url, "STORAGE_BACKEND": args.store}
+    if args.db_name:
+        args.server_env["DB_NAME"] = args.db_name
+    return args
+
+
+async def main_async(args):
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_server(args)
+    try:
+        await wait_until_ready(base_url, process)
+        return await run_load(args, base_url)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(main_async(args))
+    print_report(results)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    failures = check_limits(results, args.max_p99_ms, args.max_error_rate)
+    if args.baseline:
+        failures += compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
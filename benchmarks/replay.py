@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Record synthetic São Paulo traffic and replay it against the backend.
+
+record simulates drivers, emergencies and chat (see traffic_sim.py) from
+a seed and writes the events to a compact traffic file. replay signs up
+one user per simulated driver, then sends the events at their recorded
+times, sped up N times, over the REST API. Locations can also go over
+Socket.IO. The first drivers also listen on Socket.IO, signed in. The
+run reports request latencies, how far sending fell behind the
+schedule, and end-to-end delivery of emergency alerts and chat messages.
+Delivery latency runs from sending the request to a listener receiving
+the event.
+
+    python benchmarks/replay.py record --drivers 2000 --duration 600 --seed 7 --output sp.traffic
+    python benchmarks/replay.py replay sp.traffic --speed 10 --store memory --listeners 200
+    python benchmarks/replay.py replay sp.traffic --speed 5 --base-url http://127.0.0.1:8001 --output run.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import aiohttp
+import socketio
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import Driver, Recorder, percentile, start_server, wait_until_ready  # noqa: E402
+from traffic_sim import (  # noqa: E402
+    CANCEL, CHAT, CHAT_LINES, EMERGENCY, LOCATION, event_counts, read_events, simulate, write_events,
+)
+
+# Alert radius of users without settings, as in server.py
+DEFAULT_ALERT_DISTANCE_KM = 10.0
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+
+class Deliveries:
+    """Send and receive times of emergencies and chat messages, matched by id"""
+
+    def __init__(self):
+        self.sent = {}
+        self.received = defaultdict(list)
+        self.expected = defaultdict(int)
+
+    def send(self, kind, item_id, at, expected):
+        self.sent[item_id] = (kind, at)
+        self.expected[kind] += expected
+
+    def receive(self, item_id, at):
+        # Events can arrive before the response carrying their id
+        self.received[item_id].append(at)
+
+    def summary(self):
+        latencies = defaultdict(list)
+        for item_id, times in self.received.items():
+            if item_id in self.sent:
+                kind, sent_at = self.sent[item_id]
+                latencies[kind].extend((at - sent_at) * 1000 for at in times)
+        return {
+            kind: {
+                **latency_summary(latencies[kind]),
+                "expected": self.expected[kind],
+                "delivered_ratio": (
+                    round(len(latencies[kind]) / self.expected[kind], 4) if self.expected[kind] else None
+                ),
+            }
+            for kind in ("emergency", "chat")
+        }
+
+
+class Listener:
+    """A simulated driver's signed-in Socket.IO connection"""
+
+    def __init__(self, driver, deliveries):
+        self.driver = driver
+        self.deliveries = deliveries
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on("emergency_alert", self.on_emergency)
+        self.client.on("new_chat_message", self.on_chat)
+
+    async def on_emergency(self, data):
+        self.deliveries.receive(data["emergency_id"], time.monotonic())
+
+    async def on_chat(self, data):
+        self.deliveries.receive(data["message_id"], time.monotonic())
+
+    async def connect(self):
+        token = self.driver.headers["Authorization"].split(" ", 1)[1]
+        try:
+            await self.client.connect(self.driver.base_url, transports=["websocket"], auth={"token": token})
+            return True
+        except socketio.exceptions.ConnectionError:
+            return False
+
+    async def update_location(self, latitude, longitude):
+        start = time.perf_counter()
+        try:
+            reply = await self.client.call("update_location", {"latitude": latitude, "longitude": longitude})
+            ok = "error" not in reply
+        except (socketio.exceptions.TimeoutError, socketio.exceptions.BadNamespaceError):
+            ok = False
+        self.driver.recorder.record("socket update_location", time.perf_counter() - start, 200 if ok else 599)
+        return ok
+
+    async def close(self):
+        if self.client.connected:
+            await self.client.disconnect()
+
+
+class Replay:
+    def __init__(self, args, session, base_url):
+        self.args = args
+        self.recorder = Recorder()
+        self.deliveries = Deliveries()
+        self.drivers = []
+        self.listeners = {}
+        self.session = session
+        self.base_url = base_url
+        # Last position the server acknowledged per listening driver, for expected alert recipients
+        self.positions = {}
+        self.schedule_lag = []
+
+    async def sign_up(self, count):
+        run = uuid.uuid4().hex[:8]
+        gate = asyncio.Semaphore(self.args.signup_concurrency)
+        self.drivers = [Driver(i, self.session, self.base_url, self.recorder, random.Random(i)) for i in range(count)]
+
+        async def sign_up(driver):
+            driver.email = f"replay-{run}-{driver.index}@replay.saferide.com"
+            async with gate:
+                return await driver.sign_up(login=False)
+
+        signed_up = await asyncio.gather(*(sign_up(driver) for driver in self.drivers))
+        listeners = [Listener(driver, self.deliveries) for driver in self.drivers[:self.args.listeners]
+                     if signed_up[driver.index]]
+        connected = await asyncio.gather(*(listener.connect() for listener in listeners))
+        self.listeners = {listener.driver.index: listener for listener, ok in zip(listeners, connected) if ok}
+        return sum(signed_up)
+
+    def expected_recipients(self, raiser, latitude, longitude):
+        return sum(
+            1 for index, (lat, lon) in self.positions.items()
+            if index != raiser and distance_km(lat, lon, latitude, longitude) <= DEFAULT_ALERT_DISTANCE_KM
+        )
+
+    async def send(self, event):
+        driver = self.drivers[event.driver]
+        if not driver.headers:
+            return
+        position = {"latitude": event.latitude, "longitude": event.longitude}
+        if event.kind == LOCATION:
+            listener = self.listeners.get(event.driver)
+            if listener is not None and event.driver % 100 < self.args.socket_location_percent:
+                ok = await listener.update_location(event.latitude, event.longitude)
+            else:
+                status, _ = await driver.request(
+                    "POST /api/location", "POST", "/api/location", json={"user_id": "self", **position}
+                )
+                ok = status == 200
+            if ok and listener is not None:
+                self.positions[event.driver] = (event.latitude, event.longitude)
+        elif event.kind == EMERGENCY:
+            expected = self.expected_recipients(event.driver, event.latitude, event.longitude)
+            sent_at = time.monotonic()
+            status, body = await driver.request("POST /api/emergency", "POST", "/api/emergency", json=position)
+            if status == 200:
+                self.deliveries.send("emergency", json.loads(body)["id"], sent_at, expected)
+        elif event.kind == CANCEL:
+            await driver.request("POST /api/emergency/cancel", "POST", "/api/emergency/cancel")
+        elif event.kind == CHAT:
+            sent_at = time.monotonic()
+            status, body = await driver.request("POST /api/chat/send", "POST", "/api/chat/send", json={
+                **position, "message": CHAT_LINES[event.line],
+            })
+            if status == 200:
+                # Chat goes to every connected socket
+                self.deliveries.send("chat", json.loads(body)["id"], sent_at, len(self.listeners))
+
+    async def run(self, events):
+        gate = asyncio.Semaphore(self.args.max_in_flight)
+        tasks = set()
+
+        async def send(event):
+            try:
+                await self.send(event)
+            finally:
+                gate.release()
+
+        start = time.monotonic()
+        for event in events:
+            due = start + event.at_ms / 1000 / self.args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await gate.acquire()
+            self.schedule_lag.append(max(0.0, time.monotonic() - due) * 1000)
+            task = asyncio.create_task(send(event))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+        # Let the last alerts arrive
+        await asyncio.sleep(self.args.drain)
+        await asyncio.gather(*(listener.close() for listener in self.listeners.values()))
+        return elapsed
+
+
+async def replay(args, meta, events):
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_server(args)
+    try:
+        await wait_until_ready(base_url, process)
+        connector = aiohttp.TCPConnector(limit=args.connections)
+        timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            runner = Replay(args, session, base_url)
+            signup_started = time.monotonic()
+            signed_up = await runner.sign_up(meta["drivers"])
+            signup_seconds = time.monotonic() - signup_started
+            elapsed = await runner.run(events)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        "meta": {
+            **meta,
+            "base_url": base_url,
+            "speed": args.speed,
+            "drivers_signed_up": signed_up,
+            "listeners": len(runner.listeners),
+            "signup_s": round(signup_seconds, 3),
+            "duration_s": round(elapsed, 3),
+            "events": event_counts(events),
+        },
+        "endpoints": runner.recorder.summary(elapsed),
+        "schedule_lag": latency_summary(runner.schedule_lag),
+        "delivery": runner.deliveries.summary(),
+    }
+
+
+def print_report(results):
+    meta = results["meta"]
+    print(f"\n{meta['drivers_signed_up']} drivers, {meta['listeners']} listening, {meta['speed']}x speed, "
+          f"{meta['duration_s']}s against {meta['base_url']}")
+    print(f"{'endpoint':<34}{'count':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:<34}{stats['count']:>8}{stats['errors']:>6}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    lag = results["schedule_lag"]
+    print(f"\nbehind schedule p50/p99/max {lag['p50_ms']}/{lag['p99_ms']}/{lag['max_ms']}ms")
+    for kind, stats in results["delivery"].items():
+        print(f"{kind} delivery: {stats['count']} of {stats['expected']} expected, "
+              f"p50/p95/p99 {stats['p50_ms']}/{stats['p95_ms']}/{stats['p99_ms']}ms")
+
+
+def record(args):
+    meta = {
+        "seed": args.seed, "drivers": args.drivers, "duration": args.duration,
+        "report_interval": args.report_interval, "incidents_per_minute": args.incidents_per_minute,
+    }
+    started = time.perf_counter()
+    events = simulate(
+        args.seed, args.drivers, args.duration, args.report_interval, args.incidents_per_minute,
+        chat_per_driver_hour=args.chat_per_driver_hour,
+    )
+    size = write_events(args.output, meta, events)
+    print(f"{len(events)} events {event_counts(events)} in {time.perf_counter() - started:.1f}s, "
+          f"{size} bytes ({size / max(len(events), 1):.1f} per event) -> {args.output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recording = commands.add_parser("record", help="simulate traffic and write it to a file")
+    recording.add_argument("--output", required=True)
+    recording.add_argument("--seed", type=int, default=1)
+    recording.add_argument("--drivers", type=int, default=2000)
+    recording.add_argument("--duration", type=float, default=600.0, help="Simulated seconds")
+    recording.add_argument("--report-interval", type=float, default=10.0, help="Seconds between location reports")
+    recording.add_argument("--incidents-per-minute", type=float, default=1.0)
+    recording.add_argument("--chat-per-driver-hour", type=float, default=0.5)
+
+    replaying = commands.add_parser("replay", help="send a traffic file to the backend")
+    replaying.add_argument("traffic")
+    replaying.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than recorded")
+    replaying.add_argument("--listeners", type=int, default=200, help="Drivers that also listen on Socket.IO")
+    replaying.add_argument("--socket-location-percent", type=int, default=50,
+                           help="Share of listeners reporting locations over Socket.IO instead of REST")
+    replaying.add_argument("--max-in-flight", type=int, default=1000)
+    replaying.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for deliveries at the end")
+    replaying.add_argument("--base-url", help="Use an already running server instead of starting one")
+    replaying.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    replaying.add_argument("--db-name", help="Database for the spawned server (default: a fresh saferide_load_* name)")
+    replaying.add_argument("--port", type=int, default=8012)
+    replaying.add_argument("--store", choices=("mongo", "memory"), default="mongo")
+    replaying.add_argument("--connections", type=int, default=500, help="HTTP connection pool size")
+    replaying.add_argument("--request-timeout", type=float, default=30.0)
+    replaying.add_argument("--signup-concurrency", type=int, default=50)
+    replaying.add_argument("--output", help="Write results JSON here")
+
+    args = parser.parse_args(argv)
+    if args.command == "replay":
+        args.server_env = {"MONGO_URL": args.mongo_url, "STORAGE_BACKEND": args.store}
+        if args.db_name:
+            args.server_env["DB_NAME"] = args.db_name
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "record":
+        record(args)
+        return 0
+    meta, events = read_events(args.traffic)
+    results = asyncio.run(replay(args, meta, events))
+    print_report(results)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
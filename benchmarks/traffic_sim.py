@@ -0,0 +1,242 @@
+"""
+Synthetic São Paulo traffic for load tests: drivers moving along roads,
+emergencies and the chat around them.
+
+The road network is a simplified São Paulo: radial avenues leaving the
+center, crossed by ring roads, as the Marginais and the Rodoanel cross
+them. Drivers start mostly near the center and drive along the roads.
+Traffic slows towards the center, and each driver reports its position
+at a fixed interval.
+
+Incidents are clustered in space and time. They happen at a few hotspots
+and each one can set off follow-up incidents nearby, like a pile-up. The
+driver closest to an incident raises the emergency, stops and cancels it
+minutes later. Drivers near it chat about it in the minutes after, on top
+of a low background rate of chat.
+
+Everything is drawn from one seeded random generator, so a seed always
+produces the same events. Events can be stored in a compact file: gzip
+over fixed 18-byte records, after a JSON header line.
+"""
+
+import gzip
+import json
+import math
+import os
+import random
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# São Paulo, same reference point as backend_test.py
+CENTER = (-23.5505, -46.6333)
+KM_PER_DEGREE_LAT = 111.195
+
+RADIALS = 16
+RINGS_KM = (1.5, 4.0, 7.0, 11.0, 16.0, 22.0)
+# Drivers start on inner rings more often
+RING_WEIGHTS = (6, 5, 4, 3, 2, 1)
+# Free-flow speed range; congestion slows traffic to a third at the center
+SPEED_KMH = (25.0, 70.0)
+CONGESTION_RADIUS_KM = 12.0
+
+CHAT_LINES = [
+    "Trânsito parado na Marginal Pinheiros",
+    "Acidente na Av. Paulista, evitem a faixa da esquerda",
+    "Blitz na Rebouças",
+    "Alagamento na Av. do Estado",
+    "Motorista parado no acostamento, alguém ajuda?",
+    "Polícia já está no local",
+    "Cuidado, carro quebrado na pista",
+    "Tudo liberado agora",
+]
+
+LOCATION, CHAT, EMERGENCY, CANCEL = range(4)
+KINDS = ("location", "chat", "emergency", "cancel")
+
+MAGIC = b"SAFERIDE-TRAFFIC 1\n"
+# at (ms), kind, driver, latitude, longitude, chat line
+RECORD = struct.Struct("<IBIffB")
+
+
+class Event(NamedTuple):
+    at_ms: int
+    kind: int
+    driver: int
+    latitude: float
+    longitude: float
+    line: int = 0
+
+
+class Roads:
+    """Intersections of radials and rings, and the road segments between them"""
+
+    def __init__(self):
+        # Node 0 is the center; then ring by ring, radial by radial
+        self.positions: List[Tuple[float, float]] = [(0.0, 0.0)]
+        for radius in RINGS_KM:
+            for radial in range(RADIALS):
+                angle = 2 * math.pi * radial / RADIALS
+                self.positions.append((radius * math.cos(angle), radius * math.sin(angle)))
+        self.neighbours: Dict[int, List[int]] = {node: [] for node in range(len(self.positions))}
+        for ring in range(len(RINGS_KM)):
+            for radial in range(RADIALS):
+                node = self.node(ring, radial)
+                self._connect(node, self.node(ring, (radial + 1) % RADIALS))
+                self._connect(node, self.node(ring - 1, radial) if ring else 0)
+
+    def node(self, ring: int, radial: int) -> int:
+        return 1 + ring * RADIALS + radial
+
+    def _connect(self, a: int, b: int):
+        self.neighbours[a].append(b)
+        self.neighbours[b].append(a)
+
+    def length(self, a: int, b: int) -> float:
+        (ax, ay), (bx, by) = self.positions[a], self.positions[b]
+        return math.hypot(bx - ax, by - ay)
+
+    def point(self, a: int, b: int, progress_km: float) -> Tuple[float, float]:
+        """(east, north) km from the center, progress_km along the segment from a to b"""
+        (ax, ay), (bx, by) = self.positions[a], self.positions[b]
+        fraction = progress_km / self.length(a, b)
+        return ax + (bx - ax) * fraction, ay + (by - ay) * fraction
+
+
+def to_degrees(east_km: float, north_km: float) -> Tuple[float, float]:
+    latitude = CENTER[0] + north_km / KM_PER_DEGREE_LAT
+    longitude = CENTER[1] + east_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(CENTER[0])))
+    return latitude, longitude
+
+
+class Driver:
+    def __init__(self, roads: Roads, rng: random.Random, report_interval: float):
+        ring = rng.choices(range(len(RINGS_KM)), RING_WEIGHTS)[0]
+        self.start = roads.node(ring, rng.randrange(RADIALS))
+        self.end = rng.choice(roads.neighbours[self.start])
+        self.progress = rng.uniform(0, roads.length(self.start, self.end))
+        self.speed_kmh = rng.uniform(*SPEED_KMH)
+        self.report_offset = rng.uniform(0, report_interval)
+        self.stopped_until = 0.0
+
+    def position(self, roads: Roads) -> Tuple[float, float]:
+        return roads.point(self.start, self.end, self.progress)
+
+    def drive(self, roads: Roads, rng: random.Random, seconds: float):
+        east, north = self.position(roads)
+        congestion = 1 / 3 + 2 / 3 * min(1.0, math.hypot(east, north) / CONGESTION_RADIUS_KM)
+        remaining = self.speed_kmh * congestion * seconds / 3600
+        while remaining > 0:
+            left = roads.length(self.start, self.end) - self.progress
+            if remaining < left:
+                self.progress += remaining
+                return
+            remaining -= left
+            # On to another road, turning back only at a dead end
+            choices = [node for node in roads.neighbours[self.end] if node != self.start] or [self.start]
+            self.start, self.end, self.progress = self.end, rng.choice(choices), 0.0
+
+
+def simulate(
+    seed: int,
+    drivers: int = 2000,
+    duration: float = 600.0,
+    report_interval: float = 10.0,
+    incidents_per_minute: float = 1.0,
+    hotspots: int = 6,
+    aftershock_probability: float = 0.4,
+    chat_per_driver_hour: float = 0.5,
+    chat_radius_km: float = 2.0,
+) -> List[Event]:
+    """Events of a simulated city, in time order"""
+    rng = random.Random(seed)
+    roads = Roads()
+    fleet = [Driver(roads, rng, report_interval) for _ in range(drivers)]
+    # Hotspots are intersections, mostly central ones
+    spots = [
+        roads.positions[roads.node(rng.choices(range(len(RINGS_KM)), RING_WEIGHTS)[0], rng.randrange(RADIALS))]
+        for _ in range(hotspots)
+    ]
+    # A Poisson process at the hotspots; aftershocks are added as they happen
+    incidents = []
+    at = rng.expovariate(incidents_per_minute / 60)
+    while at < duration:
+        incidents.append((at, rng.choice(spots)))
+        at += rng.expovariate(incidents_per_minute / 60)
+    events: List[Event] = []
+    active_until: Dict[int, float] = {}
+
+    def emit(seconds, kind, driver, east, north, line=0):
+        events.append(Event(int(seconds * 1000), kind, driver, *to_degrees(east, north), line))
+
+    second = 0
+    while second < duration:
+        # Incidents of this second, and the aftershocks they set off
+        while incidents and incidents[0][0] < second + 1:
+            at, (east, north) = incidents.pop(0)
+            positions = [driver.position(roads) for driver in fleet]
+            raiser = min(
+                (index for index in range(drivers) if index not in active_until),
+                key=lambda index: math.hypot(positions[index][0] - east, positions[index][1] - north),
+                default=None,
+            )
+            if raiser is None:
+                continue
+            driver = fleet[raiser]
+            position = positions[raiser]
+            resolved = at + rng.uniform(60, 300)
+            active_until[raiser] = resolved
+            driver.stopped_until = resolved
+            emit(at, EMERGENCY, raiser, *position)
+            if resolved < duration:
+                emit(resolved, CANCEL, raiser, *position)
+            for index, (other_east, other_north) in enumerate(positions):
+                near = math.hypot(other_east - position[0], other_north - position[1]) <= chat_radius_km
+                if index != raiser and near and rng.random() < 0.3:
+                    chat_at = at + rng.expovariate(1 / 30)
+                    if chat_at < duration:
+                        emit(chat_at, CHAT, index, other_east, other_north, rng.randrange(len(CHAT_LINES)))
+            if rng.random() < aftershock_probability:
+                follow_up_at = at + rng.expovariate(1 / 60)
+                if follow_up_at < duration:
+                    incidents.append((follow_up_at, (position[0] + rng.gauss(0, 0.5), position[1] + rng.gauss(0, 0.5))))
+                    incidents.sort()
+        for index, driver in enumerate(fleet):
+            if active_until.get(index, math.inf) <= second:
+                del active_until[index]
+            if driver.stopped_until <= second:
+                driver.drive(roads, rng, 1.0)
+            position = driver.position(roads)
+            # One report per interval, at the driver's own offset within it
+            if (second - driver.report_offset) % report_interval < 1:
+                emit(second + (driver.report_offset % 1), LOCATION, index, *position)
+            if rng.random() < chat_per_driver_hour / 3600:
+                emit(second + rng.random(), CHAT, index, *position, rng.randrange(len(CHAT_LINES)))
+        second += 1
+    events.sort()
+    return events
+
+
+def write_events(path: str, meta: dict, events: Iterable[Event]) -> int:
+    """Write a traffic file; its size in bytes"""
+    with gzip.open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(json.dumps(meta).encode() + b"\n")
+        for event in events:
+            file.write(RECORD.pack(*event))
+    return os.path.getsize(path)
+
+
+def read_events(path: str) -> Tuple[dict, List[Event]]:
+    with gzip.open(path, "rb") as file:
+        if file.readline() != MAGIC:
+            raise ValueError(f"{path} is not a traffic file")
+        meta = json.loads(file.readline())
+        data = file.read()
+    return meta, [Event(*fields) for fields in RECORD.iter_unpack(data)]
+
+
+def event_counts(events: Iterable[Event]) -> Dict[str, int]:
+    counts = {kind: 0 for kind in KINDS}
+    for event in events:
+        counts[KINDS[event.kind]] += 1
+    return counts
@@ -123,7 +123,12 @@ export default function Chat() {
 
   const setupWebSocket = () => {
     if (!socketRef.current) {
-      socketRef.current = io(BACKEND_URL!);
+      // Signed-in sockets only get the alerts their own radius covers
+      socketRef.current = io(BACKEND_URL!, {
+        auth: (cb) => {
+          AsyncStorage.getItem('auth_token').then((token) => cb({ token }));
+        },
+      });
       
       socketRef.current.on('new_chat_message', (data) => {
         if (location) {
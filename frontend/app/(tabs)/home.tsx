@@ -41,6 +41,9 @@ export default function HomeScreen() {
   const [emergencyButtonDisabled, setEmergencyButtonDisabled] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
   const socketRef = useRef<Socket | null>(null);
+  // Next location report, as scheduled by the server's recommendation
+  const reportTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const lastReport = useRef<{ latitude: number; longitude: number; minDisplacementM: number; intervalS: number } | null>(null);
   
   // Animation for emergency button
   const scaleValue = useRef(new Animated.Value(1)).current;
@@ -57,6 +60,9 @@ export default function HomeScreen() {
       if (pulseAnimation.current) {
         pulseAnimation.current.stop();
       }
+      if (reportTimer.current) {
+        clearTimeout(reportTimer.current);
+      }
     };
   }, []);
 
@@ -104,7 +110,7 @@ export default function HomeScreen() {
       const token = await AsyncStorage.getItem('auth_token');
       if (!token) return;
 
-      await fetch(`${BACKEND_URL}/api/location`, {
+      const response = await fetch(`${BACKEND_URL}/api/location`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -115,11 +121,54 @@ export default function HomeScreen() {
           longitude: currentLocation.coords.longitude,
         }),
       });
+      if (response.ok) {
+        const plan = await response.json();
+        lastReport.current = {
+          latitude: currentLocation.coords.latitude,
+          longitude: currentLocation.coords.longitude,
+          minDisplacementM: plan.min_displacement_m,
+          intervalS: plan.next_report_seconds,
+        };
+        scheduleLocationReport(plan.next_report_seconds);
+      }
     } catch (error) {
       console.error('Error updating location:', error);
     }
   };
 
+  const scheduleLocationReport = (seconds: number) => {
+    if (reportTimer.current) {
+      clearTimeout(reportTimer.current);
+    }
+    reportTimer.current = setTimeout(reportLocation, seconds * 1000);
+  };
+
+  // Reports only moves the server says are worth it, more often near emergencies
+  const reportLocation = async () => {
+    const previous = lastReport.current;
+    try {
+      const currentLocation = await Location.getCurrentPositionAsync({
+        accuracy: Location.Accuracy.Balanced,
+      });
+      const movedM = previous ? calculateDistance(
+        previous.latitude,
+        previous.longitude,
+        currentLocation.coords.latitude,
+        currentLocation.coords.longitude
+      ) * 1000 : Infinity;
+      if (previous && movedM < previous.minDisplacementM) {
+        scheduleLocationReport(previous.intervalS);
+        return;
+      }
+      await updateLocationOnServer(currentLocation);
+    } catch (error) {
+      console.error('Error reporting location:', error);
+      if (previous) {
+        scheduleLocationReport(previous.intervalS);
+      }
+    }
+  };
+
   const checkEmergencyState = async () => {
     try {
       const emergencyState = await AsyncStorage.getItem('emergency_button_disabled');
@@ -134,7 +183,12 @@ export default function HomeScreen() {
 
   const setupWebSocket = () => {
     if (!socketRef.current) {
-      socketRef.current = io(BACKEND_URL!);
+      // Signed-in sockets only get the alerts their own radius covers
+      socketRef.current = io(BACKEND_URL!, {
+        auth: (cb) => {
+          AsyncStorage.getItem('auth_token').then((token) => cb({ token }));
+        },
+      });
       
       socketRef.current.on('emergency_alert', (data) => {
         if (location) {
@@ -37,6 +37,14 @@ export const getDeviceInfo = async (): Promise<DeviceInfo> => {
   }
 };
 
+const storeEntitlement = async (entitlement?: string) => {
+  if (entitlement) {
+    await AsyncStorage.setItem('subscription_entitlement', entitlement);
+  } else {
+    await AsyncStorage.removeItem('subscription_entitlement');
+  }
+};
+
 export const checkDeviceBinding = async (deviceInfo: DeviceInfo): Promise<boolean> => {
   try {
     const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
@@ -44,17 +52,21 @@ export const checkDeviceBinding = async (deviceInfo: DeviceInfo): Promise<boolea
     
     if (!token) return false;
 
+    // A valid entitlement lets the server answer without a database lookup
+    const entitlement = await AsyncStorage.getItem('subscription_entitlement');
     const response = await fetch(
       `${BACKEND_URL}/api/subscription/check-device?device_id=${deviceInfo.device_id}`,
       {
         headers: {
           'Authorization': `Bearer ${token}`,
+          ...(entitlement ? { 'X-Entitlement': entitlement } : {}),
         },
       }
     );
 
     if (response.ok) {
       const data = await response.json();
+      await storeEntitlement(data.entitlement);
       return data.device_bound;
     }
     
@@ -94,6 +106,8 @@ export const bindDeviceToSubscription = async (
     });
 
     if (response.ok) {
+      const data = await response.json();
+      await storeEntitlement(data.entitlement);
       return { success: true };
     } else {
       const error = await response.json();
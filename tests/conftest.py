@@ -0,0 +1,31 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# server.py is run from backend/ (uvicorn server:app), so its sibling modules
+# are imported as top-level modules.
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "saferide_test")
+
+
+@pytest.fixture
+def app_globals(monkeypatch):
+    """Restore the server globals create_app() and its lifespan set"""
+    import server
+    for name in ("store", "ADMIN_TOKEN", "slow_requests"):
+        monkeypatch.setattr(server, name, getattr(server, name))
+
+
+@pytest.fixture(autouse=True)
+def empty_nearby_caches():
+    """Tests share coordinates but not stores, so no cached result or position may outlive a test"""
+    import server
+    server.emergency_cache.clear()
+    server.chat_cache.clear()
+    server.geofence.clear()
+    server.presence.clear()
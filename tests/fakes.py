@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+
+def apply_projection(doc, projection):
+    if projection is None:
+        return dict(doc)
+    included = {k for k, v in projection.items() if v and k != "_id"}
+    if included:
+        result = {k: v for k, v in doc.items() if k in included}
+    else:
+        result = {k: v for k, v in doc.items() if k not in projection}
+    if projection.get("_id", 1):
+        result["_id"] = "oid"
+    return result
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.closed = False
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """Motor-like collection that ignores filters and records every read"""
+
+    def __init__(self, name, db, read_preference=None):
+        self.name = name
+        self.db = db
+        self.read_preference = read_preference
+
+    def with_options(self, read_preference=None, **kwargs):
+        return FakeCollection(self.name, self.db, read_preference)
+
+    def _read(self, projection):
+        self.db.reads.append((self.name, projection))
+        self.db.read_preferences.append((self.name, self.read_preference))
+        return [apply_projection(doc, projection) for doc in self.db.documents.get(self.name, [])]
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        docs = self._read(projection)
+        return docs[0] if docs else None
+
+    def find(self, filter=None, projection=None, **kwargs):
+        self.db.filters.append((self.name, filter))
+        return FakeCursor(self._read(projection))
+
+    async def find_one_and_update(self, filter, update, projection=None, **kwargs):
+        docs = self._read(projection)
+        return docs[0] if docs else None
+
+    async def find_one_and_delete(self, filter, projection=None, **kwargs):
+        docs = self._read(projection)
+        return docs[0] if docs else None
+
+    async def insert_one(self, document):
+        self.db.writes.append((self.name, "insert_one", document))
+        return SimpleNamespace(inserted_id="oid")
+
+    async def insert_many(self, documents, **kwargs):
+        self.db.writes.append((self.name, "insert_many", documents))
+        return SimpleNamespace(inserted_ids=["oid"] * len(documents))
+
+    async def update_one(self, filter, update, **kwargs):
+        self.db.writes.append((self.name, "update_one", update))
+        return SimpleNamespace(matched_count=1)
+
+    async def delete_one(self, filter):
+        self.db.writes.append((self.name, "delete_one", filter))
+        return SimpleNamespace(deleted_count=1)
+
+    async def delete_many(self, filter):
+        self.db.writes.append((self.name, "delete_many", filter))
+        return SimpleNamespace(deleted_count=1)
+
+
+class FakeDatabase:
+    def __init__(self, documents=None):
+        self.documents = documents or {}
+        self.reads = []
+        self.read_preferences = []
+        self.filters = []
+        self.writes = []
+
+    def __getattr__(self, name):
+        return FakeCollection(name, self)
+
+
+async def noop_emit(*args, **kwargs):
+    pass
@@ -0,0 +1,143 @@
+import asyncio
+import tracemalloc
+
+import orjson
+
+import server
+from alerts import KEEPALIVE, RESYNC, AlertBroker
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+SAO_PAULO = (-23.5505, -46.6333)
+RIO = (-22.9068, -43.1729)
+
+
+def events(frames):
+    return [frame.split(b"event: ")[1].split(b"\n")[0].decode() for frame in frames if b"event: " in frame]
+
+
+def test_events_reach_streams_whose_radius_covers_them():
+    broker = AlertBroker(10.0)
+    near, _ = broker.subscribe("u1", *SAO_PAULO, 2.0)
+    wide, _ = broker.subscribe("u2", SAO_PAULO[0] + 0.05, SAO_PAULO[1], 10.0)  # ~5.5km north
+    carioca, _ = broker.subscribe("u3", *RIO, 10.0)
+
+    assert broker.publish("emergency_alert", {"emergency_id": "e1"}, *SAO_PAULO) == 2
+    assert broker.publish("maintenance", {}) == 3
+    broker.move("u3", *SAO_PAULO)
+    broker.publish("emergency_resolved", {"emergency_id": "e1"}, *SAO_PAULO)
+
+    assert events(near.pending) == ["emergency_alert", "maintenance", "emergency_resolved"]
+    assert events(wide.pending) == ["emergency_alert", "maintenance", "emergency_resolved"]
+    assert events(carioca.pending) == ["maintenance", "emergency_resolved"]
+
+
+def test_recipients_add_to_the_streams_found_by_position():
+    broker = AlertBroker(10.0)
+    # Not a recipient (no position synced yet), but its stream covers the event
+    near, _ = broker.subscribe("u1", *SAO_PAULO, 2.0)
+    # A recipient whose stream was opened elsewhere
+    away, _ = broker.subscribe("u2", *RIO, 10.0)
+    other, _ = broker.subscribe("u3", *RIO, 10.0)
+
+    assert broker.publish("emergency_alert", {"emergency_id": "e1"}, *SAO_PAULO, recipients={"u1", "u2"}) == 2
+    assert events(near.pending) == events(away.pending) == ["emergency_alert"]
+    assert other.pending == []
+
+
+def test_last_event_id_resumes_from_the_shared_history():
+    broker = AlertBroker(10.0, history_size=3)
+    first, _ = broker.subscribe("u1", *SAO_PAULO, 5.0)
+    broker.publish("emergency_alert", {"emergency_id": "e1"}, *SAO_PAULO)
+    last_seen = first.pending[0].split(b"\n")[0][len(b"id: "):].decode()
+    broker.unsubscribe(first)
+
+    broker.publish("emergency_alert", {"emergency_id": "e2"}, *RIO)
+    broker.publish("emergency_resolved", {"emergency_id": "e1"}, *SAO_PAULO)
+    _, missed = broker.subscribe("u1", *SAO_PAULO, 5.0, last_event_id=last_seen)
+    assert events(missed) == ["emergency_resolved"]
+
+    # Out of the ring, or from another worker: the client has to refetch
+    broker.publish("new_chat_message", {}, *SAO_PAULO)
+    broker.publish("new_chat_message", {}, *SAO_PAULO)
+    assert broker.subscribe("u1", *SAO_PAULO, 5.0, last_event_id=last_seen)[1] == [RESYNC]
+    assert broker.subscribe("u1", *SAO_PAULO, 5.0, last_event_id="other-1")[1] == [RESYNC]
+
+
+def test_slow_streams_resync_instead_of_buffering():
+    broker = AlertBroker(10.0, buffer_size=3)
+    subscriber, _ = broker.subscribe("u1", *SAO_PAULO, 5.0)
+    for i in range(5):
+        broker.publish("new_chat_message", {"message_id": f"m{i}"}, *SAO_PAULO)
+    assert subscriber.pending[0] == RESYNC and events(subscriber.pending) == ["resync", "new_chat_message"]
+
+
+def test_heartbeat_and_stream_footprint():
+    broker = AlertBroker(10.0, heartbeat=0.01)
+
+    async def run():
+        stream = broker.stream("u1", *SAO_PAULO, 5.0)
+        broker.start()
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        await broker.stop()
+        await stream.aclose()
+        return frames
+
+    assert asyncio.run(run()) == [broker.retry, KEEPALIVE]
+    assert len(broker) == 0
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        streams = [broker.subscribe(f"u{i}", SAO_PAULO[0] + i * 1e-4, SAO_PAULO[1], 5.0) for i in range(5000)]
+        per_stream = (tracemalloc.get_traced_memory()[0] - before) / len(streams)
+    finally:
+        tracemalloc.stop()
+    # 50k streams in well under 100MB
+    assert per_stream < 1500
+
+
+def test_stream_endpoint_delivers_nearby_emergencies(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server, "alert_broker", AlertBroker(server.MAX_ALERT_DISTANCE_KM))
+    monkeypatch.setattr(server.sio, "emit", lambda *args, **kwargs: asyncio.sleep(0))
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+    ana = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+    caio = User(id="u3", email="caio@saferide.com", name="Caio", vehicle_plate="RIO0001")
+
+    async def run():
+        response = await server.stream_alerts(*SAO_PAULO, last_event_id=None, current_user=maria)
+        body = response.body_iterator
+        retry = await body.__anext__()
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=RIO[0], longitude=RIO[1]), idempotency_key=None, current_user=ana)
+        emergency = await server.create_emergency(
+            server.EmergencyCreate(latitude=SAO_PAULO[0] + 0.01, longitude=SAO_PAULO[1]),
+            idempotency_key=None, current_user=caio)
+        frame = await body.__anext__()
+        await body.aclose()
+        return response, retry, frame, emergency
+
+    response, retry, frame, emergency = asyncio.run(run())
+    assert response.media_type == "text/event-stream" and retry.startswith(b"retry:")
+    assert events([frame]) == ["emergency_alert"]
+    assert orjson.loads(frame.split(b"data: ")[1])["emergency_id"] == emergency.id
+    assert len(server.alert_broker) == 0
+
+
+def test_stream_endpoint_subscribes_only_once_the_response_starts(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    monkeypatch.setattr(server, "alert_broker", AlertBroker(server.MAX_ALERT_DISTANCE_KM))
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+
+    async def run():
+        response = await server.stream_alerts(*SAO_PAULO, last_event_id=None, current_user=maria)
+        registered = len(server.alert_broker)
+        # The client disconnected before the first frame was sent
+        await response.body_iterator.aclose()
+        return registered
+
+    assert asyncio.run(run()) == 0
+    assert len(server.alert_broker) == 0 and not server.alert_broker.connected("u1")
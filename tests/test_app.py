@@ -0,0 +1,51 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import server
+from config import Config
+from storage import MemoryStore, open_store
+from tests.conftest import BACKEND_DIR
+
+
+def test_import_needs_no_database_or_mongo_driver():
+    env = {k: v for k, v in os.environ.items() if k not in ("MONGO_URL", "DB_NAME")}
+    code = "import sys, server; print(any(m in sys.modules for m in ('motor', 'pymongo', 'passlib')))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_config_from_env():
+    config = Config.from_env({"STORAGE_BACKEND": "memory", "ADMIN_TOKEN": "", "MONGO_WARMUP_CONNECTIONS": "3"})
+    assert config.storage_backend == "memory"
+    assert config.admin_token is None
+    assert config.mongo_warmup_connections == 3
+    assert config.mongo_url is None
+
+
+def test_open_store_rejects_unknown_backend_and_missing_mongo_url():
+    with pytest.raises(RuntimeError, match="STORAGE_BACKEND"):
+        open_store(Config(storage_backend="redis"))
+    with pytest.raises(RuntimeError, match="MONGO_URL"):
+        open_store(Config(storage_backend="mongo"))
+
+
+def test_lifespan_opens_and_closes_the_store(app_globals):
+    app = server.create_app(Config(storage_backend="memory", admin_token="s3cret", slow_request_threshold_ms=50))
+    assert server.ADMIN_TOKEN == "s3cret"
+    assert server.slow_requests.threshold_ms == 50
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            opened = server.store
+            running = server.loop_lag_monitor.running
+        return opened, running, server.loop_lag_monitor.running
+
+    opened, running, running_after = asyncio.run(run())
+    assert isinstance(opened, MemoryStore)
+    assert running and not running_after
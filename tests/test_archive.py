@@ -0,0 +1,99 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from archive import EmergencyArchiver
+from models import User
+from storage import MemoryStore, MongoStore
+from tests.fakes import FakeDatabase
+
+ANA = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+
+
+def emergency(i, user_id="u2", is_active=False):
+    return {
+        "id": f"e{i}", "user_id": user_id, "user_name": "Ana", "vehicle_plate": "ABC1234",
+        "latitude": -23.5505, "longitude": -46.6333, "created_at": datetime(2025, 9, 22, 10, i), "is_active": is_active,
+    }
+
+
+def test_archiver_moves_only_emergencies_resolved_before_the_cutoff():
+    store = MemoryStore()
+    archiver = EmergencyArchiver(timedelta(hours=1), batch_size=2)
+
+    async def run():
+        for i in range(5):
+            await store.emergencies.insert(emergency(i, user_id=f"u{i}", is_active=True))
+        for i in range(3):
+            await store.emergencies.deactivate(f"e{i}", f"u{i}")
+        too_recent = await archiver.run_once(store.emergencies.archive_resolved, datetime.utcnow())
+        moved = await archiver.run_once(store.emergencies.archive_resolved, datetime.utcnow() + timedelta(hours=2))
+        return too_recent, moved, await store.emergencies.get_active_for_user("u3")
+
+    too_recent, moved, active = asyncio.run(run())
+    assert (too_recent, moved) == (0, 3)
+    assert set(store.emergencies.by_id) == {"e3", "e4"} and set(store.emergencies.archive) == {"e0", "e1", "e2"}
+    assert active["id"] == "e3"
+
+
+def test_archiver_moves_the_backlog_resolved_before_updated_at_was_written():
+    store = MemoryStore()
+    # Legacy documents, resolved without an updated_at
+    store.emergencies.by_id = {doc["id"]: doc for doc in (emergency(0), emergency(1, user_id="u3", is_active=True))}
+    archiver = EmergencyArchiver(timedelta(hours=1))
+    moved = asyncio.run(archiver.run_once(store.emergencies.archive_resolved, datetime(2025, 9, 24)))
+    assert moved == 1 and set(store.emergencies.archive) == {"e0"} and set(store.emergencies.by_id) == {"e1"}
+
+    db = FakeDatabase({"emergencies": [{**emergency(0), "_id": "oid0"}]})
+    asyncio.run(MongoStore(db).emergencies.archive_resolved(datetime(2025, 9, 23), 500))
+    assert db.filters == [("emergencies", {"is_active": False, "$or": [
+        {"updated_at": {"$lt": datetime(2025, 9, 23)}},
+        {"updated_at": {"$exists": False}, "created_at": {"$lt": datetime(2025, 9, 23)}},
+    ]})]
+
+
+def test_history_pages_through_archived_and_live_emergencies(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+
+    async def run():
+        for i in range(5):
+            await store.emergencies.insert(emergency(i))
+        await store.emergencies.insert(emergency(5, is_active=True))
+        await store.emergencies.insert(emergency(6, user_id="u3"))
+        # The three oldest are archived, the two newest not yet
+        await store.emergencies.archive_resolved(datetime.utcnow() + timedelta(seconds=1), 3)
+        pages, before = [], None
+        while True:
+            page = json.loads((await server.get_emergency_history(limit=2, before=before, current_user=ANA)).body)
+            pages.append([item["id"] for item in page["items"]])
+            before = page["next"]
+            if before is None:
+                return pages
+
+    assert asyncio.run(run()) == [["e4", "e3"], ["e2", "e1"], ["e0"]]
+    assert set(store.emergencies.archive) == {"e0", "e1", "e2"}
+
+
+def test_history_rejects_a_malformed_cursor(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_emergency_history(limit=20, before="yesterday", current_user=ANA))
+    assert exc.value.status_code == 400
+
+
+def test_mongo_archive_copies_before_deleting_from_the_live_collection():
+    resolved = [{**emergency(i), "_id": f"oid{i}"} for i in range(2)]
+    db = FakeDatabase({"emergencies": resolved})
+    store = MongoStore(db)
+
+    moved = asyncio.run(store.emergencies.archive_resolved(datetime(2025, 9, 23), 500))
+    assert moved == 2
+    assert db.writes == [
+        ("emergencies_archive", "insert_many", resolved),
+        ("emergencies", "delete_many", {"_id": {"$in": ["oid0", "oid1"]}, "is_active": False}),
+    ]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+import server
+from coalescing import SingleFlight
+from geo import cell_center, cell_of, cell_reach_km
+from metrics import singleflight_calls
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+
+def test_concurrent_calls_share_one_fetch_and_errors():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "boom":
+            raise ValueError(value)
+        return [value]
+
+    async def run():
+        shared = await asyncio.gather(*(flight.run("a", lambda: fetch("a")) for _ in range(5)))
+        other = await flight.run("b", lambda: fetch("b"))
+        again = await flight.run("a", lambda: fetch("a"))
+        failures = await asyncio.gather(
+            *(flight.run("c", lambda: fetch("boom")) for _ in range(3)), return_exceptions=True
+        )
+        return shared, other, again, failures
+
+    shared, other, again, failures = asyncio.run(run())
+    assert shared == [["a"]] * 5 and other == ["b"] and again == ["a"]
+    assert calls == ["a", "b", "a", "boom"]
+    assert all(isinstance(error, ValueError) for error in failures)
+    assert len(flight) == 0
+
+
+def test_leader_cancellation_does_not_cancel_followers():
+    flight = SingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.run("a", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run("a", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_cell_reach_covers_every_point_of_the_cell():
+    cell = cell_of(-23.5505, -46.6333, 0.01)
+    center_lat, center_lon = cell_center(cell, 0.01)
+    reach = cell_reach_km(cell, 0.01)
+    for corner_lat in (cell[0] * 0.01, (cell[0] + 1) * 0.01):
+        for corner_lon in (cell[1] * 0.01, (cell[1] + 1) * 0.01):
+            assert server.calculate_distance(center_lat, center_lon, corner_lat, corner_lon) <= reach
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    return store
+
+
+def test_nearby_drivers_in_one_cell_share_a_fetch(memory_server, monkeypatch):
+    drivers = [User(id=f"u{i}", email=f"u{i}@saferide.com", name=f"U{i}", vehicle_plate=f"P{i}") for i in range(5)]
+    fetches = []
+    find_active_near = memory_server.emergencies.find_active_near
+
+    async def slow_find(*args):
+        fetches.append(args)
+        await asyncio.sleep(0.01)
+        return await find_active_near(*args)
+
+    monkeypatch.setattr(memory_server.emergencies, "find_active_near", slow_find)
+    followers = singleflight_calls.value("emergencies_nearby", "follower")
+
+    async def run():
+        for i, driver in enumerate(drivers[:2]):
+            await memory_server.emergencies.insert({
+                "id": f"e{i}", "user_id": driver.id, "user_name": driver.name, "vehicle_plate": driver.vehicle_plate,
+                "latitude": -23.5505, "longitude": -46.6333, "created_at": datetime(2025, 9, 22), "is_active": True,
+            })
+        # Same jam, slightly different GPS fixes
+        return await asyncio.gather(*(
+            server.get_nearby_emergencies(
+                latitude=-23.5505 + i * 1e-4, longitude=-46.6333, accept=None, if_none_match=None, current_user=driver)
+            for i, driver in enumerate(drivers)
+        ))
+
+    responses = asyncio.run(run())
+    results = [[item["id"] for item in json.loads(response.body)] for response in responses]
+    assert len(fetches) == 1
+    assert singleflight_calls.value("emergencies_nearby", "follower") - followers == 4
+    # Own emergency is still filtered per caller
+    assert results == [["e1"], ["e0"], ["e0", "e1"], ["e0", "e1"], ["e0", "e1"]]
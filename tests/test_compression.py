@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+
+from compression import ENCODERS, CompressionMiddleware, negotiate
+
+BODY = b'{"message":"Transito parado na Marginal Pinheiros"}' * 100
+
+
+def make_app(body=BODY, status=200, chunks=None, content_type=b"application/json"):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type), (b"etag", b'W/"abc"')]
+        if chunks is None:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if chunks is None:
+            await send({"type": "http.response.body", "body": body})
+        else:
+            for i, chunk in enumerate(chunks):
+                await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def call(app, accept_encoding, path="/api/chat/nearby", **options):
+    middleware = CompressionMiddleware(app, **options)
+    scope = {
+        "type": "http", "path": path, "method": "GET",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return start["status"], headers, [m.get("body", b"") for m in messages[1:]]
+
+
+def test_negotiate_honours_q_values_and_preference():
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip;q=0, br;q=0") is None
+    assert negotiate("gzip, zstd, br", available={"gzip": None, "br": None}) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", available={"gzip": None, "br": None}) == "gzip"
+    assert negotiate("*", available={"gzip": None}) == "gzip"
+
+
+def test_large_body_is_gzipped_with_headers():
+    status, headers, bodies = call(make_app(), "gzip")
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(bodies[0])
+    assert gzip.decompress(bodies[0]) == BODY
+
+
+def test_small_body_and_304_are_left_alone():
+    _, headers, bodies = call(make_app(body=b'{"ok":true}'), "gzip", minimum_size=1024)
+    assert "content-encoding" not in headers
+    assert bodies == [b'{"ok":true}']
+
+    status, headers, _ = call(make_app(body=b"", status=304), "gzip", minimum_size=0)
+    assert status == 304
+    assert "content-encoding" not in headers
+
+
+def test_streamed_chunks_are_flushed_individually():
+    lines = [b'{"id":"e%d"}\n' % i * 50 for i in range(3)]
+    _, headers, bodies = call(make_app(chunks=lines, content_type=b"application/x-ndjson"), "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert len(bodies) == 3 and all(bodies)
+    assert gzip.decompress(b"".join(bodies)) == b"".join(lines)
+
+
+def test_route_level_and_optional_encoders():
+    for encoding in ENCODERS:
+        _, headers, bodies = call(make_app(), encoding, route_levels={"/api/chat/nearby": {encoding: 1}})
+        assert headers["content-encoding"] == encoding
+        assert len(bodies[0]) < len(BODY)
+
+
+def test_excluded_paths_pass_through():
+    _, headers, _ = call(make_app(), "gzip", path="/socket.io/", exclude_paths=("/socket.io",))
+    assert "content-encoding" not in headers
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+from server import User
+from storage import MongoStore
+from tests.fakes import FakeDatabase, noop_emit
+from versions import ResourceVersions, etag_matches
+
+USER = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+OTHER = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+
+EMERGENCY = {
+    "id": "e1", "user_id": "u2", "user_name": "Ana", "vehicle_plate": "ABC1234",
+    "latitude": -23.5505, "longitude": -46.6333, "created_at": datetime(2025, 9, 22), "is_active": True,
+}
+
+
+def test_etag_matches_weak_and_lists():
+    versions = ResourceVersions()
+    etag = versions.etag([("settings", "u1")], "u1")
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag[2:]}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+
+    versions.bump(("settings", "u1"))
+    assert not etag_matches(etag, versions.etag([("settings", "u1")], "u1"))
+
+
+def test_settings_and_active_emergency_etags_follow_writes_by_other_workers(monkeypatch):
+    # Another worker's writes only show in the stored documents
+    db = FakeDatabase({
+        "user_settings": [{"emergency_contacts": ["+5511999999999"], "alert_distance_km": 5.0}],
+        "emergencies": [{**EMERGENCY, "user_id": "u1"}],
+    })
+    monkeypatch.setattr(server, "store", MongoStore(db))
+
+    async def run():
+        response = Response()
+        await server.get_user_settings(response, if_none_match=None, current_user=USER)
+        settings_etag = response.headers["ETag"]
+        await server.get_user_active_emergency(response, if_none_match=None, current_user=USER)
+        emergency_etag = response.headers["ETag"]
+        # Another worker with its own counters answers the same
+        monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+        cached = await server.get_user_settings(Response(), if_none_match=settings_etag, current_user=USER)
+        still_active = await server.get_user_active_emergency(Response(), if_none_match=emergency_etag, current_user=USER)
+
+        db.documents["user_settings"] = [{"emergency_contacts": ["+5511988887777"], "alert_distance_km": 2.0}]
+        db.documents["emergencies"] = []
+        fresh = Response()
+        await server.get_user_settings(fresh, if_none_match=settings_etag, current_user=USER)
+        with pytest.raises(HTTPException) as cancelled:
+            await server.get_user_active_emergency(Response(), if_none_match=emergency_etag, current_user=USER)
+        return cached, still_active, fresh.headers["ETag"] != settings_etag, cancelled.value.status_code
+
+    cached, still_active, changed, cancelled = asyncio.run(run())
+    assert cached.status_code == still_active.status_code == 304
+    assert changed and cancelled == 404
+
+
+def test_nearby_etag_changes_only_for_writes_in_covered_cells(monkeypatch):
+    db = FakeDatabase({"emergencies": [EMERGENCY]})
+    monkeypatch.setattr(server, "store", MongoStore(db))
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server.sio, "emit", noop_emit)
+
+    async def etag_for(if_none_match=None):
+        response = await server.get_nearby_emergencies(
+            latitude=-23.5505, longitude=-46.6333, accept=None, if_none_match=if_none_match, current_user=USER)
+        return response
+
+    async def run():
+        etag = (await etag_for()).headers["ETag"]
+        assert (await etag_for(etag)).status_code == 304
+
+        # An emergency in Rio de Janeiro does not touch São Paulo cells
+        db.documents["emergencies"] = []
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=-22.9068, longitude=-43.1729), idempotency_key=None, current_user=OTHER)
+        assert (await etag_for(etag)).status_code == 304
+
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=-23.56, longitude=-46.64), idempotency_key=None, current_user=OTHER)
+        assert (await etag_for(etag)).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_nearby_emergency_etag_expires_with_the_cache_bucket(monkeypatch):
+    # Writes on other workers never bump this worker's counters
+    monkeypatch.setattr(server, "store", MongoStore(FakeDatabase({"emergencies": [EMERGENCY]})))
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    now = [1_000_020.0]  # start of a bucket
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+
+    async def status(if_none_match=None):
+        response = await server.get_nearby_emergencies(
+            latitude=-23.5505, longitude=-46.6333, accept=None, if_none_match=if_none_match, current_user=USER)
+        return response.status_code, response.headers["ETag"]
+
+    async def run():
+        _, etag = await status()
+        now[0] += server.EMERGENCY_CACHE_BUCKET_SECONDS / 2 - 1
+        within = await status(etag)
+        now[0] += server.EMERGENCY_CACHE_BUCKET_SECONDS
+        return within, await status(etag)
+
+    within, later = asyncio.run(run())
+    assert within[0] == 304 and later[0] == 200
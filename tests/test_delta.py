@@ -0,0 +1,145 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from delta import SyncToken, decode_sync_token, encode_sync_token
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+MARIA = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+ANA = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+CAIO = User(id="u3", email="caio@saferide.com", name="Caio", vehicle_plate="RIO0001")
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+def test_sync_token_round_trip():
+    token = SyncToken(datetime(2025, 9, 22, 12, 30, 1, 250000), -23.5505, -46.6333, 2.5)
+    assert decode_sync_token(encode_sync_token(token)) == token
+    assert decode_sync_token("garbage") is None
+    assert decode_sync_token("1_2_x_4") is None
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server, "emit_event", lambda *args, **kwargs: asyncio.sleep(0))
+    # No overlap, so each delta holds exactly what changed after its token
+    monkeypatch.setattr(server, "DELTA_OVERLAP", timedelta(0))
+    return store
+
+
+def emergencies(since=None, position=SAO_PAULO):
+    async def read():
+        response = await server.get_nearby_emergencies(
+            latitude=position[0], longitude=position[1], since=since, accept=None, if_none_match=None,
+            current_user=MARIA)
+        return json.loads(response.body), response.headers.get("X-Sync-Token")
+    return read()
+
+
+def chat(since=None):
+    async def read():
+        response = await server.get_nearby_chat_messages(
+            latitude=SAO_PAULO[0], longitude=SAO_PAULO[1], limit=50, since=since, accept=None,
+            if_none_match=None, current_user=MARIA)
+        return json.loads(response.body), response.headers.get("X-Sync-Token")
+    return read()
+
+
+def test_emergency_delta_has_new_items_and_resolved_ids(memory_server):
+    async def run():
+        raised = await server.create_emergency(server.EmergencyCreate(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+                                               idempotency_key=None, current_user=ANA)
+        full, token = await emergencies()
+        await asyncio.sleep(0.002)
+        caio = await server.create_emergency(server.EmergencyCreate(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+                                             idempotency_key=None, current_user=CAIO)
+        await server.deactivate_emergency(raised.id, current_user=ANA)
+        delta, _ = await emergencies(since=token)
+        moved, _ = await emergencies(since=token, position=(SAO_PAULO[0] + 0.02, SAO_PAULO[1]))
+        return raised, caio, full, delta, moved
+
+    raised, caio, full, delta, moved = asyncio.run(run())
+    assert [item["id"] for item in full] == [raised.id]
+    assert delta["reset"] is False
+    assert [item["id"] for item in delta["items"]] == [caio.id]
+    assert delta["removed"] == [raised.id]
+    # A token from another position can't be applied, the client gets the whole list
+    assert moved["reset"] is True and [item["id"] for item in moved["items"]] == [caio.id]
+
+
+def test_moving_within_a_query_cell_resets(memory_server, monkeypatch):
+    # Both points share a ~1km query cell; an emergency 80m from the second
+    # was raised before the token and is outside 0.5km of the first
+    before, after = (-23.559, -46.639), (-23.5505, -46.6305)
+    monkeypatch.setattr(server, "get_alert_distance", lambda user_id: asyncio.sleep(0, 0.5))
+
+    async def run():
+        raised = await server.create_emergency(
+            server.EmergencyCreate(latitude=after[0] + 0.0007, longitude=after[1]), idempotency_key=None, current_user=ANA)
+        first, token = await emergencies(position=before)
+        moved, _ = await emergencies(since=token, position=after)
+        return raised, first, moved
+
+    raised, first, moved = asyncio.run(run())
+    assert first == []
+    assert moved["reset"] is True and [item["id"] for item in moved["items"]] == [raised.id]
+
+
+def test_chat_delta_carries_tombstones_of_deleted_messages(memory_server):
+    send = lambda text, user: server.send_chat_message(
+        server.ChatMessageCreate(message=text, latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+        idempotency_key=None, current_user=user)
+
+    async def run():
+        first = await send("oi", ANA)
+        _, token = await chat()
+        await asyncio.sleep(0.002)
+        second = await send("tudo bem?", CAIO)
+        await server.delete_chat_message(first.id, current_user=ANA)
+        delta, _ = await chat(since=token)
+        return first, second, delta
+
+    first, second, delta = asyncio.run(run())
+    assert [item["id"] for item in delta["items"]] == [second.id]
+    assert delta["removed"] == [first.id]
+
+
+def test_stale_or_malformed_tokens_reset(memory_server, monkeypatch):
+    async def run():
+        _, token = await emergencies()
+        monkeypatch.setattr(server, "DELTA_MAX_AGE", timedelta(0))
+        await asyncio.sleep(0.002)
+        stale, _ = await emergencies(since=token)
+        malformed, _ = await emergencies(since="not-a-token")
+        return stale, malformed
+
+    stale, malformed = asyncio.run(run())
+    assert stale["reset"] and malformed["reset"]
+
+
+def test_tokens_of_cached_lists_cover_writes_by_other_workers(memory_server):
+    # Another worker's write reaches the store but not this worker's cache
+    async def run():
+        await emergencies()
+        await memory_server.emergencies.insert({
+            "id": "e-other", "user_id": ANA.id, "user_name": ANA.name, "vehicle_plate": ANA.vehicle_plate,
+            "latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1], "created_at": datetime.utcnow(), "is_active": True,
+        })
+        await asyncio.sleep(0.002)
+        cached, token = await emergencies()
+        delta, _ = await emergencies(since=token)
+        reset, _ = await emergencies(since="not-a-token")
+        after_reset, _ = await emergencies(since=reset["sync_token"])
+        return cached, delta, reset, after_reset
+
+    cached, delta, reset, after_reset = asyncio.run(run())
+    assert cached == [] and reset["items"] == []
+    assert delta["reset"] is False and [item["id"] for item in delta["items"]] == ["e-other"]
+    assert after_reset["reset"] is False and [item["id"] for item in after_reset["items"]] == ["e-other"]
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from entitlements import InvalidEntitlement, RevocationList, decode_entitlement, issue_entitlement, signing_key
+from models import SubscriptionUpdate, User
+from storage import MemoryStore
+
+MARIA = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+PIXEL = {"device_id": "d1", "device_name": "Pixel", "device_brand": "Google", "subscription_type": "premium"}
+
+
+def test_entitlement_is_not_an_access_token():
+    key = signing_key(server.SECRET_KEY)
+    token = issue_entitlement(key, "u1", PIXEL, datetime(2030, 1, 1), time.time(), 3600)["entitlement"]
+    assert decode_entitlement(key, token)["dev"] == "d1"
+
+    with pytest.raises(InvalidEntitlement):
+        decode_entitlement(key, server.create_access_token({"sub": "u1"}))
+    with pytest.raises(HTTPException):
+        asyncio.run(server.get_current_user(type("Credentials", (), {"credentials": token})()))
+
+
+def test_revocations_void_older_tokens_until_they_expire():
+    revocations = RevocationList(ttl_seconds=3600)
+    revocations.apply([{"user_id": "u1", "revoked_at": 100.0}], now=200.0)
+
+    assert revocations.is_revoked({"sub": "u1", "iat": 99.5})
+    assert not revocations.is_revoked({"sub": "u1", "iat": 100.0})
+    assert not revocations.is_revoked({"sub": "u2", "iat": 99.5})
+
+    revocations.apply([], now=100.0 + 3601)
+    assert len(revocations) == 0
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "entitlement_revocations", RevocationList(server.ENTITLEMENT_TTL_SECONDS))
+    return store
+
+
+def test_check_device_trusts_a_live_entitlement_without_reading_the_store(memory_server, monkeypatch):
+    reads = []
+    for name in ("get_binding_for_device", "get_expiry"):
+        original = getattr(memory_server.subscriptions, name)
+
+        async def counted(*args, _original=original, _name=name):
+            reads.append(_name)
+            return await _original(*args)
+
+        monkeypatch.setattr(memory_server.subscriptions, name, counted)
+
+    expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(days=30)
+
+    async def run():
+        bound = await server.bind_device_to_subscription(
+            SubscriptionUpdate(**PIXEL, expires_at=expires_at), current_user=MARIA)
+        token = bound["entitlement"]
+        stateless = await server.check_device_binding(device_id="d1", x_entitlement=token, current_user=MARIA)
+        await server.unbind_device(current_user=MARIA)
+        with pytest.raises(HTTPException) as revoked:
+            await server.check_device_binding(device_id="d1", x_entitlement=token, current_user=MARIA)
+        return stateless, revoked.value
+
+    stateless, revoked = asyncio.run(run())
+    assert stateless["device_name"] == "Pixel" and stateless["expires_at"] == expires_at
+    assert reads == ["get_binding_for_device"]  # only the check after unbinding fell back to the store
+    assert revoked.status_code == 404
+
+
+def test_revocations_reach_other_workers_through_the_store(memory_server):
+    worker = RevocationList(server.ENTITLEMENT_TTL_SECONDS)
+    issued_at = time.time()
+
+    async def run():
+        await server.revoke_entitlements("u1")
+        await worker.sync(memory_server.subscriptions.revocations_since, time.time())
+
+    asyncio.run(run())
+    assert worker.is_revoked({"sub": "u1", "iat": issued_at})
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import server
+from geocache import GeoCache
+from metrics import geo_cache_hit_ratio
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+SAO_PAULO = (-23.5505, -46.6333)
+RIO = (-22.9068, -43.1729)
+
+
+def fill(cache, key, point, value, radius_km=11.0):
+    async def fetch():
+        return value
+    return asyncio.run(cache.fetch(key, *point, radius_km, fetch))
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = GeoCache("test", capacity=2)
+    fill(cache, "a", SAO_PAULO, ["a"])
+    fill(cache, "b", SAO_PAULO, ["b"])
+    assert cache.get("a") == ["a"]
+    fill(cache, "c", SAO_PAULO, ["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ["a"] and cache.get("c") == ["c"]
+    assert geo_cache_hit_ratio.value("test") == cache.hits / (cache.hits + cache.misses)
+
+
+def test_invalidation_drops_only_entries_covering_the_write():
+    cache = GeoCache("test", capacity=10)
+    fill(cache, "sp", SAO_PAULO, [])
+    fill(cache, "rio", RIO, [])
+
+    # ~13km north: in a grid cell the entry is indexed under, but outside its 11km box
+    assert cache.invalidate(SAO_PAULO[0] + 0.12, SAO_PAULO[1]) == 0
+    assert cache.invalidate(SAO_PAULO[0] + 0.05, SAO_PAULO[1] + 0.05) == 1
+    assert cache.get("sp") is None and cache.get("rio") == []
+
+
+def test_fetch_racing_a_write_is_not_cached():
+    cache = GeoCache("test", capacity=10)
+
+    async def fetch():
+        cache.invalidate(*SAO_PAULO)  # a write lands while the read is in flight
+        return ["stale"]
+
+    assert asyncio.run(cache.fetch("sp", *SAO_PAULO, 11.0, fetch)) == ["stale"]
+    assert cache.get("sp") is None
+
+
+def test_nearby_results_are_cached_until_a_write_in_the_area(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server, "emit_event", lambda *args, **kwargs: asyncio.sleep(0))
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+    ana = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+    caio = User(id="u3", email="caio@saferide.com", name="Caio", vehicle_plate="RIO0001")
+
+    fetches = []
+    find_active_near = store.emergencies.find_active_near
+
+    async def counting_find(*args):
+        fetches.append(args)
+        return await find_active_near(*args)
+
+    monkeypatch.setattr(store.emergencies, "find_active_near", counting_find)
+
+    async def nearby():
+        response = await server.get_nearby_emergencies(
+            latitude=SAO_PAULO[0], longitude=SAO_PAULO[1], accept=None, if_none_match=None, current_user=maria)
+        return [item["user_id"] for item in json.loads(response.body)]
+
+    async def run():
+        results = [await nearby(), await nearby()]
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=RIO[0], longitude=RIO[1]), idempotency_key=None, current_user=caio)
+        results.append(await nearby())
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+            idempotency_key=None, current_user=ana)
+        results += [await nearby(), await nearby()]
+        return results
+
+    assert asyncio.run(run()) == [[], [], [], ["u2"], ["u2"]]
+    assert len(fetches) == 2
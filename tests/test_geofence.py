@@ -0,0 +1,161 @@
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import server
+from alerts import AlertBroker
+from geo import calculate_distance
+from geofence import LEVELS, GeofenceIndex, level_for
+from models import User
+from storage import MemoryStore
+
+SAO_PAULO = (-23.5505, -46.6333)
+T0 = datetime(2026, 1, 1)
+
+
+def brute_force(users, latitude, longitude):
+    return {user_id for user_id, (lat, lon, radius) in users.items()
+            if calculate_distance(lat, lon, latitude, longitude) <= radius}
+
+
+def random_users(rng, count):
+    return {
+        f"u{i}": (SAO_PAULO[0] + rng.uniform(-0.5, 0.5), SAO_PAULO[1] + rng.uniform(-0.5, 0.5),
+                  rng.uniform(0.001, 10.0))
+        for i in range(count)
+    }
+
+
+def test_levels_file_small_radii_on_finer_cells():
+    levels = [level_for(radius) for radius in (10.0, 5.0, 1.0, 0.2, 0.001)]
+    assert levels == sorted(levels) and levels[0] == 0 and levels[-1] == len(LEVELS) - 1
+
+
+def test_covering_matches_brute_force_through_moves_and_radius_changes():
+    rng = random.Random(45)
+    users = random_users(rng, 2000)
+    index = GeofenceIndex(10.0)
+    for user_id, (lat, lon, radius) in users.items():
+        index.set_location(user_id, lat, lon, T0)
+        index.set_radius(user_id, radius, T0)
+    # Refiling moves disks between cells and levels
+    for i in range(0, 2000, 3):
+        lat, lon, _ = users[f"u{i}"]
+        users[f"u{i}"] = (lat, lon, rng.uniform(0.001, 10.0))
+        index.set_radius(f"u{i}", users[f"u{i}"][2], T0)
+    for i in range(0, 2000, 2):
+        _, _, radius = users[f"u{i}"]
+        users[f"u{i}"] = (SAO_PAULO[0] + rng.uniform(-0.5, 0.5), SAO_PAULO[1] + rng.uniform(-0.5, 0.5), radius)
+        index.set_location(f"u{i}", *users[f"u{i}"][:2], T0)
+
+    assert len(index) == 2000
+    for _ in range(50):
+        point = (SAO_PAULO[0] + rng.uniform(-0.5, 0.5), SAO_PAULO[1] + rng.uniform(-0.5, 0.5))
+        assert index.covering(*point) == brute_force(users, *point)
+
+
+def test_users_without_settings_get_the_default_radius_and_without_location_none():
+    index = GeofenceIndex(10.0)
+    index.set_location("u1", SAO_PAULO[0] + 0.08, SAO_PAULO[1], T0)  # ~8.9km north
+    index.set_radius("u2", 10.0, T0)
+    assert index.covering(*SAO_PAULO) == {"u1"}
+    index.set_radius("u1", 5.0, T0)
+    assert index.covering(*SAO_PAULO) == set()
+
+
+def test_older_writes_never_overwrite_newer_ones():
+    index = GeofenceIndex(10.0)
+    index.set_location("u1", *SAO_PAULO, T0 + timedelta(seconds=10))
+    index.set_radius("u1", 1.0, T0 + timedelta(seconds=10))
+    index.set_location("u1", SAO_PAULO[0] + 1, SAO_PAULO[1], T0)
+    index.set_radius("u1", 10.0, T0)
+    assert index.covering(*SAO_PAULO) == {"u1"}
+    assert index.covering(SAO_PAULO[0] + 0.05, SAO_PAULO[1]) == set()
+
+
+def test_sync_loads_everything_then_only_recent_writes():
+    index = GeofenceIndex(10.0, overlap=timedelta(seconds=5))
+    reads = []
+
+    async def fetch_locations(since):
+        reads.append(since)
+        if since == datetime(1970, 1, 1):
+            return [{"user_id": "u1", "latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1], "updated_at": T0}]
+        # A read that raced a newer local write
+        return [{"user_id": "u1", "latitude": 0.0, "longitude": 0.0, "updated_at": T0}]
+
+    async def fetch_radii(since):
+        return [{"user_id": "u1", "alert_distance_km": 2.0, "updated_at": T0}]
+
+    async def run():
+        await index.sync(fetch_locations, fetch_radii, T0 + timedelta(minutes=1))
+        index.set_location("u1", SAO_PAULO[0] + 0.01, SAO_PAULO[1], T0 + timedelta(seconds=30))
+        await index.sync(fetch_locations, fetch_radii, T0 + timedelta(minutes=2))
+
+    asyncio.run(run())
+    assert reads == [datetime(1970, 1, 1), T0 + timedelta(seconds=55)]
+    assert index.covering(SAO_PAULO[0] + 0.02, SAO_PAULO[1]) == {"u1"}
+
+
+def test_covering_100k_users_takes_under_a_millisecond():
+    rng = random.Random(100)
+    index = GeofenceIndex(10.0)
+    for user_id, (lat, lon, radius) in random_users(rng, 100_000).items():
+        index.set_location(user_id, lat, lon, T0)
+        index.set_radius(user_id, radius, T0)
+    points = [(SAO_PAULO[0] + rng.uniform(-0.5, 0.5), SAO_PAULO[1] + rng.uniform(-0.5, 0.5)) for _ in range(200)]
+    timings = []
+    for point in points:
+        started = time.perf_counter()
+        index.covering(*point)
+        timings.append(time.perf_counter() - started)
+    assert statistics.median(timings) < 1e-3
+
+
+def test_emergency_alert_goes_to_users_whose_radius_covers_it(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    emits = []
+
+    async def emit(event, data, room=None, **kwargs):
+        emits.append((event, room))
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    monkeypatch.setattr(server, "alert_broker", AlertBroker(server.MAX_ALERT_DISTANCE_KM))
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+    ana = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+    caio = User(id="u3", email="caio@saferide.com", name="Caio", vehicle_plate="RIO0001")
+    settings = lambda radius: server.UserSettingsUpdate(emergency_contacts=["11999999999"], alert_distance_km=radius)
+    location = lambda lat: server.UserLocation(user_id="", latitude=lat, longitude=SAO_PAULO[1])
+
+    async def run():
+        # Both ~3.3km away; only Maria's radius reaches that far
+        await server.update_user_settings(settings(5.0), current_user=maria)
+        await server.update_user_settings(settings(1.0), current_user=caio)
+        await server.update_location(location(SAO_PAULO[0] + 0.03), current_user=maria)
+        await server.update_location(location(SAO_PAULO[0] - 0.03), current_user=caio)
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+            idempotency_key=None, current_user=ana)
+
+    asyncio.run(run())
+    assert emits == [("emergency_alert", ["user:u1", "anonymous"])]
+
+
+def test_location_writes_are_ordered_by_server_time(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+    # A phone clock a year ahead must not pin the first position
+    ahead = server.UserLocation(
+        user_id="", latitude=SAO_PAULO[0], longitude=SAO_PAULO[1], updated_at=datetime.utcnow() + timedelta(days=365))
+    moved = server.UserLocation(user_id="", latitude=SAO_PAULO[0] + 0.5, longitude=SAO_PAULO[1])
+
+    async def run():
+        await server.update_location(ahead, current_user=maria)
+        await server.update_location(moved, current_user=maria)
+        return await server.store.locations.changed_since(T0)
+
+    stored = asyncio.run(run())
+    assert server.geofence.covering(SAO_PAULO[0] + 0.5, SAO_PAULO[1]) == {"u1"}
+    assert stored[0]["updated_at"] <= datetime.utcnow()
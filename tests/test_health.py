@@ -0,0 +1,72 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import server
+from config import Config
+from health import health_report, readiness_failures
+from metrics import mongo_pool_connections
+from mongo_listeners import MongoPoolMonitor
+
+
+def test_readiness_thresholds():
+    pool = {"max_size": 10, "open": 10, "checked_out": 10, "wait_queue": 3}
+    report = health_report(0.3, 4, pool, {"loop_lag_monitor": True, "push": False})
+    assert report["loop_lag_ms"] == 300.0
+    assert report["socketio_clients"] == 4
+
+    assert readiness_failures(report, True, 500, 5) == ["background job push is not running"]
+    assert readiness_failures(report, False, 100, 2) == [
+        "not started",
+        "event loop lag 300.0ms > 100ms",
+        "mongo pool wait queue 3 > 2",
+        "background job push is not running",
+    ]
+
+
+def test_pool_monitor_tracks_checkouts_and_waiters(monkeypatch):
+    monkeypatch.setattr(mongo_pool_connections, "_values", {})
+    monitor = MongoPoolMonitor()
+    event = SimpleNamespace(address=("db", 27017), options={"maxPoolSize": 2})
+
+    monitor.pool_created(event)
+    for _ in range(2):
+        monitor.connection_created(event)
+    for _ in range(3):
+        monitor.connection_check_out_started(event)
+    monitor.connection_checked_out(event)
+    monitor.connection_checked_out(event)
+    assert monitor.stats() == {"max_size": 2, "open": 2, "checked_out": 2, "wait_queue": 1}
+
+    monitor.connection_checked_in(event)
+    monitor.connection_checked_out(event)
+    monitor.connection_checked_in(event)
+    assert monitor.stats() == {"max_size": 2, "open": 2, "checked_out": 1, "wait_queue": 0}
+
+
+def test_readyz_follows_lifespan_and_loop_lag(app_globals, monkeypatch):
+    app = server.create_app(Config(storage_backend="memory", ready_max_loop_lag_ms=100))
+    request = SimpleNamespace(app=app)
+
+    async def readyz():
+        response = await server.readyz(request)
+        return response.status_code, json.loads(response.body)
+
+    async def run():
+        before = await readyz()
+        async with app.router.lifespan_context(app):
+            ready = await readyz()
+            monkeypatch.setattr(server.loop_lag_monitor, "last_lag", 0.2)
+            lagging = await readyz()
+            live = await server.healthz()
+        return before, ready, lagging, live
+
+    before, ready, lagging, live = asyncio.run(run())
+    assert before[0] == 503 and "not started" in before[1]["failures"]
+    assert ready[0] == 200 and ready[1]["mongo_pool"] is None
+    assert ready[1]["background_jobs"] == {
+        "loop_lag_monitor": True, "entitlement_revocations": True, "alert_heartbeat": True,
+        "geofence_sync": True, "push_receipts": True, "emergency_archiver": True,
+    }
+    assert lagging[0] == 503 and lagging[1]["failures"] == ["event loop lag 200.0ms > 100ms"]
+    assert live["status"] == "ok"
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from idempotency import Idempotency, fingerprint
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+ANA = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+HERE = server.EmergencyCreate(latitude=-23.5505, longitude=-46.6333)
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    store = MemoryStore()
+    emitted = []
+
+    async def emit(event, data, **kwargs):
+        emitted.append(event)
+
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server, "idempotency", Idempotency(100, server.IDEMPOTENCY_TTL))
+    monkeypatch.setattr(server, "emit_event", emit)
+    return store, emitted
+
+
+def post_emergency(key, body=HERE):
+    return server.create_emergency(body, idempotency_key=key, current_user=ANA)
+
+
+def test_retries_replay_the_first_response_without_writing_again(memory_server):
+    store, emitted = memory_server
+
+    async def run():
+        first = await post_emergency("k1")
+        retried = await post_emergency("k1")
+        with pytest.raises(HTTPException) as reused:
+            await post_emergency("k1", server.EmergencyCreate(latitude=-22.9, longitude=-43.2))
+        return first, retried, reused.value
+
+    first, retried, reused = asyncio.run(run())
+    assert json.loads(retried.body) == json.loads(first.body)
+    assert retried.headers["Idempotent-Replayed"] == "true" and "Idempotent-Replayed" not in first.headers
+    assert len(store.emergencies.by_id) == 1 and emitted == ["emergency_alert"]
+    assert reused.status_code == 422
+
+
+def test_concurrent_retries_share_one_execution(memory_server):
+    store, emitted = memory_server
+
+    async def run():
+        return await asyncio.gather(*(
+            server.send_chat_message(
+                server.ChatMessageCreate(message="acidente na marginal", latitude=-23.55, longitude=-46.63),
+                idempotency_key="k1", current_user=ANA)
+            for _ in range(3)
+        ))
+
+    responses = asyncio.run(run())
+    assert len({response.body for response in responses}) == 1
+    assert len(store.chat.by_id) == 1 and emitted == ["new_chat_message"]
+
+
+def test_failed_requests_release_their_key(memory_server):
+    store, emitted = memory_server
+
+    async def run():
+        await post_emergency(None)
+        with pytest.raises(HTTPException) as active:
+            await post_emergency("k1")
+        await server.cancel_user_emergency(current_user=ANA)
+        return active.value, await post_emergency("k1")
+
+    active, retried = asyncio.run(run())
+    assert active.status_code == 400
+    assert "Idempotent-Replayed" not in retried.headers
+    assert len(store.emergencies.by_id) == 2
+
+
+def test_key_held_by_another_worker_conflicts(memory_server):
+    store, _ = memory_server
+    now = datetime.utcnow()
+    reserve = store.idempotency.reserve
+    reserves = []
+
+    async def counting_reserve(record, now):
+        reserves.append(record["key"])
+        return await reserve(record, now)
+
+    async def run():
+        # Another worker is still running the first request with this key
+        await store.idempotency.reserve({
+            "key": "emergency:u2:k1", "fingerprint": fingerprint(HERE.dict()),
+            "response": None, "expires_at": now + timedelta(minutes=1),
+        }, now)
+        with pytest.raises(HTTPException) as in_progress:
+            await post_emergency("k1")
+        store.idempotency.by_key.clear()
+        store.idempotency.reserve = counting_reserve
+        await post_emergency("k2")
+        await post_emergency("k2")
+        return in_progress.value
+
+    assert asyncio.run(run()).status_code == 409
+    # The replay was answered from the in-memory front cache
+    assert reserves == ["emergency:u2:k2"]
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+import server
+from metrics import LoopLagMonitor, Registry, mongo_command_duration, socketio_emits
+from mongo_listeners import MongoCommandMetrics
+from tests.fakes import noop_emit
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/api/x")
+    histogram.observe(0.5, "/api/x")
+    histogram.observe(5, "/api/x")
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/api/x",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/api/x",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/api/x",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/api/x"} 3' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_mongo_listener_times_commands_per_collection():
+    listener = MongoCommandMetrics()
+    before = mongo_command_duration.count("emergencies", "find", "success")
+
+    listener.started(SimpleNamespace(
+        command={"find": "emergencies", "filter": {}}, command_name="find", request_id=1, connection_id=("h", 1)))
+    listener.succeeded(SimpleNamespace(request_id=1, connection_id=("h", 1), duration_micros=1500))
+
+    assert mongo_command_duration.count("emergencies", "find", "success") == before + 1
+
+
+def test_emit_event_counts_emits_and_fanout(monkeypatch):
+    monkeypatch.setattr(server.sio, "emit", noop_emit)
+    before = socketio_emits.value("emergency_resolved")
+    asyncio.run(server.emit_event("emergency_resolved", {"emergency_id": "e1"}))
+    assert socketio_emits.value("emergency_resolved") == before + 1
+
+
+def test_loop_lag_monitor_samples_blocking_work():
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.005)
+        sum(range(3_000_000))  # block the loop past the next wakeup
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(run())
+    assert monitor.last_lag >= 0
+    assert not monitor.running
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from profiling import ProfilerBusy, RequestTrace, SamplingProfiler, SlowRequestLog, current_trace, record_db_time, span
+
+
+def busy_work(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_span_excludes_mongo_time_and_slow_log_keeps_breakdown():
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    try:
+        with span("auth"):
+            busy_work(0.01)
+            record_db_time(0.5)  # as reported by the command listener
+    finally:
+        current_trace.reset(token)
+
+    assert trace.spans["auth"] < 0.5
+    log = SlowRequestLog(threshold_ms=100, capacity=2)
+    log.maybe_record("GET", "/api/emergencies/nearby", "/api/emergencies/nearby", 200, 0.6, trace)
+    log.maybe_record("GET", "/api/settings", "/api/settings", 200, 0.01, trace)
+
+    assert len(log.entries) == 1
+    entry = log.entries[0]
+    assert entry["db_commands"] == 1
+    assert entry["spans_ms"]["db"] == 500.0
+    assert set(entry["spans_ms"]) == {"auth", "db", "other"}
+
+
+def test_slow_log_is_bounded():
+    log = SlowRequestLog(threshold_ms=0, capacity=3)
+    for i in range(10):
+        log.maybe_record("GET", f"/api/{i}", None, 200, 0.1, RequestTrace())
+    assert [entry["path"] for entry in log.entries] == ["/api/7", "/api/8", "/api/9"]
+
+
+def test_profiler_samples_the_calling_thread_in_folded_format():
+    profiler = SamplingProfiler()
+    session = profiler.start(interval=0.001)
+    with pytest.raises(ProfilerBusy):
+        profiler.start(interval=0.001)
+    busy_work(0.1)
+    folded = session.stop()
+
+    assert not profiler.running
+    line = folded.splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert int(count) > 0
+    assert "busy_work (test_profiling.py:" in folded
+
+
+def test_admin_endpoints_need_configured_token(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", None)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(server.require_admin("anything"))
+    assert excinfo.value.status_code == 404
+
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(server.require_admin("wrong"))
+    assert excinfo.value.status_code == 403
+    asyncio.run(server.require_admin("s3cret"))
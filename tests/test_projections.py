@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+from server import User
+from storage import PROJECTIONS, MongoStore
+from tests.fakes import FakeDatabase, noop_emit
+
+USER = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+
+DOCUMENTS = {
+    "users": {**USER.dict(), "password": server.get_password_hash("123456")},
+    "user_settings": {"user_id": "u1", "emergency_contacts": ["+5511999999999"], "alert_distance_km": 5.0},
+    "emergencies": {
+        "id": "e1", "user_id": "u2", "user_name": "Ana", "vehicle_plate": "ABC1234",
+        "latitude": -23.5505, "longitude": -46.6333, "created_at": datetime.utcnow(), "is_active": True,
+    },
+    "chat_messages": {
+        "id": "m1", "user_id": "u2", "user_name": "Ana", "message": "oi",
+        "latitude": -23.5505, "longitude": -46.6333, "created_at": datetime.utcnow(), "message_type": "text",
+    },
+    "device_bindings": {
+        "user_id": "u1", "device_id": "d1", "device_name": "Pixel", "device_brand": "Google",
+        "subscription_type": "premium", "bound_at": datetime.utcnow(),
+    },
+    "user_subscriptions": {"user_id": "u1", "type": "premium", "expires_at": datetime.utcnow() + timedelta(days=30)},
+}
+
+
+# Projections each hot-path endpoint is allowed to read with
+HOT_PATHS = {
+    "get_current_user": (
+        lambda: server.get_current_user(HTTPAuthorizationCredentials(
+            scheme="Bearer", credentials=server.create_access_token({"sub": USER.id}))),
+        {"current_user"},
+    ),
+    "login": (
+        lambda: server.login(server.UserLogin(email=USER.email, password="123456")),
+        {"login"},
+    ),
+    "get_nearby_emergencies": (
+        lambda: server.get_nearby_emergencies(
+            latitude=-23.55, longitude=-46.63, accept=None, if_none_match=None, current_user=USER),
+        {"alert_distance", "emergency"},
+    ),
+    "get_nearby_chat_messages": (
+        lambda: server.get_nearby_chat_messages(
+            latitude=-23.55, longitude=-46.63, limit=50, accept=None, if_none_match=None, current_user=USER),
+        {"alert_distance", "chat_message"},
+    ),
+    "send_chat_message": (
+        lambda: server.send_chat_message(
+            server.ChatMessageCreate(message="oi", latitude=-23.55, longitude=-46.63),
+            idempotency_key=None, current_user=USER),
+        {"alert_distance"},
+    ),
+    "get_user_settings": (
+        lambda: server.get_user_settings(Response(), if_none_match=None, current_user=USER),
+        {"settings"},
+    ),
+    "check_device_binding": (
+        lambda: server.check_device_binding(device_id="d1", x_entitlement=None, current_user=USER),
+        {"device_binding", "subscription_expiry"},
+    ),
+    "get_user_active_emergency": (
+        lambda: server.get_user_active_emergency(Response(), if_none_match=None, current_user=USER),
+        {"emergency"},
+    ),
+    "cancel_user_emergency": (
+        lambda: server.cancel_user_emergency(current_user=USER),
+        {"emergency_ref"},
+    ),
+}
+
+
+@pytest.mark.parametrize("endpoint", sorted(HOT_PATHS))
+def test_hot_path_reads_only_declared_fields(endpoint, monkeypatch):
+    db = FakeDatabase({name: [doc] for name, doc in DOCUMENTS.items()})
+    monkeypatch.setattr(server, "store", MongoStore(db))
+    monkeypatch.setattr(server.sio, "emit", noop_emit)
+
+    call, allowed = HOT_PATHS[endpoint]
+    asyncio.run(call())
+
+    assert db.reads, f"{endpoint} did not read from Mongo"
+    declared = {name: PROJECTIONS[name] for name in allowed}
+    for collection, projection in db.reads:
+        assert projection is not None, f"{endpoint} fetched whole {collection} documents"
+        assert projection in declared.values(), (
+            f"{endpoint} read {collection} with undeclared projection {projection}"
+        )
+
+
+def test_current_user_never_loads_password_hash():
+    assert "password" not in PROJECTIONS["current_user"]
+    assert PROJECTIONS["current_user"]["_id"] == 0
@@ -0,0 +1,109 @@
+import asyncio
+
+import server
+from alerts import AlertBroker
+from benchmarks.fake_push_server import FakePushServer
+from models import User
+from push import PushDispatcher
+from storage import MemoryStore
+
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+def token(i):
+    return f"ExponentPushToken[{i}]"
+
+
+def messages(count):
+    return [{"to": token(i), "title": "EMERGÊNCIA PRÓXIMA!", "body": "teste"} for i in range(count)]
+
+
+def with_fake(test, fake=None, **options):
+    """Run test(dispatcher, fake, forgotten) against a fake push API"""
+    fake = fake or FakePushServer(retry_after=0)
+    forgotten = []
+
+    async def forget(tokens):
+        forgotten.extend(tokens)
+
+    async def run():
+        url = await fake.start()
+        dispatcher = PushDispatcher(backoff=0.01, **options)
+        dispatcher.start(url, None, forget)
+        try:
+            return await test(dispatcher, fake, forgotten)
+        finally:
+            await dispatcher.stop()
+            await fake.stop()
+
+    return asyncio.run(run())
+
+
+def test_messages_go_in_batches_of_100_with_bounded_concurrency():
+    async def test(dispatcher, fake, forgotten):
+        return await dispatcher.send(messages(950)), fake
+
+    fake = FakePushServer(latency=0.02)
+    result, fake = with_fake(test, fake, concurrency=3)
+    assert result.accepted == 950 and result.failed == 0
+    assert fake.requests == 10 and fake.max_in_flight == 3
+    assert fake.delivered_total == 950
+
+
+def test_transient_failures_are_retried_and_refusals_are_not():
+    async def test(dispatcher, fake, forgotten):
+        fake.failures = [503, 429]
+        retried = await dispatcher.send(messages(10))
+        requests = fake.requests
+        fake.failures = [400]
+        refused = await dispatcher.send(messages(10))
+        refused_requests = fake.requests - requests
+        fake.failures = [503, 503, 503]
+        exhausted = await dispatcher.send(messages(10))
+        return retried, refused, refused_requests, exhausted
+
+    retried, refused, refused_requests, exhausted = with_fake(test, max_attempts=3)
+    assert retried.accepted == 10
+    assert refused.failed == 10 and refused_requests == 1
+    assert exhausted.failed == 10
+
+
+def test_unregistered_devices_are_forgotten_from_tickets_and_receipts():
+    async def test(dispatcher, fake, forgotten):
+        fake.unregistered.add(token(1))
+        fake.uninstalled.add(token(2))
+        result = await dispatcher.send(messages(4))
+        from_tickets = list(forgotten)
+        pending = dispatcher.pending_receipts
+        from_receipts = await dispatcher.check_receipts()
+        return result, from_tickets, pending, from_receipts, dispatcher.pending_receipts
+
+    result, from_tickets, pending, from_receipts, left = with_fake(test, receipt_delay=0)
+    assert result.accepted == 3 and result.unregistered == [token(1)]
+    assert from_tickets == [token(1)]
+    assert pending == 3 and from_receipts == [token(2)] and left == 0
+
+
+def test_emergencies_push_to_covered_users_without_a_connection(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "alert_broker", AlertBroker(server.MAX_ALERT_DISTANCE_KM))
+    monkeypatch.setattr(server.sio, "emit", lambda *args, **kwargs: asyncio.sleep(0))
+    users = [User(id=f"u{i}", email=f"u{i}@saferide.com", name=f"Motorista {i}", vehicle_plate=f"ABC{i:04d}")
+             for i in range(3)]
+    location = server.UserLocation(user_id="", latitude=SAO_PAULO[0] + 0.01, longitude=SAO_PAULO[1])
+
+    async def test(dispatcher, fake, forgotten):
+        monkeypatch.setattr(server, "push_dispatcher", dispatcher)
+        for user in users[:2]:
+            await server.update_location(location, current_user=user)
+            await server.register_push_token(server.PushTokenRegistration(token=token(user.id)), current_user=user)
+        # u1 has the app open, so it gets the alert on its stream instead
+        server.alert_broker.subscribe("u1", *SAO_PAULO, 10.0)
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1]),
+            idempotency_key=None, current_user=users[2])
+        await asyncio.gather(*dispatcher._deliveries)
+        return fake.delivered
+
+    assert with_fake(test) == {token("u0"): 1}
@@ -0,0 +1,104 @@
+"""
+The replica set test runs when MONGO_REPLICA_SET_URL points at a local
+three-member replica set, e.g.
+
+    for port in 27017 27018 27019; do
+        mkdir -p /tmp/rs$port
+        mongod --replSet rs0 --port $port --dbpath /tmp/rs$port --fork --logpath /tmp/rs$port.log
+    done
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"}, {_id: 2, host: "localhost:27019"}]})'
+    MONGO_REPLICA_SET_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        pytest tests/test_read_preferences.py
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import WriteConcern
+from pymongo.read_preferences import Nearest, SecondaryPreferred
+
+from config import Config
+from storage import MongoStore
+from storage.read_preferences import build_read_preferences, parse_read_preferences
+from tests.fakes import FakeDatabase
+
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+def test_chat_history_defaults_to_secondaries_and_can_be_rerouted():
+    assert parse_read_preferences("") == {"chat_history": "secondaryPreferred"}
+    assert parse_read_preferences(" chat_history = nearest ,") == {"chat_history": "nearest"}
+    assert build_read_preferences("chat_history=primary", 90) == {}
+    assert build_read_preferences("", 120) == {"chat_history": SecondaryPreferred(max_staleness=120)}
+    assert build_read_preferences("chat_history=nearest", 0) == {"chat_history": Nearest()}
+
+
+def test_safety_critical_reads_cannot_leave_the_primary():
+    with pytest.raises(RuntimeError, match="always go to the primary"):
+        parse_read_preferences("active_emergency=secondaryPreferred")
+    with pytest.raises(RuntimeError, match="Unknown read preference"):
+        parse_read_preferences("chat_history=secondaries")
+    with pytest.raises(RuntimeError, match="at least 90s"):
+        build_read_preferences("", 30)
+
+
+def test_config_reads_preferences_from_the_environment():
+    config = Config.from_env({"MONGO_READ_PREFERENCES": "chat_history=nearest", "MONGO_MAX_STALENESS_SECONDS": "120"})
+    assert config.mongo_read_preferences == "chat_history=nearest"
+    assert config.mongo_max_staleness_seconds == 120
+    assert Config.from_env({}).mongo_max_staleness_seconds == 90
+
+
+def test_only_uncached_chat_history_reads_are_routed():
+    db = FakeDatabase()
+    store = MongoStore(db, read_preferences=build_read_preferences("", 90))
+    since = datetime.utcnow() - timedelta(hours=24)
+
+    async def run():
+        await store.chat.find_recent_near(*SAO_PAULO, 10.0, since, 50)
+        async for _ in store.chat.iter_recent_near(*SAO_PAULO, 10.0, since, 50):
+            pass
+        await store.chat.find_posted_near(*SAO_PAULO, 10.0, since, 50)
+        await store.chat.find_deleted_near(*SAO_PAULO, 10.0, since, 50)
+        await store.emergencies.find_active_near(*SAO_PAULO, 10.0, 1000)
+        await store.emergencies.has_active("u1")
+        await store.users.get_by_id("u1")
+
+    asyncio.run(run())
+    history = SecondaryPreferred(max_staleness=90)
+    assert db.read_preferences == [
+        ("chat_messages", None), ("chat_messages", history), ("chat_messages", None),
+        ("chat_tombstones", None), ("emergencies", None), ("emergencies", None), ("users", None),
+    ]
+
+
+@pytest.mark.skipif(not os.environ.get("MONGO_REPLICA_SET_URL"), reason="needs a local replica set")
+def test_chat_history_is_served_by_a_secondary_of_a_replica_set():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["MONGO_REPLICA_SET_URL"])
+        db = client[f"saferide_read_preferences_{uuid.uuid4().hex[:8]}"]
+        store = MongoStore(db, client, read_preferences=build_read_preferences("chat_history=secondary", 90))
+        try:
+            # Written to all three members, so whichever secondary is picked has it
+            await db.chat_messages.with_options(write_concern=WriteConcern(w=3)).insert_one({
+                "id": "m1", "user_id": "u1", "user_name": "Ana", "message": "oi",
+                "latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1], "created_at": datetime.utcnow(),
+            })
+            history = store.chat.history.find({})
+            posted = store.chat.collection.find({})
+            found = (await history.to_list(10), await posted.to_list(10))
+            return found, history.address, posted.address, client.primary, client.secondaries
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    (history, posted), history_address, posted_address, primary, secondaries = asyncio.run(run())
+    assert [doc["id"] for doc in history] == [doc["id"] for doc in posted] == ["m1"]
+    assert history_address in secondaries
+    assert posted_address == primary
@@ -0,0 +1,69 @@
+import asyncio
+import random
+
+from bson.min_key import MinKey
+
+from geo import calculate_distance
+from regions import geohash, prefix_end, region_of, regions_covering
+from storage import MongoStore
+from storage.mongo import near_filter
+from storage.partitioning import shard_commands
+from tests.fakes import FakeDatabase
+
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+def test_regions_are_geohash_prefixes():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert region_of(*SAO_PAULO) == geohash(*SAO_PAULO, 6)[:4] == "6gyf"
+
+
+def test_covering_regions_include_every_point_within_the_radius():
+    rng = random.Random(48)
+    for _ in range(200):
+        center = (rng.uniform(-60, 60), rng.uniform(-180, 180))
+        radius = rng.uniform(0.1, 11.0)
+        covering = set(regions_covering(*center, radius))
+        for _ in range(20):
+            point = (center[0] + rng.uniform(-0.1, 0.1), center[1] + rng.uniform(-0.1, 0.1))
+            if point[1] >= 180:
+                point = (point[0], point[1] - 360)
+            if calculate_distance(*center, *point) <= radius:
+                assert region_of(*point) in covering
+
+
+def test_a_city_query_covers_a_handful_of_regions():
+    assert regions_covering(*SAO_PAULO, 10.7) == ["6gyc", "6gyf"]
+    assert near_filter(*SAO_PAULO, 10.7)["region"] == {"$in": ["6gyc", "6gyf"]}
+
+
+def test_geo_documents_are_written_with_their_region():
+    db = FakeDatabase({"chat_messages": [{"latitude": -22.9068, "longitude": -43.1729}]})
+    store = MongoStore(db)
+    message = {"id": "m1", "user_id": "u1", "latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1]}
+
+    async def run():
+        await store.emergencies.insert({"id": "e1", "latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1]})
+        await store.chat.insert(message)
+        await store.chat.delete_own("m1", "u1")
+        await store.locations.upsert("u1", {"latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1]})
+
+    asyncio.run(run())
+    emergency, chat, tombstone, location = (write[2] for write in db.writes)
+    assert emergency["region"] == chat["region"] == location["$set"]["region"] == "6gyf"
+    # The tombstone sits where the deleted message was
+    assert tombstone["region"] == region_of(-22.9068, -43.1729)
+
+
+def test_shard_commands_split_and_zone_on_region_prefixes():
+    commands = shard_commands("saferide", [("sp", "6g")], ["6g"])
+    assert commands[0] == {"enableSharding": "saferide"}
+    emergencies = [command for command in commands if "saferide.emergencies" in command.values()]
+    assert emergencies == [
+        {"shardCollection": "saferide.emergencies", "key": {"region": 1, "id": 1}},
+        {"split": "saferide.emergencies", "middle": {"region": "6g", "id": MinKey()}},
+        {"updateZoneKeyRange": "saferide.emergencies", "min": {"region": "6g", "id": MinKey()},
+         "max": {"region": "6h", "id": MinKey()}, "zone": "sp"},
+    ]
+    assert "6gzzz" < prefix_end("6gz") <= "6h"
+    assert len(commands) == 1 + 4 * 3
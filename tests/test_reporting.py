@@ -0,0 +1,80 @@
+import asyncio
+
+import server
+from models import User
+from presence import PresenceIndex
+from reporting import CROWDED_QUIET_PLAN, CROWDED_USERS, QUIET_PLAN, recommend
+from storage.memory import MemoryStore
+
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+def test_plan_tightens_closer_to_an_emergency():
+    plans = [recommend(km, 0) for km in (0.5, 2.0, 8.0, None)]
+    intervals = [plan.interval_seconds for plan in plans]
+    displacements = [plan.min_displacement_m for plan in plans]
+    assert intervals == sorted(intervals) and len(set(intervals)) == 4
+    assert displacements == sorted(displacements)
+    assert plans[-1] == QUIET_PLAN
+
+
+def test_crowding_only_stretches_quiet_areas():
+    assert recommend(None, CROWDED_USERS) == CROWDED_QUIET_PLAN
+    assert recommend(0.5, CROWDED_USERS) == recommend(0.5, 0)
+
+
+def test_presence_counts_latest_report_per_user_and_expires():
+    index = PresenceIndex(ttl_seconds=60)
+    index.report("u1", *SAO_PAULO, now=0)
+    index.report("u2", *SAO_PAULO, now=10)
+    # Moving away takes a user out of the old cell
+    index.report("u1", SAO_PAULO[0] + 0.05, SAO_PAULO[1], now=20)
+    assert index.density(*SAO_PAULO, now=30) == 1
+    assert index.density(SAO_PAULO[0] + 0.05, SAO_PAULO[1], now=30) == 1
+    assert index.density(*SAO_PAULO, now=75) == 0
+    assert len(index) == 1
+
+
+def test_location_response_recommends_next_report(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    monkeypatch.setattr(server, "presence", PresenceIndex(600))
+    monkeypatch.setattr(server.sio, "emit", lambda *args, **kwargs: asyncio.sleep(0))
+    maria = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+    ana = User(id="u2", email="ana@saferide.com", name="Ana", vehicle_plate="ABC1234")
+    location = lambda lat, lon: server.UserLocation(user_id="", latitude=lat, longitude=lon)
+
+    async def run():
+        quiet = await server.update_location(location(*SAO_PAULO), current_user=maria)
+        await server.create_emergency(
+            server.EmergencyCreate(latitude=SAO_PAULO[0] + 0.005, longitude=SAO_PAULO[1]),
+            idempotency_key=None, current_user=ana)
+        near = await server.update_location(location(*SAO_PAULO), current_user=maria)
+        return quiet, near
+
+    quiet, near = asyncio.run(run())
+    assert quiet == {"message": "Location updated", "next_report_seconds": 120, "min_displacement_m": 250}
+    assert (near["next_report_seconds"], near["min_displacement_m"]) == (5, 10)
+
+
+def test_socket_location_update_needs_an_authenticated_session(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    monkeypatch.setattr(server, "presence", PresenceIndex(600))
+    sessions = {"anonymous": {}, "signed-in": {"user_id": "u1"}}
+
+    async def get_session(sid):
+        return sessions[sid]
+
+    monkeypatch.setattr(server.sio, "get_session", get_session)
+    point = {"latitude": SAO_PAULO[0], "longitude": SAO_PAULO[1]}
+
+    async def run():
+        return (
+            await server.update_location_event("anonymous", point),
+            await server.update_location_event("signed-in", {"latitude": "north"}),
+            await server.update_location_event("signed-in", point),
+        )
+
+    anonymous, invalid, ack = asyncio.run(run())
+    assert "error" in anonymous and "error" in invalid
+    assert ack["next_report_seconds"] == 120
+    assert server.presence.density(*SAO_PAULO, now=server.time.time()) == 1
@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from models import ChatMessage, Emergency
+from serialization import FastJSONResponse, lean_document
+from storage import PROJECTIONS
+
+
+def stored_emergency():
+    # Same shape insert_one() writes, as returned through PROJECTIONS["emergency"]
+    emergency = Emergency(
+        user_id="u1", user_name="Maria", vehicle_plate="XYZ5678",
+        latitude=-23.5505, longitude=-46.6333,
+        created_at=datetime(2025, 9, 22, 18, 28, 46, 727000),
+    ).dict()
+    return {k: v for k, v in emergency.items() if k in PROJECTIONS["emergency"]}
+
+
+def test_projection_covers_model_fields_without_id():
+    assert PROJECTIONS["emergency"]["_id"] == 0
+    assert set(PROJECTIONS["emergency"]) - {"_id"} == set(Emergency.model_fields)
+    assert set(PROJECTIONS["chat_message"]) - {"_id"} == set(ChatMessage.model_fields)
+
+
+def test_fast_path_matches_pydantic_path():
+    doc = stored_emergency()
+    slow = jsonable_encoder([{**Emergency(**doc).dict(), "distance_km": 1.23}])
+
+    item = lean_document(dict(doc), Emergency)
+    item["distance_km"] = 1.23
+    fast = json.loads(FastJSONResponse([item]).body)
+
+    assert fast == slow
+    assert list(fast[0]) == list(slow[0])
+
+
+def test_lean_document_fills_defaults_for_legacy_documents():
+    doc = {
+        "id": "m1", "user_id": "u1", "user_name": "Maria", "message": "oi",
+        "latitude": -23.5, "longitude": -46.6, "created_at": datetime(2025, 1, 1),
+    }
+    item = lean_document(doc, ChatMessage)
+    assert item["message_type"] == "text"
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+from geo import KM_PER_DEGREE_LAT, bounding_box
+from storage import MemoryStore, MongoStore
+from storage.memory import SpatialGrid
+from tests.fakes import FakeDatabase, noop_emit
+from versions import ResourceVersions
+
+
+def emergency(i, user_id, latitude, longitude=-46.6333, is_active=True):
+    return {
+        "id": f"e{i}", "user_id": user_id, "user_name": "Ana", "vehicle_plate": "ABC1234",
+        "latitude": latitude, "longitude": longitude, "created_at": datetime(2025, 9, 22), "is_active": is_active,
+    }
+
+
+def test_spatial_grid_returns_only_nearby_cells():
+    grid = SpatialGrid()
+    grid.add("near", {"latitude": -23.5505, "longitude": -46.6333})
+    grid.add("far", {"latitude": -22.9068, "longitude": -43.1729})
+    assert [doc["latitude"] for doc in grid.near(-23.55, -46.63, 10.0)] == [-23.5505]
+
+    grid.remove("near", {"latitude": -23.5505, "longitude": -46.6333})
+    assert list(grid.near(-23.55, -46.63, 10.0)) == []
+    assert len(grid.cells) == 1
+
+
+def test_memory_and_mongo_stores_return_the_same_shapes():
+    docs = [emergency(1, "u2", -23.5505), emergency(2, "u3", -23.56)]
+    memory = MemoryStore()
+    mongo = MongoStore(FakeDatabase({"emergencies": docs}))
+
+    async def run():
+        for doc in docs:
+            await memory.emergencies.insert(doc)
+        return (
+            await memory.emergencies.find_active_near(-23.55, -46.63, 10.0, 1000),
+            await mongo.emergencies.find_active_near(-23.55, -46.63, 10.0, 1000),
+        )
+
+    from_memory, from_mongo = asyncio.run(run())
+    assert from_memory == from_mongo
+
+
+def test_memory_chat_is_newest_first_within_window():
+    store = MemoryStore()
+    now = datetime.utcnow()
+
+    async def run():
+        for i, age in enumerate([30, 1, 10, 60 * 25]):
+            await store.chat.insert({
+                "id": f"m{i}", "user_id": "u2", "user_name": "Ana", "message": "oi",
+                "latitude": -23.5505, "longitude": -46.6333,
+                "created_at": now - timedelta(minutes=age), "message_type": "text",
+            })
+        return await store.chat.find_recent_near(-23.55, -46.63, 10.0, now - timedelta(hours=24), 2)
+
+    assert [message["id"] for message in asyncio.run(run())] == ["m1", "m2"]
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    monkeypatch.setattr(server, "store", MemoryStore())
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+    monkeypatch.setattr(server.sio, "emit", noop_emit)
+    monkeypatch.setattr(server, "get_password_hash", lambda password: f"hashed:{password}")
+    monkeypatch.setattr(server, "verify_password", lambda password, hashed: hashed == f"hashed:{password}")
+
+
+def test_api_flow_runs_on_the_memory_store(memory_server):
+    async def run():
+        maria = await server.register(server.UserCreate(
+            email="maria@saferide.com", password="123456", name="Maria", vehicle_plate="XYZ5678"))
+        ana = await server.register(server.UserCreate(
+            email="ana@saferide.com", password="123456", name="Ana", vehicle_plate="ABC1234"))
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=maria.access_token)
+        assert (await server.get_current_user(credentials)).id == maria.user.id
+
+        with pytest.raises(HTTPException) as exc:
+            await server.login(server.UserLogin(email="maria@saferide.com", password="wrong"))
+        assert exc.value.status_code == 401
+
+        created = await server.create_emergency(
+            server.EmergencyCreate(latitude=-23.5505, longitude=-46.6333), idempotency_key=None, current_user=ana.user)
+        nearby = await server.get_nearby_emergencies(
+            latitude=-23.55, longitude=-46.63, accept=None, if_none_match=None, current_user=maria.user)
+        active = await server.get_user_active_emergency(Response(), if_none_match=None, current_user=ana.user)
+
+        await server.cancel_user_emergency(current_user=ana.user)
+        after_cancel = await server.get_nearby_emergencies(
+            latitude=-23.55, longitude=-46.63, accept=None, if_none_match=None, current_user=maria.user)
+        return created, nearby, active, after_cancel
+
+    created, nearby, active, after_cancel = asyncio.run(run())
+    assert [item["id"] for item in json.loads(nearby.body)] == [created.id]
+    assert active.id == created.id
+    assert json.loads(after_cancel.body) == []
+
+
+def test_bounding_box_keeps_points_at_the_edge_of_the_radius():
+    # 9.995km due north, inside a 10km alert radius by server.calculate_distance
+    latitude = -23.5505 + 9.995 / KM_PER_DEGREE_LAT
+    assert server.calculate_distance(-23.5505, -46.6333, latitude, -46.6333) < 10.0
+    south, north, west, east = bounding_box(-23.5505, -46.6333, 10.0)
+    assert south <= latitude <= north
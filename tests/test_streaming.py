@@ -0,0 +1,66 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import server
+from server import User
+from storage import MongoStore
+from storage.mongo import iterate
+from tests.fakes import FakeDatabase
+
+USER = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+
+
+def emergency(i, user_id, latitude):
+    return {
+        "id": f"e{i}", "user_id": user_id, "user_name": "Ana", "vehicle_plate": "ABC1234",
+        "latitude": latitude, "longitude": -46.6333,
+        "created_at": datetime(2025, 9, 22) - timedelta(minutes=i), "is_active": True,
+    }
+
+
+def chat_message(i, latitude):
+    return {
+        "id": f"m{i}", "user_id": "u2", "user_name": "Ana", "message": f"msg {i}",
+        "latitude": latitude, "longitude": -46.6333,
+        "created_at": datetime(2025, 9, 22) - timedelta(minutes=i), "message_type": "text",
+    }
+
+
+async def read_ndjson(response):
+    assert response.media_type == "application/x-ndjson"
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_nearby_emergencies_ndjson_matches_json(monkeypatch):
+    docs = [emergency(0, USER.id, -23.5505)]  # own emergency is never listed
+    docs += [emergency(i, "u2", -23.5505 + i * 0.01) for i in range(1, 30)]  # ~1.1km apart
+    db = FakeDatabase({"emergencies": docs})
+    monkeypatch.setattr(server, "store", MongoStore(db))
+
+    async def run():
+        plain = await server.get_nearby_emergencies(
+            latitude=-23.5505, longitude=-46.6333, accept=None, if_none_match=None, current_user=USER)
+        streamed = await server.get_nearby_emergencies(
+            latitude=-23.5505, longitude=-46.6333, accept="application/x-ndjson", if_none_match=None, current_user=USER)
+        return json.loads(plain.body), await read_ndjson(streamed)
+
+    plain, streamed = asyncio.run(run())
+    assert streamed == plain
+    assert [item["id"] for item in streamed] == [f"e{i}" for i in range(1, 9)]
+
+
+def test_nearby_chat_ndjson_stops_at_limit():
+    messages = [chat_message(i, -23.5505) for i in range(20)]
+    db = FakeDatabase({"chat_messages": messages})
+    cursor = db.chat_messages.find()
+
+    async def run():
+        response = server.ndjson_response(server.stream_nearby(
+            iterate(cursor), server.ChatMessage, -23.5505, -46.6333, 10.0, limit=5))
+        return await read_ndjson(response)
+
+    items = asyncio.run(run())
+    assert [item["id"] for item in items] == [f"m{i}" for i in range(5)]
+    assert cursor.closed
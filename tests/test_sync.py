@@ -0,0 +1,81 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from models import User
+from storage import MemoryStore
+from versions import ResourceVersions
+
+MARIA = User(id="u1", email="maria@saferide.com", name="Maria", vehicle_plate="XYZ5678")
+SAO_PAULO = (-23.5505, -46.6333)
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "resource_versions", ResourceVersions())
+
+    async def seed():
+        await store.settings.upsert("u1", {"user_id": "u1", "emergency_contacts": ["+5511999999999"],
+                                           "alert_distance_km": 2.0})
+        for i, (lat, lon) in enumerate([SAO_PAULO, (SAO_PAULO[0] + 0.05, SAO_PAULO[1])]):  # ~0km and ~5.5km
+            await store.emergencies.insert({
+                "id": f"e{i}", "user_id": f"u{i + 2}", "user_name": "Ana", "vehicle_plate": "ABC1234",
+                "latitude": lat, "longitude": lon, "created_at": datetime.utcnow(), "is_active": True,
+            })
+        await store.chat.insert({
+            "id": "m1", "user_id": "u2", "user_name": "Ana", "message": "oi", "latitude": SAO_PAULO[0],
+            "longitude": SAO_PAULO[1], "created_at": datetime.utcnow(), "message_type": "text",
+        })
+        await store.subscriptions.bind_device("u1", {
+            "user_id": "u1", "device_id": "d1", "device_name": "Pixel", "device_brand": "Google",
+            "subscription_type": "premium",
+        })
+        await store.subscriptions.update_subscription("u1", {"expires_at": datetime.utcnow() + timedelta(days=30)})
+
+    asyncio.run(seed())
+    return store
+
+
+def sync(**params):
+    params = {"latitude": None, "longitude": None, "device_id": None, "include": None, "chat_limit": 50,
+              "x_entitlement": None, **params}
+    response = asyncio.run(server.sync_state(current_user=MARIA, **params))
+    return json.loads(response.body)
+
+
+def test_sync_returns_every_section_with_one_settings_read(memory_server, monkeypatch):
+    reads = []
+    get_settings = memory_server.settings.get
+
+    async def counting_get(user_id):
+        reads.append(user_id)
+        return await get_settings(user_id)
+
+    monkeypatch.setattr(memory_server.settings, "get", counting_get)
+
+    body = sync(latitude=SAO_PAULO[0], longitude=SAO_PAULO[1], device_id="d1")
+    assert list(body) == list(server.SYNC_SECTIONS)
+    assert body["settings"]["alert_distance_km"] == 2.0
+    assert body["active_emergency"] is None
+    # The 2km alert radius from settings applies to the nearby sections
+    assert [item["id"] for item in body["emergencies"]] == ["e0"]
+    assert [item["id"] for item in body["chat"]] == ["m1"]
+    assert body["device"]["device_name"] == "Pixel" and body["device"]["entitlement"]
+    assert reads == ["u1"]
+
+
+def test_sync_sections_are_optional(memory_server):
+    assert list(sync()) == ["settings", "active_emergency"]
+    assert list(sync(device_id="d2", include="device")) == ["device"]
+    assert sync(device_id="d2", include="device")["device"] is None
+
+    for params in ({"include": "settings,weather"}, {"include": "chat"}, {"include": "device"}):
+        with pytest.raises(HTTPException) as error:
+            sync(**params)
+        assert error.value.status_code == 400
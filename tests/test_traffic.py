@@ -0,0 +1,65 @@
+import math
+
+from benchmarks.traffic_sim import (
+    CANCEL, CHAT, EMERGENCY, LOCATION, RECORD, SPEED_KMH, read_events, simulate, write_events,
+)
+from geo import calculate_distance
+
+
+def test_a_seed_always_produces_the_same_traffic():
+    assert simulate(5, drivers=100, duration=120) == simulate(5, drivers=100, duration=120)
+    assert simulate(5, drivers=100, duration=120) != simulate(6, drivers=100, duration=120)
+
+
+def test_drivers_report_on_schedule_and_never_faster_than_the_speed_limit():
+    events = simulate(11, drivers=200, duration=300, report_interval=10.0)
+    reports = {}
+    for event in events:
+        if event.kind == LOCATION:
+            reports.setdefault(event.driver, []).append(event)
+    assert len(reports) == 200 and all(len(driver) == 30 for driver in reports.values())
+    for driver in reports.values():
+        for before, after in zip(driver, driver[1:]):
+            hours = (after.at_ms - before.at_ms) / 3_600_000
+            km = calculate_distance(before.latitude, before.longitude, after.latitude, after.longitude)
+            # Straight-line distance never beats driving along the roads
+            assert km <= SPEED_KMH[1] * hours + 0.01
+
+
+def test_incidents_cluster_chat_around_them_and_get_cancelled_by_their_driver():
+    events = simulate(23, drivers=500, duration=900, incidents_per_minute=2.0, chat_per_driver_hour=0.5)
+    emergencies = [event for event in events if event.kind == EMERGENCY]
+    assert len(emergencies) >= 20
+    # A driver has one emergency at a time, and cancels it where it stopped
+    open_emergencies = {}
+    for event in events:
+        if event.kind == EMERGENCY:
+            assert event.driver not in open_emergencies
+            open_emergencies[event.driver] = event
+        elif event.kind == CANCEL:
+            emergency = open_emergencies.pop(event.driver)
+            assert (event.latitude, event.longitude) == (emergency.latitude, emergency.longitude)
+    chats = [event for event in events if event.kind == CHAT]
+    near_incident = [
+        chat for chat in chats
+        if any(0 <= chat.at_ms - emergency.at_ms <= 180_000
+               and calculate_distance(chat.latitude, chat.longitude, emergency.latitude, emergency.longitude) <= 2.0
+               for emergency in emergencies)
+    ]
+    # Background chat alone would put only a few percent there
+    assert len(near_incident) > len(chats) / 2
+
+
+def test_traffic_files_round_trip_compactly(tmp_path):
+    events = simulate(3, drivers=100, duration=120)
+    path = str(tmp_path / "sp.traffic")
+    size = write_events(path, {"seed": 3, "drivers": 100}, events)
+    meta, read = read_events(path)
+    assert meta == {"seed": 3, "drivers": 100}
+    assert size < len(events) * RECORD.size
+    assert [event[:3] for event in read] == [event[:3] for event in events]
+    # Positions are stored as float32, well under a metre off
+    assert all(
+        math.isclose(a.latitude, b.latitude, abs_tol=1e-5) and math.isclose(a.longitude, b.longitude, abs_tol=1e-5)
+        for a, b in zip(read, events)
+    )